@@ -0,0 +1,45 @@
+## ecg_dataset.py
+"""Memory-mapped cache of the MIT-BIH beat CSVs.
+
+Parsing ``mitbih_test.csv`` text on every start is slow and keeps a private
+copy per process. ``load_beats`` converts the CSV once into a float32
+``.npy`` file under ``cache_dir`` and then memory-maps it read-only, so
+startup is a page-table operation and every publisher or simulator process
+on the machine shares the same page cache. The cache is rebuilt whenever
+the CSV is newer than it.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+
+
+def cache_path(csv_path, cache_dir=None) -> Path:
+    return Path(cache_dir or CACHE_DIR) / f"{Path(csv_path).stem}.npy"
+
+
+def build_cache(csv_path, cache_dir=None) -> Path:
+    """Parse the CSV (beat samples + label per row, no header) into the ``.npy`` cache."""
+    path = cache_path(csv_path, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = np.loadtxt(str(csv_path), delimiter=",", dtype=np.float32, ndmin=2)
+    # Written aside and renamed so concurrent readers never map a partial file
+    partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(partial, "wb") as f:
+        np.save(f, data)
+    os.replace(partial, path)
+    return path
+
+
+def load_beats(csv_path, cache_dir=None):
+    """(beats, labels) of a MIT-BIH CSV as read-only views on the memory-mapped cache."""
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"Dataset not found: {csv_path}")
+    path = cache_path(csv_path, cache_dir)
+    if not path.exists() or path.stat().st_mtime < csv_path.stat().st_mtime:
+        build_cache(csv_path, cache_dir)
+    data = np.load(str(path), mmap_mode="r")
+    return data[:, :-1], data[:, -1]
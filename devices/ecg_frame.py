@@ -0,0 +1,119 @@
+## ecg_frame.py
+"""Binary frame codec for the stream/{doctor}/{patient} MQTT topic.
+
+Shared by the Raspberry Pi publisher, the Jetson worker and the Django ingest
+client. A frame is a fixed 24-byte little-endian header followed by the
+samples::
+
+    magic     2s   b"EC"
+    version   B    FRAME_VERSION
+    dtype     B    DTYPE_FLOAT32 | DTYPE_DELTA_INT16
+    seq       I    per-device sequence number
+    ts_ns     q    device timestamp, ns since the epoch
+    count     H    number of samples
+    scale     f    int16 quantisation step (unused for float32)
+    reserved  H    keeps the payload 8-byte aligned
+
+``DTYPE_FLOAT32`` payloads are raw float32 and decode with a zero-copy
+``np.frombuffer``. ``DTYPE_DELTA_INT16`` payloads hold the first quantised
+sample followed by int16 deltas, half the size of float32.
+
+The legacy JSON payload (``{"timestamp": ..., "values": [...]}``) is still
+accepted by ``decode_payload``.
+"""
+import json
+import struct
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+FRAME_MAGIC = b"EC"
+FRAME_VERSION = 1
+DTYPE_FLOAT32 = 1
+DTYPE_DELTA_INT16 = 2
+HEADER = struct.Struct("<2sBBIqHfH")
+
+CODEC_JSON = "json"
+CODEC_FLOAT32 = "float32"
+CODEC_INT16 = "int16"
+CODECS = {CODEC_FLOAT32: DTYPE_FLOAT32, CODEC_INT16: DTYPE_DELTA_INT16}
+
+# Largest quantised magnitude that keeps every delta inside int16
+_INT16_LIMIT = 16383
+
+Frame = namedtuple("Frame", ["values", "seq", "timestamp_ns", "dtype"])
+
+
+class FrameError(ValueError):
+    pass
+
+
+def is_frame(payload) -> bool:
+    return bytes(payload[:2]) == FRAME_MAGIC
+
+
+def encode_frame(values, seq=0, timestamp_ns=None, dtype=DTYPE_FLOAT32) -> bytes:
+    values = np.asarray(values, dtype=np.float32).ravel()
+    if timestamp_ns is None:
+        timestamp_ns = time.time_ns()
+    scale = 0.0
+    if dtype == DTYPE_FLOAT32:
+        body = values.astype("<f4", copy=False).tobytes()
+    elif dtype == DTYPE_DELTA_INT16:
+        peak = float(np.max(np.abs(values))) if values.size else 0.0
+        scale = peak / _INT16_LIMIT if peak else 1.0
+        quantised = np.rint(values / scale).astype(np.int32)
+        body = np.diff(quantised, prepend=0).astype("<i2").tobytes()
+    else:
+        raise FrameError(f"Unsupported frame dtype {dtype}")
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, dtype, seq & 0xFFFFFFFF, timestamp_ns, values.size, scale, 0)
+    return header + body
+
+
+def decode_frame(payload) -> Frame:
+    if len(payload) < HEADER.size:
+        raise FrameError(f"Frame too short ({len(payload)} bytes)")
+    magic, version, dtype, seq, timestamp_ns, count, scale, _ = HEADER.unpack_from(payload)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Not an ECG frame")
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if dtype == DTYPE_FLOAT32:
+        values = np.frombuffer(payload, dtype="<f4", count=count, offset=HEADER.size)
+    elif dtype == DTYPE_DELTA_INT16:
+        deltas = np.frombuffer(payload, dtype="<i2", count=count, offset=HEADER.size)
+        values = (np.cumsum(deltas, dtype=np.int32) * scale).astype(np.float32)
+    else:
+        raise FrameError(f"Unsupported frame dtype {dtype}")
+    return Frame(values, seq, timestamp_ns, dtype)
+
+
+def payload_seq(payload):
+    """Sequence number of a binary frame, or None for a legacy JSON payload."""
+    if not is_frame(payload) or len(payload) < HEADER.size:
+        return None
+    return HEADER.unpack_from(payload)[3]
+
+
+def decode_payload(payload):
+    """Decode a binary frame or legacy JSON payload into (float32 values, ISO timestamp).
+
+    Frame timestamps come back in UTC, like those ``encode_payload`` puts in JSON.
+    """
+    if is_frame(payload):
+        frame = decode_frame(payload)
+        return frame.values, datetime.fromtimestamp(frame.timestamp_ns / 1e9, tz=timezone.utc).isoformat()
+    data = json.loads(bytes(payload).decode())
+    return np.asarray(data.get("values") or [], dtype=np.float32), data.get("timestamp")
+
+
+def encode_payload(values, codec=CODEC_JSON, seq=0):
+    """Encode one beat in the given codec (json, float32 or int16)."""
+    if codec == CODEC_JSON:
+        values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        return json.dumps({"timestamp": datetime.now(timezone.utc).isoformat(), "values": values})
+    if codec not in CODECS:
+        raise FrameError(f"Unknown codec {codec!r}, expected one of {[CODEC_JSON, *CODECS]}")
+    return encode_frame(values, seq=seq, dtype=CODECS[codec])
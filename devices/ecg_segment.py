@@ -0,0 +1,173 @@
+## ecg_segment.py
+"""Online R-peak detection and beat segmentation for continuous ECG.
+
+Devices that publish a continuous 125 Hz signal (raw/{doctor}/{patient})
+instead of ready-made beats are cut into the 187-sample windows the models
+were trained on, the way the MIT-BIH CSVs were produced: the signal is
+normalised to [0, 1] over a trailing window, R-peaks are local maxima above
+``threshold`` of that range, and each beat is the ``1.2 * median RR``
+samples starting at its R-peak, zero-padded to 187.
+
+Shared by the Jetson worker and the Django ingest client. A
+``BeatSegmenter`` keeps one stream's last ``window_s`` seconds in a fixed
+ring buffer and only scans the samples added since the previous ``push``,
+so memory and work per stream stay bounded however long it runs. A beat is
+emitted once the samples after its R-peak have arrived, about one RR
+interval later.
+"""
+from collections import OrderedDict, deque
+
+import numpy as np
+
+SAMPLE_RATE_HZ = 125
+BEAT_LENGTH = 187
+
+
+class BeatSegmenter:
+    """Ring buffer and R-peak detector for one continuous ECG stream.
+
+    ``push`` takes chunks of any size and returns the beats completed so
+    far as a ``(n, beat_length)`` float32 array. A peak must be the largest
+    sample within ``refractory_s`` on either side, so at most one beat is
+    found per refractory period. Nothing is detected before ``warmup_s``
+    seconds of signal have set the normalisation range.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE_HZ, window_s=10.0, threshold=0.6, refractory_s=0.25,
+                 beat_length=BEAT_LENGTH, rr_history=8, default_rr_s=0.8, warmup_s=2.0):
+        self.beat_length = beat_length
+        self.threshold = threshold
+        self.refractory = max(1, int(round(refractory_s * sample_rate)))
+        self.capacity = max(int(window_s * sample_rate), 4 * (beat_length + self.refractory))
+        self.default_rr = default_rr_s * sample_rate
+        self.warmup = int(warmup_s * sample_rate)
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+        self.total = 0          # samples pushed so far, i.e. absolute index of the next one
+        self.scanned = 0        # samples before this absolute index were checked for R-peaks
+        self.last_peak = None
+        self.pending = deque()  # absolute indices of R-peaks waiting for the rest of their beat
+        self.rr = deque(maxlen=rr_history)
+        self.offsets = np.arange(2 * self.refractory + 1)
+
+    def push(self, samples) -> np.ndarray:
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        # Pieces small enough that no pending beat is overwritten before it is cut
+        step = self.capacity // 4
+        beats = []
+        for start in range(0, samples.size, step):
+            piece = samples[start:start + step]
+            self.buffer[(self.total + np.arange(piece.size)) % self.capacity] = piece
+            self.total += piece.size
+            self._detect()
+            beats.append(self._cut())
+        if not beats:
+            return np.zeros((0, self.beat_length), dtype=np.float32)
+        return np.concatenate(beats) if len(beats) > 1 else beats[0]
+
+    def _take(self, start, stop):
+        """Samples [start, stop) by absolute index; must still be in the buffer."""
+        return self.buffer[np.arange(start, stop) % self.capacity]
+
+    def _range(self):
+        valid = self.buffer[:self.total] if self.total < self.capacity else self.buffer
+        return float(valid.min()), float(valid.max())
+
+    def _detect(self):
+        r = self.refractory
+        if self.total < self.warmup:
+            # Wait until the range covers a few beats, not just baseline
+            return
+        # Every candidate needs r samples of history and r samples after it
+        start = max(self.scanned, self.total - self.capacity + r)
+        stop = self.total - r
+        if stop <= start:
+            return
+        self.scanned = stop
+        lo, hi = self._range()
+        if hi - lo <= 1e-6:
+            return
+        segment = self._take(start - r, stop + r)
+        core = segment[r:-r]
+        candidates = np.flatnonzero(core >= lo + self.threshold * (hi - lo))
+        if not candidates.size:
+            return
+        # Row i is segment around candidate i: r samples, the candidate, r samples
+        windows = segment[candidates[:, None] + self.offsets]
+        centre = core[candidates]
+        is_peak = (centre > windows[:, :r].max(axis=1)) & (centre >= windows[:, r + 1:].max(axis=1))
+        for peak in (start + candidates[is_peak]).tolist():
+            if self.last_peak is not None:
+                self.rr.append(peak - self.last_peak)
+            self.last_peak = peak
+            self.pending.append(peak)
+
+    def _cut(self) -> np.ndarray:
+        rr = np.median(self.rr) if self.rr else self.default_rr
+        length = min(self.beat_length, int(round(1.2 * rr)))
+        peaks = []
+        while self.pending and self.pending[0] + length <= self.total:
+            peak = self.pending.popleft()
+            if peak >= self.total - self.capacity:
+                peaks.append(peak)
+        beats = np.zeros((len(peaks), self.beat_length), dtype=np.float32)
+        if peaks:
+            lo, hi = self._range()
+            windows = self.buffer[(np.asarray(peaks)[:, None] + np.arange(length)) % self.capacity]
+            beats[:, :length] = np.clip((windows - lo) / max(hi - lo, 1e-6), 0.0, 1.0)
+        return beats
+
+
+class SegmenterPool:
+    """One ``BeatSegmenter`` per stream key (e.g. doctor/patient).
+
+    At most ``max_streams`` segmenters are kept; pushing to a new key beyond
+    that evicts the least recently used one. ``evicted`` counts every such
+    eviction, ``resets`` only those of streams that were still live: an
+    evicted key pushed to again restarts from scratch (warm-up, RR history)
+    and loses the beat in progress, which means ``max_streams`` is too low.
+    Call ``drop`` when a stream ends (e.g. its recording stops) so it is
+    neither evicted nor counted. Not thread-safe: push each stream's chunks
+    from one thread, in order.
+    """
+
+    def __init__(self, max_streams=1024, **options):
+        self.max_streams = max(1, max_streams)
+        self.options = options
+        self.segmenters = OrderedDict()
+        # Keys evicted while possibly still live, oldest first, bounded like the pool
+        self.evicted = OrderedDict()
+        self.counters = {
+            "samples": 0,
+            "beats": 0,
+            "evicted": 0,
+            "resets": 0,
+        }
+
+    def push(self, key, samples) -> np.ndarray:
+        segmenter = self.segmenters.get(key)
+        if segmenter is None:
+            if self.evicted.pop(key, False):
+                self.counters["resets"] += 1
+            if len(self.segmenters) >= self.max_streams:
+                evicted, _ = self.segmenters.popitem(last=False)
+                self.counters["evicted"] += 1
+                self.evicted[evicted] = True
+                if len(self.evicted) > self.max_streams:
+                    self.evicted.popitem(last=False)
+            segmenter = self.segmenters[key] = BeatSegmenter(**self.options)
+        else:
+            self.segmenters.move_to_end(key)
+        beats = segmenter.push(samples)
+        self.counters["samples"] += int(np.size(samples))
+        self.counters["beats"] += len(beats)
+        return beats
+
+    def drop(self, key):
+        self.segmenters.pop(key, None)
+        self.evicted.pop(key, None)
+
+    def __len__(self):
+        return len(self.segmenters)
+
+    def stats(self):
+        return dict(self.counters, streams=len(self.segmenters))
@@ -0,0 +1,159 @@
+## benchmark.py
+"""Latency and throughput benchmark for ECGTFLiteModel.
+
+Sweeps model files x interpreter threads x batch sizes and prints one JSON
+report. Every combination runs in a freshly spawned process, so load time
+and peak RSS are measured from a cold start and do not leak between runs::
+
+    python benchmark.py --batch-sizes 1,4,16,64 --threads 1,2,4 --output bench.json
+
+Each run builds the model with a single bucket equal to the batch size (no
+padding), times loading and the first invoke, does ``--warmup`` untimed
+calls, then ``--iterations`` timed ``predict_proba`` calls.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+import numpy as np
+from loguru import logger
+
+# ENV + CONFIG
+JETSON_DIR = Path(__file__).resolve().parent
+REPO_DIR = JETSON_DIR.parents[1]
+DEFAULT_MODELS = [
+    JETSON_DIR / "models" / "1dcnn.tflite",
+    REPO_DIR / "notebooks" / "2-rnn" / "research_output" / "optimized_model.tflite",
+]
+DEFAULT_BATCH_SIZES = "1,4,16,64"
+DEFAULT_THREADS = "1,2,4"
+
+
+def percentiles(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+
+def run_config(model_path, num_threads, batch_size, iterations, warmup, seed):
+    """Benchmark one (model, threads, batch size); runs inside a spawned process."""
+    started = time.perf_counter()
+    # ECGTFLiteModel pprints its tensor details; keep stdout for the report
+    with redirect_stdout(sys.stderr):
+        from tflite_model import ECGTFLiteModel
+        imported = time.perf_counter()
+        model = ECGTFLiteModel(model_path, buckets=(batch_size,), num_threads=num_threads, num_interpreters=1)
+    loaded = time.perf_counter()
+
+    input_shape = (batch_size,) + tuple(int(dim) for dim in model.input_details[0]["shape"][1:])
+    batch = np.random.default_rng(seed).random(input_shape, dtype=np.float32)
+
+    model.predict_proba(batch)
+    first_inference = time.perf_counter()
+    for _ in range(warmup):
+        model.predict_proba(batch)
+    warmed_up = time.perf_counter()
+
+    timings = []
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        model.predict_proba(batch)
+        timings.append((time.perf_counter() - call_started) * 1000)
+
+    return {
+        "model": Path(model_path).name,
+        "model_path": str(model_path),
+        "model_bytes": Path(model_path).stat().st_size,
+        "input_dtype": str(np.dtype(model.input_details[0]["dtype"])),
+        "threads": num_threads,
+        "batch_size": batch_size,
+        "iterations": iterations,
+        "import_s": imported - started,
+        "load_s": loaded - imported,
+        "first_inference_ms": (first_inference - loaded) * 1000,
+        "warmup_s": warmed_up - started,
+        "latency_ms": percentiles(timings),
+        "beats_per_sec": batch_size * iterations / (sum(timings) / 1000),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def parse_ints(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ECGTFLiteModel latency and throughput")
+    parser.add_argument("--models", nargs="+", type=Path, default=None,
+                        help="TFLite files (default: the Jetson 1D-CNN and the optimized RNN)")
+    parser.add_argument("--batch-sizes", type=parse_ints, default=parse_ints(DEFAULT_BATCH_SIZES))
+    parser.add_argument("--threads", type=parse_ints, default=parse_ints(DEFAULT_THREADS),
+                        help="Interpreter num_threads values")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per run")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed calls before timing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    models = args.models or [path for path in DEFAULT_MODELS if path.exists()]
+    if not models:
+        parser.error("no model files found, pass --models")
+
+    report = {
+        "host": {
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": multiprocessing.cpu_count(),
+        },
+        "results": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for model_path in models:
+        for num_threads in args.threads:
+            for batch_size in args.batch_sizes:
+                logger.info(f"Benchmarking {model_path.name} | threads={num_threads} batch={batch_size}")
+                try:
+                    with context.Pool(1) as pool:
+                        result = pool.apply(
+                            run_config,
+                            (model_path, num_threads, batch_size, args.iterations, args.warmup, args.seed),
+                        )
+                except Exception as e:
+                    logger.error(f"{model_path.name} threads={num_threads} batch={batch_size} failed: {e}")
+                    result = {
+                        "model": model_path.name,
+                        "model_path": str(model_path),
+                        "threads": num_threads,
+                        "batch_size": batch_size,
+                        "error": str(e),
+                    }
+                else:
+                    logger.success(
+                        "{} | threads={} batch={} p50={:.2f}ms p99={:.2f}ms {:.0f} beats/s rss={:.0f}MB",
+                        result["model"], num_threads, batch_size, result["latency_ms"]["p50"],
+                        result["latency_ms"]["p99"], result["beats_per_sec"], result["peak_rss_mb"],
+                    )
+                report["results"].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+## ingest_queue.py
+import threading
+import time
+from collections import deque, namedtuple
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DOWNSAMPLE = "downsample"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DOWNSAMPLE)
+
+IngestItem = namedtuple("IngestItem", ["key", "topic", "payload", "received_at"])
+
+
+class IngestQueue:
+    """Bounded hand-off between the MQTT network thread and the inference threads.
+
+    ``put`` never blocks, so paho's loop keeps servicing keepalives and acks no
+    matter how far inference falls behind. What happens when the queue is full
+    depends on ``policy``:
+
+    * ``drop_oldest``: evict the oldest queued message to make room.
+    * ``drop_newest``: reject the incoming message.
+    * ``downsample``: while the queue is above half full, keep only every
+      ``downsample_factor``-th message of each patient (``key``); a message
+      that is kept evicts the oldest one if there is still no room.
+
+    ``get_batch`` hands consumers up to ``max_items`` messages, waiting at most
+    ``max_wait`` seconds after the first one arrives so they can be classified
+    in one batch.
+    """
+
+    def __init__(self, maxsize=1024, policy=DROP_OLDEST, downsample_factor=2):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.downsample_factor = max(1, downsample_factor)
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.seen_per_key = {}
+        self.counters = {
+            "received": 0,
+            "enqueued": 0,
+            "dropped_oldest": 0,
+            "dropped_newest": 0,
+            "downsampled": 0,
+            "max_depth": 0,
+        }
+
+    def put(self, key, topic, payload) -> bool:
+        """Queue a message; returns False if it was dropped."""
+        with self.cond:
+            self.counters["received"] += 1
+            if self.policy == DOWNSAMPLE and len(self.items) >= self.maxsize // 2:
+                seen = self.seen_per_key.get(key, 0)
+                self.seen_per_key[key] = seen + 1
+                if seen % self.downsample_factor:
+                    self.counters["downsampled"] += 1
+                    return False
+            elif self.seen_per_key:
+                self.seen_per_key.clear()
+
+            if len(self.items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.counters["dropped_newest"] += 1
+                    return False
+                self.items.popleft()
+                self.counters["dropped_oldest"] += 1
+
+            self.items.append(IngestItem(key, topic, payload, time.monotonic()))
+            self.counters["enqueued"] += 1
+            self.counters["max_depth"] = max(self.counters["max_depth"], len(self.items))
+            self.cond.notify()
+            return True
+
+    def get_batch(self, max_items=1, max_wait=0.0):
+        """Block until a batch is due; returns an empty list once closed and drained."""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait()
+            deadline = time.monotonic() + max_wait
+            while len(self.items) < max_items and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return [self.items.popleft() for _ in range(min(max_items, len(self.items)))]
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return dict(self.counters, depth=len(self.items))
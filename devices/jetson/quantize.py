@@ -0,0 +1,214 @@
+## quantize.py
+"""Post-training quantisation of an ECG classifier, gated on per-class recall.
+
+Converts a Keras model (``.keras`` / ``.h5``) or SavedModel directory, e.g.
+``notebooks/2-rnn/research_output/baseline_rnn`` or an ``mlartifacts/`` run,
+into TFLite variants:
+
+* ``float``    reference conversion, only written with ``--keep-float``
+* ``dynamic``  dynamic-range: int8 weights, float activations
+* ``int8``     full integer: int8 weights, activations and input/output,
+               calibrated on a class-balanced sample of the training CSV
+
+Every variant is evaluated with ``ECGTFLiteModel`` on the test CSV. A
+quantised variant is only written if no class loses more than
+``--max-recall-drop`` recall against the float conversion, and a variant
+that fails to convert is refused with its error. The JSON report is always
+written, and the exit status is 1 if any variant was refused::
+
+    python quantize.py notebooks/2-rnn/research_output/baseline_rnn \\
+        --train-csv data/mitbih_train.csv --name rnn
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+from loguru import logger
+from tflite_model import ECGTFLiteModel, CLASS_NAMES
+
+# ENV + CONFIG
+JETSON_DIR = Path(__file__).resolve().parent
+BASE_DIR = JETSON_DIR.parent
+REPO_DIR = BASE_DIR.parent
+DEFAULT_TRAIN_CSVS = [REPO_DIR / "data" / "mitbih_train.csv", BASE_DIR / "mitbih_train.csv"]
+DEFAULT_TEST_CSVS = [REPO_DIR / "data" / "mitbih_test.csv", BASE_DIR / "mitbih_test.csv"]
+VARIANTS = ("float", "dynamic", "int8")
+INPUT_LENGTH = 187
+
+
+def load_csv(path):
+    """MIT-BIH CSV (187 samples + label per row) -> (float32 beats, int labels)."""
+    data = np.loadtxt(str(path), delimiter=",", dtype=np.float32, ndmin=2)
+    return data[:, :INPUT_LENGTH], data[:, -1].astype(np.int64)
+
+
+def first_existing(paths):
+    for path in paths:
+        if path.exists():
+            return path
+    return None
+
+
+def balanced_sample(labels, size, seed):
+    """Indices of up to ``size`` rows, spread evenly over the classes present."""
+    rng = np.random.default_rng(seed)
+    classes = np.unique(labels)
+    per_class = max(1, size // len(classes))
+    picked = [
+        rng.choice(np.flatnonzero(labels == label), min(per_class, int(np.sum(labels == label))), replace=False)
+        for label in classes
+    ]
+    return rng.permutation(np.concatenate(picked))
+
+
+def make_converter(model_path: Path, select_tf_ops: bool):
+    if model_path.is_dir():
+        converter = tf.lite.TFLiteConverter.from_saved_model(str(model_path))
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(str(model_path)))
+    if select_tf_ops:
+        # Recurrent models need TF ops (see notebooks/2-rnn)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        converter._experimental_lower_tensor_list_ops = False
+    return converter
+
+
+def convert(model_path: Path, variant: str, calibration: np.ndarray, select_tf_ops: bool) -> bytes:
+    converter = make_converter(model_path, select_tf_ops)
+    if variant == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif variant == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([beat.reshape(1, INPUT_LENGTH, 1)] for beat in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if select_tf_ops:
+            converter.target_spec.supported_ops.append(tf.lite.OpsSet.SELECT_TF_OPS)
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def evaluate(tflite_path: Path, beats: np.ndarray, labels: np.ndarray, num_classes: int):
+    model = ECGTFLiteModel(tflite_path, class_names=CLASS_NAMES[:num_classes])
+    started = time.perf_counter()
+    predicted = np.argmax(model.predict_proba(beats.reshape(-1, INPUT_LENGTH, 1)), axis=1)
+    elapsed = time.perf_counter() - started
+    recall = {}
+    for label in range(num_classes):
+        mask = labels == label
+        recall[CLASS_NAMES[label]] = float(np.mean(predicted[mask] == label)) if mask.any() else None
+    return {
+        "accuracy": float(np.mean(predicted == labels)),
+        "recall": recall,
+        "beats_per_sec": len(beats) / elapsed,
+        "bytes": tflite_path.stat().st_size,
+    }
+
+
+def recall_regressions(reference, candidate, max_drop):
+    """Classes whose recall dropped by more than ``max_drop``: {class: (float, quantised)}."""
+    return {
+        name: (ref, candidate[name])
+        for name, ref in reference.items()
+        if ref is not None and candidate[name] is not None and ref - candidate[name] > max_drop
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantise an ECG classifier to TFLite with a recall gate")
+    parser.add_argument("model", type=Path, help="SavedModel directory or .keras/.h5 file")
+    parser.add_argument("--name", help="Output file prefix (default: model file/directory name)")
+    parser.add_argument("--output-dir", type=Path, default=JETSON_DIR / "models")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS[1:], default=list(VARIANTS[1:]))
+    parser.add_argument("--train-csv", type=Path, default=first_existing(DEFAULT_TRAIN_CSVS),
+                        help="Calibration data for the int8 variant")
+    parser.add_argument("--test-csv", type=Path, default=first_existing(DEFAULT_TEST_CSVS))
+    parser.add_argument("--calibration-samples", type=int, default=500)
+    parser.add_argument("--eval-samples", type=int, default=0, help="Evaluate on a sample of the test CSV (0 = all)")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02,
+                        help="Largest allowed per-class recall loss against the float model")
+    parser.add_argument("--select-tf-ops", action="store_true", help="Allow TF ops (recurrent models)")
+    parser.add_argument("--keep-float", action="store_true", help="Also write the float conversion")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.test_csv is None or not args.test_csv.exists():
+        parser.error("test CSV not found, pass --test-csv")
+    if "int8" in args.variants and (args.train_csv is None or not args.train_csv.exists()):
+        parser.error("int8 needs calibration data, pass --train-csv")
+    name = args.name or args.model.stem
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    test_beats, test_labels = load_csv(args.test_csv)
+    if args.eval_samples:
+        keep = np.random.default_rng(args.seed).permutation(len(test_labels))[:args.eval_samples]
+        test_beats, test_labels = test_beats[keep], test_labels[keep]
+    num_classes = int(test_labels.max()) + 1
+    calibration = np.empty((0, INPUT_LENGTH), dtype=np.float32)
+    if "int8" in args.variants:
+        train_beats, train_labels = load_csv(args.train_csv)
+        calibration = train_beats[balanced_sample(train_labels, args.calibration_samples, args.seed)]
+    logger.info(f"Test beats: {len(test_labels)} | calibration beats: {len(calibration)}")
+
+    report = {
+        "model": str(args.model),
+        "test_csv": str(args.test_csv),
+        "max_recall_drop": args.max_recall_drop,
+        "variants": {},
+    }
+    refused = []
+    reference = None
+    for variant in ("float",) + tuple(args.variants):
+        destination = args.output_dir / f"{name}_{variant}.tflite"
+        candidate = destination.with_suffix(".tflite.candidate")
+        if reference is None and variant != "float":
+            report["variants"][variant] = {"accepted": False, "error": "float conversion failed, nothing to compare with"}
+            refused.append(variant)
+            continue
+        logger.info(f"Converting {variant} variant")
+        try:
+            candidate.write_bytes(convert(args.model, variant, calibration, args.select_tf_ops))
+            metrics = evaluate(candidate, test_beats, test_labels, num_classes)
+        except Exception as e:
+            # e.g. ops the int8 converter cannot quantise: refuse this variant, keep going
+            logger.exception(f"Refusing {variant}: conversion failed: {e}")
+            if candidate.exists():
+                candidate.unlink()
+            report["variants"][variant] = {"accepted": False, "error": str(e)}
+            refused.append(variant)
+            continue
+
+        if variant == "float":
+            reference = metrics
+            accepted = args.keep_float
+        else:
+            regressions = recall_regressions(reference["recall"], metrics["recall"], args.max_recall_drop)
+            metrics["recall_regressions"] = regressions
+            metrics["speedup"] = metrics["beats_per_sec"] / reference["beats_per_sec"]
+            accepted = not regressions
+            if regressions:
+                refused.append(variant)
+                logger.error(f"Refusing {variant}: recall regressed for {sorted(regressions)}")
+
+        if accepted:
+            candidate.replace(destination)
+            metrics["path"] = str(destination)
+            logger.success(
+                f"{variant}: accuracy={metrics['accuracy']:.4f} size={metrics['bytes'] / 1024:.1f}KiB -> {destination}"
+            )
+        else:
+            candidate.unlink()
+        metrics["accepted"] = accepted
+        report["variants"][variant] = metrics
+
+    report_path = args.output_dir / f"{name}_quantization.json"
+    report_path.write_text(json.dumps(report, indent=2) + "\n")
+    logger.info(f"Report written to {report_path}")
+    return 1 if refused else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
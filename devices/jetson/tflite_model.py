@@ -2,6 +2,8 @@
 import tensorflow as tf
 from pathlib import Path
 import numpy as np
+import os
+import queue
 import time
 from loguru import logger
 from pprint import pprint
@@ -12,45 +14,124 @@ model_path = BASE_DIR / "models" / "1dcnn.tflite"
 logger.debug(f"Given model path at : {model_path}")
 
 CLASS_NAMES = ['N (0) - Normal','S (1) - SVEB','V (2) - VEB','F (3) - Fusion','Q (4) - Unknown']
+BATCH_BUCKETS = (1, 4, 16, 64)
+NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", 1))
+NUM_INTERPRETERS = int(os.getenv("TFLITE_NUM_INTERPRETERS", 1))
 
 class ECGTFLiteModel:
+    """TFLite classifier backed by pre-allocated interpreters.
 
-    def __init__(self, model_path: Path, class_names=CLASS_NAMES):
+    Every interpreter "slot" holds one interpreter per batch bucket, each
+    allocated once at start-up. Inputs are zero-padded up to the nearest bucket
+    (batches larger than the biggest bucket are split), so ``predict`` never
+    resizes or re-allocates tensors. ``num_interpreters`` slots let that many
+    threads call ``predict`` concurrently.
+
+    Full-integer models (int8/uint8 input or output tensors, see
+    quantize.py) take and return the same float values: inputs are quantised
+    with the input tensor's scale/zero point and outputs dequantised.
+    """
+
+    def __init__(self, model_path: Path, class_names=CLASS_NAMES, buckets=BATCH_BUCKETS,
+                 num_threads=NUM_THREADS, num_interpreters=NUM_INTERPRETERS):
         self.class_names = class_names
-        self.interpreter = tf.lite.Interpreter(model_path=str(model_path))
-        self.interpreter.allocate_tensors()
-       
-        # Cache tensor details ONCE
-        self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
+        self.model_path = Path(model_path)
+        self.buckets = tuple(sorted(set(buckets)))
+        self.num_threads = num_threads
+
+        # Each slot maps bucket size -> allocated interpreter
+        self.slots = queue.Queue()
+        slots = [
+            {bucket: self._build_interpreter(bucket) for bucket in self.buckets}
+            for _ in range(max(1, num_interpreters))
+        ]
+
+        # Cache tensor details ONCE (identical across slots apart from the batch dim)
+        sample = slots[0][self.buckets[0]]
+        self.input_details = sample.get_input_details()
+        self.output_details = sample.get_output_details()
 
         self.input_index = self.input_details[0]["index"]
         self.output_index = self.output_details[0]["index"]
+        self.input_dtype = np.dtype(self.input_details[0]["dtype"])
+        self.output_dtype = np.dtype(self.output_details[0]["dtype"])
+        self.input_quantization = self.input_details[0]["quantization"]
+        self.output_quantization = self.output_details[0]["quantization"]
+        for slot in slots:
+            self.slots.put(slot)
 
-        self.current_batch_size = None
-        logger.success("TFLite model loaded and ready")
+        logger.success(
+            f"TFLite model loaded and ready | buckets={self.buckets} "
+            f"threads={num_threads} interpreters={num_interpreters}"
+        )
         logger.info("Input Details:")
         pprint(self.input_details)
         logger.info("Output Details:")
         pprint(self.output_details)
 
-    def predict(self, input_array: np.ndarray):
-        """input_array shape: (batch, 187, 1)"""
-        # Ensure float32
-        input_array = input_array.astype(np.float32)
-        batch_size = input_array.shape[0]
+    def _build_interpreter(self, batch_size: int):
+        interpreter = tf.lite.Interpreter(model_path=str(self.model_path), num_threads=self.num_threads)
+        input_detail = interpreter.get_input_details()[0]
+        shape = list(input_detail["shape"])
+        if shape[0] != batch_size:
+            shape[0] = batch_size
+            interpreter.resize_tensor_input(input_detail["index"], shape)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def bucket_for(self, batch_size: int) -> int:
+        """Smallest bucket that fits ``batch_size`` (the largest bucket if none does)."""
+        for bucket in self.buckets:
+            if batch_size <= bucket:
+                return bucket
+        return self.buckets[-1]
 
-        # Resize ONLY if batch size changed
-        if batch_size != self.current_batch_size:
-            self.interpreter.resize_tensor_input(self.input_index, input_array.shape)
-            self.interpreter.allocate_tensors()
-            self.current_batch_size = batch_size
+    def _invoke(self, interpreters, chunk: np.ndarray) -> np.ndarray:
+        n = chunk.shape[0]
+        bucket = self.bucket_for(n)
+        if n < bucket:
+            padded = np.zeros((bucket,) + chunk.shape[1:], dtype=np.float32)
+            padded[:n] = chunk
+            chunk = padded
+        interpreter = interpreters[bucket]
+        interpreter.set_tensor(self.input_index, self._quantize(chunk))
+        interpreter.invoke()
+        return self._dequantize(interpreter.get_tensor(self.output_index)[:n])
 
-        # Run inference
-        self.interpreter.set_tensor(self.input_index, input_array)
-        self.interpreter.invoke()
+    def _quantize(self, values: np.ndarray) -> np.ndarray:
+        if self.input_dtype.kind not in "iu":
+            return values
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        return np.clip(np.round(values / scale) + zero_point, info.min, info.max).astype(self.input_dtype)
 
-        predictions = self.interpreter.get_tensor(self.output_index)
+    def _dequantize(self, values: np.ndarray) -> np.ndarray:
+        if self.output_dtype.kind not in "iu":
+            return values
+        scale, zero_point = self.output_quantization
+        return (values.astype(np.float32) - zero_point) * scale
+
+    def predict_proba(self, input_array: np.ndarray) -> np.ndarray:
+        """input_array shape: (batch, 187, 1) -> (batch, n_classes) probabilities"""
+        # Ensure float32
+        input_array = np.ascontiguousarray(input_array, dtype=np.float32)
+        if input_array.shape[0] == 0:
+            return np.zeros((0, len(self.class_names)), dtype=np.float32)
+        max_bucket = self.buckets[-1]
+
+        interpreters = self.slots.get()
+        try:
+            outputs = [
+                self._invoke(interpreters, input_array[start:start + max_bucket])
+                for start in range(0, input_array.shape[0], max_bucket)
+            ]
+        finally:
+            self.slots.put(interpreters)
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+    def predict(self, input_array: np.ndarray):
+        """input_array shape: (batch, 187, 1)"""
+        predictions = self.predict_proba(input_array)
 
         predicted_indices = np.argmax(predictions, axis=1)
         predicted_classes = [self.class_names[i] for i in predicted_indices]
@@ -61,7 +142,7 @@ class ECGTFLiteModel:
 if __name__ == "__main__":
 
     model =  ECGTFLiteModel(model_path, CLASS_NAMES)
-   
+
     batch_size:int = 4
     dummy_input = np.random.rand(batch_size, 187, 1)
     classes, confidences = model.predict(dummy_input)
@@ -3,31 +3,58 @@ import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 import json
 import os
+import sys
 import time
+import threading
 from datetime import datetime
 import numpy as np
 from loguru import logger
 from dotenv import load_dotenv
 from pathlib import Path
 from tflite_model import ECGTFLiteModel
+from ingest_queue import IngestQueue, DROP_OLDEST
 # ENV + CONFIG
 BASE_DIR = Path(__file__).resolve().parents[1]
 logger.debug(f"Using base dir : {BASE_DIR}")
 load_dotenv(BASE_DIR / ".env")
+sys.path.append(str(BASE_DIR))
+from ecg_frame import decode_payload, payload_seq
+from ecg_segment import SegmenterPool
 
 MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 8883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 
+# INGEST + BATCHING (BATCH_MAX_BEATS=1 keeps one invoke per message)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 1024))
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", DROP_OLDEST)
+INGEST_DOWNSAMPLE_FACTOR = int(os.getenv("INGEST_DOWNSAMPLE_FACTOR", 2))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 1))
+BATCH_MAX_BEATS = int(os.getenv("BATCH_MAX_BEATS", 1))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 20))
+STATS_INTERVAL_S = float(os.getenv("STATS_INTERVAL_S", 30))
+# Continuous raw/ signals are cut into beats per patient, for at most this many patients
+SEGMENTER_MAX_STREAMS = int(os.getenv("SEGMENTER_MAX_STREAMS", 1024))
+# Heartbeats tell the server an edge worker is classifying, so its
+# fallback (manage.py run_inference) stays idle
+WORKER_ID = os.getenv("WORKER_ID", "jetson-nano-worker")
+HEARTBEAT_INTERVAL_S = float(os.getenv("HEARTBEAT_INTERVAL_S", 10))
+
 # MQTT TOPICS
 ECG_STREAM_TOPIC = "stream/+/+"
+RAW_STREAM_TOPIC = "raw/+/+"
+COMMAND_TOPIC = "commands/+/+"
+RAW_TOPIC_FMT = "raw/{doctor_id}/{patient_id}"
+STREAM_TOPIC_FMT = "stream/{doctor_id}/{patient_id}"
 PREDICTION_TOPIC_FMT = "prediction/{doctor_id}/{patient_id}"
+DEVICE_HEARTBEAT_TOPIC = "devices/heartbeat"
 INPUT_LENGTH = 187
 MODEL_PATH = Path(__file__).resolve().parent / "models" / "1dcnn.tflite"
 
 # MODEL (LOAD ONCE)
-MODEL = ECGTFLiteModel(MODEL_PATH)
+MODEL = ECGTFLiteModel(MODEL_PATH, num_interpreters=INFERENCE_THREADS)
+SEGMENTERS = SegmenterPool(max_streams=SEGMENTER_MAX_STREAMS)
    
 # INFERENCE
 def run_model(values):
@@ -36,12 +63,117 @@ def run_model(values):
     classes, confidences = MODEL.predict(input_vector)
     return classes, confidences.tolist()
 
+def publish_prediction(client, doctor_id, patient_id, prediction, confidence, timestamp, seq=None):
+    out = {
+        "prediction": prediction,
+        "confidence": confidence,
+        "timestamp": timestamp,
+        "processed_at": datetime.utcnow().isoformat(),
+    }
+    if seq is not None:
+        # The server moves the session's inference cursor up to the beats of this frame
+        out["seq"] = seq
+    pred_topic = PREDICTION_TOPIC_FMT.format(doctor_id=doctor_id,patient_id=patient_id)
+    client.publish(pred_topic, json.dumps(out), qos=1)
+    logger.success(f"PREDICTED | D:{doctor_id} P:{patient_id} → {prediction} ({confidence})")
+
+def send_heartbeat(client):
+    payload = {"device_id": WORKER_ID, "role": "inference"}
+    client.publish(DEVICE_HEARTBEAT_TOPIC, json.dumps(payload))
+    logger.debug(f"Heartbeat sent: {WORKER_ID}")
+
+def decode_beats(payload):
+    """Parse a stream/ payload (binary frame, JSON or segmented beats) into ((n, INPUT_LENGTH) values, timestamp, seq)."""
+    if isinstance(payload, tuple):
+        values, timestamp, seq = payload
+    else:
+        (values, timestamp), seq = decode_payload(payload), payload_seq(payload)
+    return values.reshape(-1, INPUT_LENGTH), timestamp, seq
+
+def segment_raw(topic, payload):
+    """Cut a raw/ chunk into beats; returns the stream/ topic and payload to queue, or None."""
+    samples, timestamp = decode_payload(payload)
+    beats = SEGMENTERS.push(topic, samples)
+    if not len(beats):
+        return None
+    _, doctor_id, patient_id = topic.split("/")
+    return STREAM_TOPIC_FMT.format(doctor_id=doctor_id, patient_id=patient_id), (beats, timestamp, payload_seq(payload))
+
+# BATCHING
+class BeatBatcher:
+    """Collects beats from queued stream/ messages of any patient into one predict call.
+
+    ``add`` decodes a message and buffers its beats; ``flush`` classifies
+    everything buffered with a single ``run_model`` call and publishes each
+    message's share of the results to its own prediction/{doctor}/{patient}
+    topic. ``add`` flushes by itself once ``max_beats`` beats are buffered,
+    so a batch of multi-beat messages never becomes one oversized call.
+    Each inference thread owns one batcher.
+    """
+
+    def __init__(self, client, max_beats=BATCH_MAX_BEATS):
+        self.client = client
+        self.max_beats = max(1, max_beats)
+        self.beats = []
+        self.messages = []  # (doctor_id, patient_id, timestamp, seq, beat count)
+        self.pending = 0
+
+    def add(self, item):
+        try:
+            values, timestamp, seq = decode_beats(item.payload)
+        except Exception as e:
+            logger.warning(f"Malformed ECG payload on {item.topic}: {e}")
+            return
+        if not len(values):
+            logger.warning("Empty ECG payload received")
+            return
+        # stream/{doctor}/{patient}
+        _, doctor_id, patient_id = item.topic.split("/")
+        self.beats.append(values)
+        self.messages.append((doctor_id, patient_id, timestamp, seq, len(values)))
+        self.pending += len(values)
+        if self.pending >= self.max_beats:
+            self.flush()
+
+    def flush(self):
+        beats, messages = self.beats, self.messages
+        self.beats, self.messages, self.pending = [], [], 0
+        if not beats:
+            return
+        predictions, confidences = run_model(np.concatenate(beats))
+        logger.debug(f"Batched inference over {len(predictions)} beats from {len(messages)} messages")
+        offset = 0
+        for doctor_id, patient_id, timestamp, seq, count in messages:
+            publish_prediction(
+                self.client, doctor_id, patient_id,
+                predictions[offset:offset + count], confidences[offset:offset + count], timestamp, seq,
+            )
+            offset += count
+
+# INFERENCE THREADS
+def inference_loop(client, ingest):
+    """Pull batches off the ingest queue, classify them together, publish per patient."""
+    batcher = BeatBatcher(client)
+    while True:
+        batch = ingest.get_batch(BATCH_MAX_BEATS, BATCH_MAX_WAIT_MS / 1000.0)
+        if not batch:
+            if ingest.closed:
+                return
+            continue
+        try:
+            for item in batch:
+                batcher.add(item)
+            batcher.flush()
+        except Exception as e:
+            logger.exception(f"Error processing ECG batch: {e}")
+
 # MQTT CALLBACKS
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         logger.success("Jetson connected to MQTT broker")
-        client.subscribe(ECG_STREAM_TOPIC, qos=1)
-        logger.info(f"Subscribed to {ECG_STREAM_TOPIC}")
+        client.subscribe([(ECG_STREAM_TOPIC, 1), (RAW_STREAM_TOPIC, 1), (COMMAND_TOPIC, 1)])
+        logger.info(f"Subscribed to {ECG_STREAM_TOPIC}, {RAW_STREAM_TOPIC} and {COMMAND_TOPIC}")
+        send_heartbeat(client)
     else:
         logger.error(f"MQTT connection failed | rc={rc}")
 
@@ -49,51 +181,69 @@ def on_disconnect(client, userdata, rc, properties=None):
     logger.warning("Jetson disconnected from MQTT broker")
 
 def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode())
-        topic = msg.topic
-        # stream/{doctor}/{patient}
-        _, doctor_id, patient_id = topic.split("/")
-
-        values = payload.get("values")
-        timestamp = payload.get("timestamp")
-        if not values:
-            logger.warning("Empty ECG payload received")
+    # Runs on paho's network thread: only hand the raw message off, never block here
+    ingest = userdata["ingest"]
+    topic, payload = msg.topic, msg.payload
+    if topic.startswith("commands/"):
+        # A recording starts or stops: the patient's next raw/ chunk begins a new signal
+        if payload.decode(errors="replace").strip() in ("start", "stop"):
+            _, doctor_id, patient_id = topic.split("/")
+            SEGMENTERS.drop(RAW_TOPIC_FMT.format(doctor_id=doctor_id, patient_id=patient_id))
+        return
+    if topic.startswith("raw/"):
+        # Segmenting is a few vectorised ops per chunk; doing it here keeps
+        # each patient's chunks in order whatever INFERENCE_THREADS is
+        try:
+            segmented = segment_raw(topic, payload)
+        except Exception as e:
+            logger.warning(f"Malformed raw ECG payload on {topic}: {e}")
+            return
+        if segmented is None:
             return
-        logger.debug(f"Recieved values of length  : {len(values)}")
-        prediction, confidence = run_model(np.array(values))
-
-        out = {
-            "prediction": prediction,
-            "confidence": confidence,
-            "timestamp": timestamp,
-            "processed_at": datetime.utcnow().isoformat(),
-        }
-        pred_topic = PREDICTION_TOPIC_FMT.format(doctor_id=doctor_id,patient_id=patient_id)
-        client.publish(pred_topic, json.dumps(out), qos=1)
-        logger.success(f"PREDICTED | D:{doctor_id} P:{patient_id} → {prediction} ({confidence})")
-
-    except Exception as e:
-        logger.exception(f"Error processing ECG stream: {e}")
+        topic, payload = segmented
+    if not ingest.put(topic, topic, payload):
+        logger.debug(f"Dropped ECG message on {topic} (queue full)")
 
 # MAIN
 def main():
     logger.info("Starting Jetson Nano ECG Inference Worker")
-    client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2,client_id="jetson-nano-worker")
+    client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2,client_id=WORKER_ID)
     client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     client.tls_set()
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
     client.on_message = on_message
+    ingest = IngestQueue(INGEST_QUEUE_SIZE, INGEST_OVERFLOW_POLICY, INGEST_DOWNSAMPLE_FACTOR)
+    client.user_data_set({"ingest": ingest})
+    threads = [
+        threading.Thread(target=inference_loop, args=(client, ingest), name=f"inference-{i}", daemon=True)
+        for i in range(INFERENCE_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info(
+        f"{INFERENCE_THREADS} inference thread(s) | queue={INGEST_QUEUE_SIZE} ({INGEST_OVERFLOW_POLICY}) "
+        f"| batch up to {BATCH_MAX_BEATS} beats / {BATCH_MAX_WAIT_MS} ms"
+    )
     client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
     client.loop_start()
     try:
+        last_stats = last_heartbeat = time.monotonic()
         while True:
             time.sleep(1)
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL_S:
+                send_heartbeat(client)
+                last_heartbeat = time.monotonic()
+            if time.monotonic() - last_stats >= STATS_INTERVAL_S:
+                logger.info(f"Ingest stats | {ingest.stats()} | segmenter {SEGMENTERS.stats()}")
+                last_stats = time.monotonic()
     except KeyboardInterrupt:
         logger.warning("Jetson worker shutting down")
     finally:
         client.loop_stop()
+        ingest.close()
+        for thread in threads:
+            thread.join()
         client.disconnect()
         logger.success("Jetson worker disconnected cleanly")
 
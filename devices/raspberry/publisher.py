@@ -1,19 +1,21 @@
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
-from datetime import datetime
 from dotenv import load_dotenv
 from getmac import get_mac_address
 from pathlib import Path
 import json
 import socket
 import os
+import sys
 import time
 from loguru import logger
-import numpy as np
 
 # Configuration
 BASE_DIR = Path(__file__).resolve().parents[1]
 load_dotenv(BASE_DIR / ".env")
+sys.path.append(str(BASE_DIR))
+from ecg_frame import encode_payload, CODEC_JSON
+from ecg_dataset import load_beats
 
 # Connect to Broker
 MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
@@ -26,20 +28,23 @@ DATASET_PATH = BASE_DIR / "mitbih_test.csv"
 DOCTOR_ID = "1"
 PATIENT_ID = "1"
 DEVICE_ID = f"{socket.gethostname()}_{get_mac_address()}"
+# json (legacy), float32 or int16 (see ecg_frame.py)
+STREAM_CODEC = os.getenv("STREAM_CODEC", CODEC_JSON)
+HEARTBEAT_INTERVAL_S = float(os.getenv("HEARTBEAT_INTERVAL_S", 30))
+STREAM_RATE_HZ = float(os.getenv("STREAM_RATE_HZ", 4))
 
 DEVICE_REGISTER_TOPIC = "devices/register"
+DEVICE_HEARTBEAT_TOPIC = "devices/heartbeat"
 STREAM_TOPIC = f"stream/{DOCTOR_ID}/{PATIENT_ID}"
 COMMANDS_TOPIC = f"commands/{DOCTOR_ID}/{PATIENT_ID}"
 
 # Global state
 streaming = False
+sequence = 0
 
 def load_ecg_data():
-    """Load ECG dataset from CSV"""
-    if not DATASET_PATH.exists():
-        raise FileNotFoundError(f"Dataset not found: {DATASET_PATH}")
-    data = np.genfromtxt(str(DATASET_PATH),delimiter=',',skip_header=1,max_rows=100)
-    data = data[:, :-1]  # Remove last column (label)
+    """Load ECG beats from the memory-mapped dataset cache (see ecg_dataset.py)"""
+    data, _ = load_beats(DATASET_PATH)
     logger.info(f"Loaded {data.shape[0]} ECG signals with {data.shape[1]} values each")
     return data
 
@@ -71,14 +76,19 @@ def register_device(client):
     client.publish(DEVICE_REGISTER_TOPIC, json.dumps(payload))
     logger.info(f"Device registered: {DEVICE_ID}")
 
+def send_heartbeat(client):
+    """Tell the server this device is still online"""
+    payload = {"device_id": DEVICE_ID, "streaming": streaming}
+    client.publish(DEVICE_HEARTBEAT_TOPIC, json.dumps(payload))
+    logger.debug(f"Heartbeat sent: {DEVICE_ID}")
+
 def publish_ecg_data(client, ecg_values):
     """Publish ECG data to MQTT topic"""
-    payload = {
-        "timestamp": datetime.now().isoformat(),
-        "values": ecg_values,
-    }
-    client.publish(STREAM_TOPIC, json.dumps(payload))
-    logger.debug(f"Published {len(ecg_values)} values to {STREAM_TOPIC}")
+    global sequence
+    payload = encode_payload(ecg_values, STREAM_CODEC, seq=sequence)
+    sequence += 1
+    client.publish(STREAM_TOPIC, payload)
+    logger.debug(f"Published {len(ecg_values)} values to {STREAM_TOPIC} ({STREAM_CODEC}, {len(payload)} bytes)")
 
 def main():
     """Main streaming loop"""
@@ -105,17 +115,27 @@ def main():
     # Streaming loop
     try:
         row_index = 0
+        last_heartbeat = time.monotonic()
+        next_send = None
         while True:
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL_S:
+                send_heartbeat(client)
+                last_heartbeat = time.monotonic()
             if streaming:
                 if row_index >= len_ecg_data:
                     logger.warning("Dataset exhausted. Restarting from beginning...")
                     row_index = 0
                 
-                ecg_values = ecg_data[row_index].tolist()
+                ecg_values = ecg_data[row_index]
                 publish_ecg_data(client, ecg_values)
                 row_index += 1
-                time.sleep(0.25)  # 4 Hz streaming rate
+                # Drift-free pacing: the schedule advances by a fixed interval,
+                # so publish time does not accumulate into the rate
+                now = time.monotonic()
+                next_send = (next_send or now) + 1.0 / STREAM_RATE_HZ
+                time.sleep(max(0.0, next_send - now))
             else:
+                next_send = None
                 time.sleep(0.5)  # Check for commands every 0.5s
                 
     except KeyboardInterrupt:
@@ -0,0 +1,336 @@
+## simulator.py
+"""Load simulator: thousands of virtual ECG devices from one asyncio process.
+
+Each virtual device publishes like ``publisher.py`` does, without waiting
+for a start command. It streams beats from the memory-mapped dataset cache
+(see ecg_dataset.py) to ``stream/{doctor}/{patient}``, or a continuous
+125 Hz signal in chunks to ``raw/{doctor}/{patient}``, and it registers and
+sends heartbeats. Every device keeps its own drift-free schedule. Message k
+is due at ``start + phase + k / rate``, so slow publishes show up as
+lateness instead of a lower rate. A single heap-driven coroutine publishes
+whatever is due, spread over ``--connections`` MQTT clients::
+
+    python simulator.py --devices 2000 --rate 4 --codec int16
+    python simulator.py --spec fleet.json --duration 300 --output sim.json
+
+The server only stores (and classifies) beats of patients with a running
+recording session; without one, ingest just forwards them to live viewers.
+``--sessions-api http://localhost:8000`` starts a session for every
+simulated doctor/patient pair through the REST API before publishing and
+stops them on exit. Those doctors and patients must already exist.
+
+A ``--spec`` file lists device groups; every key is optional and defaults
+to the matching command-line flag::
+
+    [{"count": 1500, "rate": 4, "codec": "int16", "topic": "stream"},
+     {"count": 500, "rate": 5, "codec": "float32", "topic": "raw", "doctor_id": 2}]
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import signal
+import sys
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from dotenv import load_dotenv
+from loguru import logger
+
+# Configuration
+BASE_DIR = Path(__file__).resolve().parents[1]
+load_dotenv(BASE_DIR / ".env")
+sys.path.append(str(BASE_DIR))
+from ecg_frame import encode_payload, CODECS, CODEC_JSON, CODEC_FLOAT32
+from ecg_dataset import load_beats
+from ecg_segment import SAMPLE_RATE_HZ
+
+MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 8883))
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+MQTT_TLS = os.getenv("MQTT_TLS", "true").lower() == "true"
+# Token sent to the REST API by --sessions-api when the server requires auth
+API_TOKEN = os.getenv("ECG_API_TOKEN")
+
+DATASET_PATH = BASE_DIR / "mitbih_test.csv"
+DEVICE_REGISTER_TOPIC = "devices/register"
+DEVICE_HEARTBEAT_TOPIC = "devices/heartbeat"
+TOPIC_FRMT = "{kind}/{doctor_id}/{patient_id}"
+SESSION_PATH_FRMT = "api/mqtt/{action}/{doctor_id}/{patient_id}/"
+TOPIC_KINDS = ("stream", "raw")
+CODEC_CHOICES = (CODEC_JSON,) + tuple(CODECS)
+# Publishes allowed in paho's outgoing queue per connection before new ones are dropped
+MAX_QUEUED = 100000
+MAX_BURST = 1000
+
+
+class VirtualDevice:
+    __slots__ = ("index", "doctor_id", "patient_id", "device_id", "topic", "kind", "codec",
+                 "interval", "chunk", "position", "seq")
+
+    def __init__(self, index, doctor_id, patient_id, kind, codec, rate, start_position):
+        self.index = index
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+        self.device_id = f"sim-{doctor_id}-{patient_id}"
+        self.topic = TOPIC_FRMT.format(kind=kind, doctor_id=doctor_id, patient_id=patient_id)
+        self.kind = kind
+        self.codec = codec
+        self.interval = 1.0 / rate
+        # raw devices send one chunk of the continuous signal per message; the
+        # interval follows from the chunk so the signal stays at SAMPLE_RATE_HZ
+        # and the message rate is only as close to ``rate`` as whole chunks allow
+        self.chunk = max(1, int(round(SAMPLE_RATE_HZ / rate)))
+        if kind == "raw":
+            self.interval = self.chunk / SAMPLE_RATE_HZ
+        self.position = start_position
+        self.seq = 0
+
+
+def continuous_signal(beats):
+    """Dataset beats without their zero padding, joined into one long signal."""
+    lengths = beats.shape[1] - np.argmax(beats[:, ::-1] != 0, axis=1)
+    return np.concatenate([beat[:length] for beat, length in zip(beats, lengths)]).astype(np.float32)
+
+
+def build_devices(groups, defaults, num_beats, signal_length, seed):
+    rng = np.random.default_rng(seed)
+    devices = []
+    patient_id = defaults["patient_id_start"]
+    for group in groups:
+        options = dict(defaults, **group)
+        if options["topic"] not in TOPIC_KINDS:
+            raise ValueError(f"Unknown topic {options['topic']!r}, expected one of {TOPIC_KINDS}")
+        if options["codec"] not in CODEC_CHOICES:
+            raise ValueError(f"Unknown codec {options['codec']!r}, expected one of {CODEC_CHOICES}")
+        for _ in range(int(options["count"])):
+            rate = options["rate"] * (1 + options["rate_jitter"] * rng.uniform(-1, 1))
+            length = signal_length if options["topic"] == "raw" else num_beats
+            devices.append(VirtualDevice(
+                len(devices), options["doctor_id"], patient_id, options["topic"], options["codec"],
+                rate, int(rng.integers(length)),
+            ))
+            patient_id += 1
+    return devices
+
+
+def session_request(api_url, action, doctor_id, patient_id, token=None, timeout=10.0):
+    """POST the start/stop streaming endpoint; returns None on success, else the error."""
+    url = f"{api_url.rstrip('/')}/{SESSION_PATH_FRMT.format(action=action, doctor_id=doctor_id, patient_id=patient_id)}"
+    headers = {"Authorization": f"Token {token}"} if token else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=b"", headers=headers, method="POST"), timeout=timeout):
+            return None
+    except urllib.error.HTTPError as e:
+        return f"{e.code} {e.read()[:200].decode(errors='replace')}"
+    except OSError as e:
+        return str(e)
+
+
+def toggle_sessions(api_url, pairs, action, token=None, workers=16):
+    """Start or stop the recording session of every (doctor, patient) pair; returns the pairs that succeeded."""
+    with ThreadPoolExecutor(workers) as pool:
+        errors = list(pool.map(lambda pair: session_request(api_url, action, *pair, token=token), pairs))
+    failed = [(pair, error) for pair, error in zip(pairs, errors) if error is not None]
+    if failed:
+        logger.warning(f"{len(failed)}/{len(pairs)} session {action} requests failed, e.g. {failed[0]}")
+    logger.info(f"Session {action}: {len(pairs) - len(failed)}/{len(pairs)} doctor/patient pairs")
+    return [pair for pair, error in zip(pairs, errors) if error is None]
+
+
+class Simulator:
+    """Publishes for every ``VirtualDevice`` on its schedule; see the module docstring."""
+
+    def __init__(self, devices, beats, raw_signal=None, connections=1, heartbeat_interval=30.0):
+        self.devices = devices
+        self.beats = beats
+        self.raw_signal = raw_signal
+        self.heartbeat_interval = heartbeat_interval
+        self.clients = [self._make_client(i) for i in range(max(1, connections))]
+        self.lateness = deque(maxlen=100000)
+        self.counters = {
+            "messages": 0,
+            "heartbeats": 0,
+            "failed": 0,
+            "bytes": 0,
+        }
+
+    def _make_client(self, index):
+        client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2, client_id=f"ecg-simulator-{os.getpid()}-{index}")
+        if MQTT_TLS:
+            client.tls_set()
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        client.max_queued_messages_set(MAX_QUEUED)
+        return client
+
+    def connect(self):
+        for client in self.clients:
+            client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
+            client.loop_start()
+        logger.success(f"{len(self.clients)} MQTT connection(s) to {MQTT_HOST}:{MQTT_PORT}")
+
+    def disconnect(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def publish(self, device, topic, payload, counter="messages"):
+        # paho's publish only queues the message; its network thread sends it
+        info = self.clients[device.index % len(self.clients)].publish(topic, payload)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.counters[counter] += 1
+            self.counters["bytes"] += len(payload)
+        else:
+            self.counters["failed"] += 1
+
+    def next_values(self, device):
+        if device.kind == "raw":
+            start = device.position
+            device.position = (start + device.chunk) % len(self.raw_signal)
+            values = self.raw_signal[start:start + device.chunk]
+            if len(values) < device.chunk:
+                values = np.concatenate([values, self.raw_signal[:device.chunk - len(values)]])
+            return values
+        device.position = (device.position + 1) % len(self.beats)
+        return self.beats[device.position]
+
+    async def stream(self, stop, started):
+        """Publish every due message; sleeps until the earliest next one."""
+        loop = asyncio.get_running_loop()
+        # Phases spread the first messages over one interval so devices do not publish in lockstep
+        phases = np.random.default_rng(0).random(len(self.devices))
+        queue = [(started + phase * device.interval, device.index) for phase, device in zip(phases, self.devices)]
+        heapq.heapify(queue)
+        while queue and not stop.is_set():
+            now = loop.time()
+            # At most MAX_BURST at a time so heartbeats and stats still run when behind
+            for _ in range(MAX_BURST):
+                due, index = queue[0]
+                if due > now:
+                    break
+                device = self.devices[index]
+                self.lateness.append(now - due)
+                self.publish(device, device.topic,
+                             encode_payload(self.next_values(device), device.codec, seq=device.seq))
+                device.seq += 1
+                heapq.heapreplace(queue, (due + device.interval, index))
+            await asyncio.sleep(max(0.0, queue[0][0] - loop.time()))
+
+    async def heartbeats(self, stop):
+        for device in self.devices:
+            self.publish(device, DEVICE_REGISTER_TOPIC, json.dumps({"device_id": device.device_id}), "heartbeats")
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                for device in self.devices:
+                    self.publish(device, DEVICE_HEARTBEAT_TOPIC,
+                                 json.dumps({"device_id": device.device_id, "streaming": True}), "heartbeats")
+
+    def stats(self, elapsed):
+        lateness = np.asarray(self.lateness, dtype=np.float64) * 1000
+        offered = sum(1.0 / device.interval for device in self.devices)
+        stats = dict(
+            self.counters,
+            devices=len(self.devices),
+            elapsed_s=elapsed,
+            offered_msgs_per_sec=offered,
+            publish_msgs_per_sec=self.counters["messages"] / elapsed if elapsed else 0.0,
+        )
+        if lateness.size:
+            p50, p99 = np.percentile(lateness, [50, 99])
+            stats.update(late_ms_p50=float(p50), late_ms_p99=float(p99), late_ms_max=float(lateness.max()))
+        return stats
+
+
+async def run(simulator, duration, stats_interval):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    if duration:
+        loop.call_later(duration, stop.set)
+
+    started = loop.time()
+    tasks = [asyncio.ensure_future(simulator.stream(stop, started))]
+    if simulator.heartbeat_interval:
+        tasks.append(asyncio.ensure_future(simulator.heartbeats(stop)))
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), stats_interval)
+        except asyncio.TimeoutError:
+            logger.info(f"Simulator stats | {simulator.stats(loop.time() - started)}")
+    await asyncio.gather(*tasks)
+    return simulator.stats(loop.time() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many ECG devices publishing over MQTT")
+    parser.add_argument("--devices", type=int, default=100, help="Virtual devices (ignored with --spec)")
+    parser.add_argument("--spec", type=Path, help="JSON list of device groups, see the module docstring")
+    parser.add_argument("--rate", type=float, default=4.0, help="Messages per second per device")
+    parser.add_argument("--rate-jitter", type=float, default=0.0,
+                        help="Spread per-device rates uniformly by this fraction of --rate")
+    parser.add_argument("--codec", choices=CODEC_CHOICES, default=CODEC_FLOAT32)
+    parser.add_argument("--topic", choices=TOPIC_KINDS, default="stream",
+                        help="stream: one dataset beat per message; raw: continuous 125 Hz chunks")
+    parser.add_argument("--doctor-id", type=int, default=1)
+    parser.add_argument("--patient-id-start", type=int, default=1000, help="Patient id of the first device")
+    parser.add_argument("--connections", type=int, default=4, help="MQTT connections to spread devices over")
+    parser.add_argument("--heartbeat-interval", type=float, default=30.0, help="Seconds, 0 disables heartbeats")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to run, 0 runs until interrupted")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the final stats as JSON here")
+    parser.add_argument("--sessions-api", metavar="URL",
+                        help="Start a recording session per device through this server's REST API "
+                             "(e.g. http://localhost:8000) and stop them on exit")
+    parser.add_argument("--api-token", default=API_TOKEN, help="Token for --sessions-api (default: $ECG_API_TOKEN)")
+    args = parser.parse_args(argv)
+
+    groups = json.loads(args.spec.read_text()) if args.spec else [{"count": args.devices}]
+    defaults = {
+        "count": args.devices,
+        "rate": args.rate,
+        "rate_jitter": args.rate_jitter,
+        "codec": args.codec,
+        "topic": args.topic,
+        "doctor_id": args.doctor_id,
+        "patient_id_start": args.patient_id_start,
+    }
+    beats, _ = load_beats(args.dataset)
+    raw = any(group.get("topic", args.topic) == "raw" for group in groups)
+    raw_signal = continuous_signal(beats) if raw else None
+    try:
+        devices = build_devices(groups, defaults, len(beats), len(raw_signal) if raw else 0, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    logger.info(f"Loaded {beats.shape[0]} beats | {len(devices)} virtual devices")
+
+    sessions = []
+    if args.sessions_api:
+        pairs = sorted({(device.doctor_id, device.patient_id) for device in devices})
+        sessions = toggle_sessions(args.sessions_api, pairs, "start", args.api_token)
+    simulator = Simulator(devices, beats, raw_signal, args.connections, args.heartbeat_interval)
+    simulator.connect()
+    try:
+        stats = asyncio.run(run(simulator, args.duration, args.stats_interval))
+    finally:
+        simulator.disconnect()
+        if sessions:
+            toggle_sessions(args.sessions_api, sessions, "stop", args.api_token)
+    logger.success(f"Simulator finished | {stats}")
+    if args.output:
+        args.output.write_text(json.dumps(stats, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
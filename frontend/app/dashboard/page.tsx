@@ -35,7 +35,11 @@ const useEcgSession = (doctorId: number | null, patientId: number | null) => {
   const [sampleIndex, setSampleIndex] = useState(0)
 
   const wsUrl = useMemo(
-    () => (doctorId && patientId ? `${BACKEND_WS_URL}/ws/ecg/${doctorId}/${patientId}/` : ""),
+    () => {
+      if (!doctorId || !patientId) return ""
+      const token = getSession()?.token
+      return `${BACKEND_WS_URL}/ws/ecg/${doctorId}/${patientId}/${token ? `?token=${encodeURIComponent(token)}` : ""}`
+    },
     [doctorId, patientId],
   )
 
@@ -45,7 +45,8 @@ export default function LoginPage({ params }: { params: Promise<{ role: string }
       // Store session data
       setSession({
         id: data.id,
-        full_name: data.full_name
+        full_name: data.full_name,
+        token: data.token
       });
       // Redirect doctors to dashboard
       router.push('/dashboard');
@@ -1,6 +1,7 @@
 export interface UserSession {
   id: number;
   full_name: string;
+  token?: string; // sent as "Authorization: Token <token>" and ?token= on WebSockets
 }
 
 export const setSession = (user: UserSession) => {
@@ -21,4 +22,12 @@ export const clearSession = () => {
   if (typeof window !== 'undefined') {
     sessionStorage.removeItem('user');
   }
-};
\ No newline at end of file
+};
+
+// Drops an expired or revoked token but keeps the signed-in user
+export const clearToken = () => {
+  const session = getSession();
+  if (session?.token) {
+    setSession({ ...session, token: undefined });
+  }
+};
@@ -1,4 +1,5 @@
 import { BACKEND_URL } from "@/services/api";
+import { clearToken, getSession } from "@/lib/session";
 import { toast } from "sonner";
 
 type HttpMethod = "GET" | "POST";
@@ -26,6 +27,11 @@ export default async function makeRequest<T = any>({
     "Content-Type": "application/json",
   };
 
+  const token = getSession()?.token;
+  if (token) {
+    headers["Authorization"] = `Token ${token}`;
+  }
+
   if (base.includes("ngrok")) {
     headers["ngrok-skip-browser-warning"] = "69420";
   }
@@ -60,6 +66,10 @@ export default async function makeRequest<T = any>({
 
   // ---- Handle errors ----
   if (!res.ok) {
+    if (res.status === 401) {
+      // Expired or revoked: stop sending it, the next request goes without one
+      clearToken();
+    }
     const message =
       data?.detail ||
       data?.error ||
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.db import models
-from .models import Doctor, Patient, RecordingSession, Device, SensorReadings
+from .models import Doctor, Patient, RecordingSession, Device, SensorReadings, BeatPrediction
 
 
 class AutoAdmin(admin.ModelAdmin):
@@ -16,6 +16,7 @@ admin.site.register(Doctor, AutoAdmin)
 admin.site.register(Patient, AutoAdmin)
 admin.site.register(Device, AutoAdmin)
 admin.site.register(RecordingSession, AutoAdmin)
+admin.site.register(BeatPrediction, AutoAdmin)
 @admin.register(SensorReadings)
 class SensorReadingsAdmin(admin.ModelAdmin):
     list_display = ("id", "session", "timestamp")
@@ -0,0 +1,105 @@
+"""Per-minute session statistics for dashboards.
+
+On TimescaleDB these read the ``ecg_session_beats_1m`` and
+``ecg_session_classes_1m`` continuous aggregates (see migration 0005). On
+other databases they fall back to grouping the raw rows.
+"""
+from collections import defaultdict
+from django.db import connections
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+from ecg.models import SensorReadings, BeatPrediction
+
+BEATS_VIEW = "ecg_session_beats_1m"
+CLASSES_VIEW = "ecg_session_classes_1m"
+_timescale_enabled = {}
+
+
+def timescale_enabled(using="default") -> bool:
+    if using not in _timescale_enabled:
+        connection = connections[using]
+        enabled = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                # Continuous aggregates are views over a hidden hypertable, not
+                # materialized views, so ask TimescaleDB's catalog (when installed)
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+                if cursor.fetchone() is not None:
+                    cursor.execute(
+                        "SELECT 1 FROM timescaledb_information.continuous_aggregates WHERE view_name = %s",
+                        [BEATS_VIEW],
+                    )
+                    enabled = cursor.fetchone() is not None
+        _timescale_enabled[using] = enabled
+    return _timescale_enabled[using]
+
+
+def _range_sql(start, end):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("bucket >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("bucket <= %s")
+        params.append(end)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _filter_range(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lte=end)
+    return queryset
+
+
+def session_beats_per_minute(session_id, start=None, end=None):
+    """[{"bucket": datetime, "beats": int}] ordered by minute."""
+    if timescale_enabled():
+        where, params = _range_sql(start, end)
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                f"SELECT bucket, beats FROM {BEATS_VIEW} WHERE session_id = %s{where} ORDER BY bucket",
+                [session_id, *params],
+            )
+            return [{"bucket": bucket, "beats": beats} for bucket, beats in cursor.fetchall()]
+
+    readings = _filter_range(SensorReadings.objects.filter(session_id=session_id), start, end)
+    return list(
+        readings.annotate(bucket=TruncMinute("timestamp"))
+        .values("bucket")
+        .annotate(beats=Count("id"))
+        .order_by("bucket")
+    )
+
+
+def session_class_histogram(session_id, start=None, end=None):
+    """Predicted class counts per minute plus totals over the range.
+
+    Returns ``{"minutes": [{"bucket": datetime, "counts": {label: n}}], "totals": {label: n}}``.
+    """
+    if timescale_enabled():
+        where, params = _range_sql(start, end)
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                f"SELECT bucket, label, beats FROM {CLASSES_VIEW} WHERE session_id = %s{where} ORDER BY bucket",
+                [session_id, *params],
+            )
+            rows = cursor.fetchall()
+    else:
+        predictions = _filter_range(BeatPrediction.objects.filter(session_id=session_id), start, end)
+        rows = (
+            predictions.annotate(bucket=TruncMinute("timestamp"))
+            .values_list("bucket", "label")
+            .annotate(beats=Count("id"))
+            .order_by("bucket")
+        )
+
+    minutes, totals = defaultdict(dict), defaultdict(int)
+    for bucket, label, beats in rows:
+        minutes[bucket][label] = beats
+        totals[label] += beats
+    return {
+        "minutes": [{"bucket": bucket, "counts": counts} for bucket, counts in minutes.items()],
+        "totals": dict(totals),
+    }
@@ -4,17 +4,5 @@ class EcgConfig(AppConfig):
     name = 'ecg'
     ### Added by me below all lines
     default_auto_field = 'django.db.models.BigAutoField'
-
-    def ready(self):
-        try:
-            from ecg.client.redis import get_redis
-            from ecg.client.mqtt import mqtt_client
-            from loguru import logger
-            r = get_redis()
-            r.ping()
-            logger.info("Redis Available")
-        except Exception as e:
-            logger.critical(f"Redis check failed: {e}")
-            raise
-        """Initialize MQTT client when Django starts"""
-        mqtt_client.connect()
\ No newline at end of file
+    # Nothing connects at start-up: ingest runs in `manage.py run_ingest` and
+    # ecg.client.mqtt.mqtt_client connects on the first published command
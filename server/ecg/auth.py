@@ -0,0 +1,113 @@
+import secrets
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from channels.middleware import BaseMiddleware
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from ecg.client.redis import get_redis, get_async_redis
+
+# Login tokens are signed {"r": role, "i": id, "n": nonce} payloads. A token is
+# valid while its signature checks out and ecg:token:<nonce> still exists in
+# Redis (it expires after ECG_TOKEN_TTL), so checking one is an HMAC and a GET:
+# no ORM query and no password hash
+TOKEN_SALT = "ecg.auth.token"
+TOKEN_KEY_FRMT = "ecg:token:{nonce}"
+TOKEN_KEYWORDS = (b"token", b"bearer")
+ROLE_DOCTOR = "doctor"
+ROLE_PATIENT = "patient"
+r = get_redis()
+
+
+class TokenUser:
+    """The doctor or patient a token was issued to; stands in for ``request.user``."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, role, user_id):
+        self.role = role
+        self.id = user_id
+
+    def __str__(self):
+        return f"{self.role}:{self.id}"
+
+
+def issue_token(role, user_id) -> str:
+    nonce = secrets.token_urlsafe(16)
+    r.set(TOKEN_KEY_FRMT.format(nonce=nonce), f"{role}:{user_id}", ex=settings.ECG_TOKEN_TTL)
+    return signing.dumps({"r": role, "i": user_id, "n": nonce}, salt=TOKEN_SALT, compress=False)
+
+
+def _unsign(token):
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=settings.ECG_TOKEN_TTL)
+    except signing.BadSignature:
+        return None
+    return data, TOKEN_KEY_FRMT.format(nonce=data["n"]), f"{data['r']}:{data['i']}"
+
+
+def validate_token(token):
+    """TokenUser for a valid, unexpired token, else None."""
+    unsigned = _unsign(token)
+    if unsigned is None:
+        return None
+    data, key, expected = unsigned
+    return TokenUser(data["r"], data["i"]) if r.get(key) == expected else None
+
+
+async def avalidate_token(token):
+    """``validate_token`` on the event loop's ``redis.asyncio`` client."""
+    unsigned = _unsign(token)
+    if unsigned is None:
+        return None
+    data, key, expected = unsigned
+    stored = await get_async_redis().get(key)
+    return TokenUser(data["r"], data["i"]) if stored == expected else None
+
+
+class ECGTokenAuthentication(BaseAuthentication):
+    """``Authorization: Token <token>`` (or ``Bearer``) issued by the login views.
+
+    A bad or expired token is a 401 only while ``ECG_AUTH_REQUIRED`` is on;
+    otherwise the request carries on anonymously, as if no token was sent.
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() not in TOKEN_KEYWORDS:
+            return None
+        user = validate_token(auth[1].decode(errors="replace")) if len(auth) == 2 else None
+        if user is None:
+            if not settings.ECG_AUTH_REQUIRED:
+                return None
+            raise AuthenticationFailed("Invalid token header" if len(auth) != 2 else "Invalid or expired token")
+        return user, auth[1]
+
+    def authenticate_header(self, request):
+        return "Token"
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """Sets ``scope["user"]`` from a ``?token=`` query parameter on WebSocket connects.
+
+    Without a token the user is anonymous; with an invalid one
+    ``scope["token_invalid"]`` is set so the consumer can refuse it when
+    ``ECG_AUTH_REQUIRED`` is on.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get("query_string", b"").decode())
+        token = query.get("token", [None])[-1]
+        user = await avalidate_token(token) if token else None
+        scope = dict(scope, user=user or AnonymousUser(), token_invalid=bool(token) and user is None)
+        return await super().__call__(scope, receive, send)
+
+
+def may_view(user, doctor_id, patient_id) -> bool:
+    """Whether ``user`` may watch the live stream of this doctor/patient pair."""
+    if not getattr(user, "is_authenticated", False):
+        return not settings.ECG_AUTH_REQUIRED
+    if user.role == ROLE_DOCTOR:
+        return str(user.id) == str(doctor_id)
+    return user.role == ROLE_PATIENT and str(user.id) == str(patient_id)
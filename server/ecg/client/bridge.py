@@ -0,0 +1,135 @@
+# ecg/client/bridge.py
+import asyncio
+import threading
+from loguru import logger
+
+
+class AsyncIngestBridge:
+    """Hands MQTT messages from paho's network thread to a dedicated asyncio loop.
+
+    ``submit`` is called on paho's thread and never blocks: the message is
+    scheduled onto the loop with ``call_soon_threadsafe``. The loop takes
+    everything that has queued up since its last wake-up (at most
+    ``max_batch`` messages) and awaits ``handler(batch)`` once for the lot,
+    so a burst of beats costs one wake-up instead of one event loop per
+    message. Once ``maxsize`` messages are waiting, new ones are dropped and
+    counted. ``on_start``, if given, is awaited on the loop before the first
+    batch, e.g. to create loop-bound clients; ``on_stop`` is awaited after
+    the last batch when the bridge is stopped, e.g. to flush buffered writes.
+    """
+
+    def __init__(self, handler, maxsize=10000, max_batch=256, name="mqtt-ingest",
+                 on_start=None, on_stop=None):
+        self.handler = handler
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.maxsize = maxsize
+        self.max_batch = max(1, max_batch)
+        self.name = name
+        self.loop = None
+        self.queue = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.counters = {
+            "received": 0,
+            "dropped": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "max_depth": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.ready.clear()
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.Queue(self.maxsize)
+        consumer = self.loop.create_task(self._consume())
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            consumer.cancel()
+            self.loop.run_until_complete(asyncio.gather(consumer, return_exceptions=True))
+            self.loop.close()
+            logger.info(f"{self.name} loop stopped | {self.stats()}")
+
+    def submit(self, *message) -> bool:
+        """Queue ``message`` for the loop; thread-safe, returns False if the bridge is not running."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            self.counters["dropped"] += 1
+            return False
+        try:
+            loop.call_soon_threadsafe(self._enqueue, message)
+        except RuntimeError:  # loop closed between the check and the call
+            self.counters["dropped"] += 1
+            return False
+        return True
+
+    def _enqueue(self, message):
+        self.counters["received"] += 1
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            return
+        self.counters["max_depth"] = max(self.counters["max_depth"], self.queue.qsize())
+
+    async def _consume(self):
+        if self.on_start is not None:
+            await self.on_start()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self.counters["batches"] += 1
+            try:
+                await self.handler(batch)
+            except Exception as e:
+                self.counters["failed_batches"] += 1
+                logger.error(f"{self.name} failed to handle {len(batch)} messages: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _drain(self):
+        await self.queue.join()
+        if self.on_stop is not None:
+            await self.on_stop()
+
+    def stop(self, timeout=5.0):
+        """Finish the queued messages (waiting at most ``timeout`` seconds), then stop the loop."""
+        if not self.running:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(timeout)
+        except Exception:
+            logger.warning(f"{self.name} stopped with {self.queue.qsize()} messages still queued")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+    def stats(self):
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return dict(self.counters, depth=depth)
+
+
+async def gather_bounded(coros, limit):
+    """``asyncio.gather`` running at most ``limit`` of ``coros`` at a time; exceptions are returned."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
@@ -0,0 +1,59 @@
+# ecg/client/devices.py
+import time
+from datetime import datetime, timezone
+
+# Redis sorted set of device id scored by the unix time of its last
+# registration or heartbeat. Ingest only writes here; the device list reads
+# online status from it, and ecg.tasks.sync_device_heartbeats copies the ids
+# scored since its previous run into Device.last_seen and prunes ids silent
+# for longer than DEVICE_HEARTBEAT_RETENTION
+DEVICE_HEARTBEATS_KEY = "ecg:device_last_seen"
+# Edge inference workers (devices/jetson/worker.py) send heartbeats with
+# "role": "inference"; they are kept apart from patient devices and tell
+# manage.py run_inference whether it has to classify beats itself
+EDGE_WORKER_HEARTBEATS_KEY = "ecg:edge_worker_last_seen"
+# manage.py run_inference processes record themselves here while they classify,
+# so persistence knows some inference consumer is alive (see ecg.tasks)
+SERVER_INFERENCE_HEARTBEATS_KEY = "ecg:server_inference_last_seen"
+# Hashes of device id -> last seen used before the sorted sets; dropped by the sync task
+LEGACY_HEARTBEATS_KEYS = ("ecg:device_heartbeats", "ecg:edge_worker_heartbeats")
+INFERENCE_ROLE = "inference"
+
+
+def heartbeats_key(payload) -> str:
+    """Sorted set a registration/heartbeat payload is recorded in."""
+    return EDGE_WORKER_HEARTBEATS_KEY if payload.get("role") == INFERENCE_ROLE else DEVICE_HEARTBEATS_KEY
+
+
+def record_heartbeats(redis_client, seen, key=DEVICE_HEARTBEATS_KEY):
+    """Store ``{device_id: unix time}`` in one ZADD; returns the (awaitable, for async clients) reply."""
+    return redis_client.zadd(key, seen)
+
+
+def _as_datetimes(raw):
+    return {
+        device_id.decode() if isinstance(device_id, bytes) else device_id:
+            datetime.fromtimestamp(float(seen), tz=timezone.utc)
+        for device_id, seen in raw
+        if seen is not None
+    }
+
+
+def get_heartbeats(redis_client, device_ids, key=DEVICE_HEARTBEATS_KEY):
+    """Last heartbeat of each of ``device_ids`` as aware datetimes (unknown ids are left out)."""
+    device_ids = list(device_ids)
+    return _as_datetimes(zip(device_ids, redis_client.zmscore(key, device_ids) if device_ids else []))
+
+
+def get_heartbeats_since(redis_client, since, key=DEVICE_HEARTBEATS_KEY):
+    """Heartbeats recorded at or after unix time ``since``, as aware datetimes."""
+    return _as_datetimes(redis_client.zrangebyscore(key, since, "+inf", withscores=True))
+
+
+def prune_heartbeats(redis_client, before, key=DEVICE_HEARTBEATS_KEY):
+    """Forget devices last seen before unix time ``before``; returns how many were removed."""
+    return redis_client.zremrangebyscore(key, "-inf", f"({before}")
+
+
+def is_online(last_seen, timeout) -> bool:
+    return last_seen is not None and time.time() - last_seen.timestamp() <= timeout
@@ -0,0 +1,24 @@
+# ecg/client/frame.py
+# The stream/ frame codec lives next to the device code (devices/ecg_frame.py)
+# so the publisher, the Jetson worker and this server share one implementation.
+import sys
+from django.conf import settings
+
+if str(settings.DEVICES_DIR) not in sys.path:
+    sys.path.append(str(settings.DEVICES_DIR))
+
+from ecg_frame import (  # noqa: E402
+    CODEC_FLOAT32,
+    CODEC_INT16,
+    CODEC_JSON,
+    DTYPE_DELTA_INT16,
+    DTYPE_FLOAT32,
+    Frame,
+    FrameError,
+    decode_frame,
+    decode_payload,
+    encode_frame,
+    encode_payload,
+    is_frame,
+    payload_seq,
+)
@@ -1,138 +1,311 @@
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 import json
+import threading
+import time
+import zlib
 from loguru import logger
 from django.conf import settings
-from django.utils import timezone
-from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
 from channels.layers import get_channel_layer
-from ecg.models import Device
-from ecg import tasks  
-import time,json
-from ecg.client.redis import get_redis
-r = get_redis()
+from ecg.client.redis import get_async_redis, pack_ecg_values, ECG_SAMPLES_FIELD
+from ecg.client.frame import decode_payload, payload_seq
+from ecg.client.segment import SegmenterPool
+from ecg.client.sessions import (
+    ActiveSessionCache, advance_inference_cursor_to_seq, session_stream_key, prediction_stream_key,
+)
+from ecg.client.bridge import AsyncIngestBridge, gather_bounded
+from ecg.client.writer import BufferedStreamWriter
+from ecg.client.devices import record_heartbeats, heartbeats_key
 
 DEVICE_REGISTER_TOPIC = "devices/register"
+DEVICE_HEARTBEAT_TOPIC = "devices/heartbeat"
+DEVICE_TOPICS = (DEVICE_REGISTER_TOPIC, DEVICE_HEARTBEAT_TOPIC)
 ECG_STREAM_TOPIC = "stream/+/+"
+RAW_STREAM_TOPIC = "raw/+/+"
 PREDICTION_TOPIC = "prediction/+/+"
+# start/stop sent to devices by the streaming views; ingest drops the
+# patient's segmenter on both so a new recording starts from a clean signal
+COMMAND_TOPIC = "commands/+/+"
 CHANNEL_LAYER = get_channel_layer()
 GROUP_NAME = "live_signals_{doctor_id}_{patient_id}"
-REDIS_SESSION_FRMT = "ecg:session:{doctor_id}/{patient_id}"
+SHARED_SUBSCRIPTION_FRMT = "$share/{group}/{topic}"
+
+
+def patient_partition(doctor_id, patient_id, partitions) -> int:
+    """Stable partition of a doctor/patient pair, the same in every process."""
+    return zlib.crc32(f"{doctor_id}/{patient_id}".encode()) % partitions
 
 
 class MQTTClient:
+    """MQTT subscriber for device registrations, ECG beats and predictions.
+
+    Paho's network thread only parses topics: stream/ and prediction/
+    messages are handed to an ``AsyncIngestBridge`` whose asyncio loop
+    handles them in batches. Each batch becomes one ``ecg.batch`` group_send
+    per patient, while Redis stream entries go to a ``BufferedStreamWriter``
+    that pipelines them on a ``redis.asyncio`` client. Device registrations
+    and heartbeats only update a Redis sorted set, one ZADD per batch; Celery
+    copies it to ``Device.last_seen`` (``ecg.tasks.sync_device_heartbeats``).
+    Heartbeats of edge inference workers go to their own sorted set, which
+    ``manage.py run_inference`` watches. Beat entries keep the frame seq
+    they came from, and edge predictions, which echo it, move the session's
+    shared inference cursor up to that entry (``INFERENCE_CURSORS_KEY``).
+    Continuous signals
+    on raw/ are cut into beats by a per-patient ``SegmenterPool`` on the
+    bridge loop and then handled like stream/ beats.
+
+    Only ``manage.py run_ingest`` subscribes (``connect(subscribe=True)``).
+    Web and worker processes use the module-level ``mqtt_client`` to publish
+    commands, which connects lazily on the first ``publish``.
+
+    Several ingest processes split the load in one of two ways:
 
-    def __init__(self):
+    * ``MQTT_SHARE_GROUP`` set: subscribe over MQTT v5 to
+      ``$share/<group>/...`` so the broker hands each message to exactly one
+      member of the group.
+    * ``MQTT_PARTITIONS`` > 1: every process receives everything but only
+      handles the patients hashed to its ``MQTT_PARTITION``; registrations
+      and heartbeats are handled by partition 0. For brokers without shared
+      subscriptions, and required for raw/ devices: segmentation keeps
+      per-patient state, so all chunks of a patient must reach one process.
+    """
+
+    def __init__(self, share_group=None, partitions=None, partition=None):
         self.client = None
         self.connected = False
+        self.subscribe = False
+        self.ready = threading.Event()
+        self.connect_lock = threading.Lock()
+        self.channel_layer = CHANNEL_LAYER
+        self.share_group = settings.MQTT_SHARE_GROUP if share_group is None else share_group
+        self.partitions = max(1, settings.MQTT_PARTITIONS if partitions is None else partitions)
+        self.partition = settings.MQTT_PARTITION if partition is None else partition
+        if not 0 <= self.partition < self.partitions:
+            raise ImproperlyConfigured(f"MQTT_PARTITION must be in [0, {self.partitions}), got {self.partition}")
+        # created on the bridge loop by start_ingest, redis.asyncio clients are loop-bound
+        self.redis = None
+        self.active_sessions = None
+        self.writer = None
+        self.segmenters = SegmenterPool(max_streams=settings.ECG_SEGMENTER_MAX_STREAMS)
+        self.bridge = AsyncIngestBridge(
+            self.handle_batch,
+            maxsize=settings.MQTT_INGEST_QUEUE_SIZE,
+            max_batch=settings.MQTT_INGEST_MAX_BATCH,
+            on_start=self.start_ingest,
+            on_stop=self.stop_ingest,
+        )
+
+    async def start_ingest(self):
+        # binary client: packed samples are written as raw bytes
+        self.redis = get_async_redis(decode_responses=False)
+        self.active_sessions = ActiveSessionCache(self.redis)
+        self.writer = BufferedStreamWriter(
+            self.redis,
+            max_entries=settings.MQTT_INGEST_FLUSH_ENTRIES,
+            max_delay=settings.MQTT_INGEST_FLUSH_MS / 1000,
+            retries=settings.MQTT_INGEST_WRITE_RETRIES,
+        )
+
+    async def stop_ingest(self):
+        await self.writer.flush()
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             self.connected = True
+            self.ready.set()
+            if not self.subscribe:
+                logger.success("MQTT connected (publish only)")
+                return
             client.subscribe([
-                (ECG_STREAM_TOPIC, 1),
-                (PREDICTION_TOPIC, 1),
-                (DEVICE_REGISTER_TOPIC, 1)
+                (self.subscription(ECG_STREAM_TOPIC), 1),
+                (self.subscription(RAW_STREAM_TOPIC), 1),
+                (self.subscription(PREDICTION_TOPIC), 1),
+                (self.subscription(DEVICE_REGISTER_TOPIC), 1),
+                (self.subscription(DEVICE_HEARTBEAT_TOPIC), 1),
+                # Not shared: every process holding a segmenter for the patient must see it
+                (COMMAND_TOPIC, 1),
             ])
-            logger.success("MQTT connected & subscribed")
+            logger.success(
+                f"MQTT connected & subscribed | share_group={self.share_group or '-'} "
+                f"partition={self.partition}/{self.partitions}"
+            )
+
+    def subscription(self, topic):
+        if self.share_group:
+            return SHARED_SUBSCRIPTION_FRMT.format(group=self.share_group, topic=topic)
+        return topic
 
-    def on_disconnect(self, client, userdata, rc, properties=None):
+    def owns(self, topic) -> bool:
+        """Whether this process handles ``topic`` under MQTT_PARTITIONS."""
+        if self.partitions == 1:
+            return True
+        if topic in DEVICE_TOPICS:
+            return self.partition == 0
+        _, doctor_id, patient_id = topic.split("/")
+        return patient_partition(doctor_id, patient_id, self.partitions) == self.partition
+
+    def on_disconnect(self, client, userdata, flags, rc, properties=None):
         logger.warning(f"Disconnected from MQTT broker (rc={rc})")
         self.connected = False
+        self.ready.clear()
 
     def on_message(self, client, userdata, msg):
-        payload = json.loads(msg.payload.decode())
         topic = msg.topic
+        if not self.owns(topic):
+            return
+
+        if topic in DEVICE_TOPICS or topic.startswith(("stream", "raw", "prediction", "commands")):
+            self.bridge.submit(topic, msg.payload)
 
-        if topic == DEVICE_REGISTER_TOPIC:
-            self.handle_device_registration(payload)
-        
-        elif topic.startswith("stream"):
-            self.handle_ecg_stream(topic, payload)
+    async def handle_batch(self, messages):
+        """Handle (topic, payload) messages queued by ``on_message``, on the bridge loop."""
+        live = {}       # group -> beats forwarded to the WebSocket consumers
+        events = []     # (group, event) for other group_sends
+        seen = {}       # heartbeat key -> {device id: time of its latest registration/heartbeat}
+        classified = {}     # session stream -> frame seq of the latest edge prediction for it
+        for topic, raw_payload in messages:
+            try:
+                if topic.startswith("stream"):
+                    await self.handle_ecg_stream(topic, raw_payload, live)
+                elif topic.startswith("raw"):
+                    await self.handle_raw_stream(topic, raw_payload, live)
+                elif topic in DEVICE_TOPICS:
+                    self.handle_device_heartbeat(topic, json.loads(raw_payload.decode()), seen)
+                elif topic.startswith("commands"):
+                    self.handle_command(topic, raw_payload)
+                else:
+                    stream_key, seq = await self.handle_prediction(topic, json.loads(raw_payload.decode()), events)
+                    if stream_key is not None and seq is not None:
+                        classified[stream_key] = seq
+            except Exception as e:
+                logger.warning(f"Dropped message on {topic}: {e}")
 
-        elif topic.startswith("prediction"):
-            self.handle_prediction(topic, payload)
+        events.extend((group, {"type": "ecg.batch", "data": beats}) for group, beats in live.items())
+        calls = [self.group_send(group, event) for group, event in events]
+        if self.writer.due:
+            calls.append(self.writer.flush())
+        calls.extend(record_heartbeats(self.redis, devices, key) for key, devices in seen.items())
+        calls.extend(advance_inference_cursor_to_seq(self.redis, key, seq) for key, seq in classified.items())
+        for result in await gather_bounded(calls, settings.MQTT_INGEST_CONCURRENCY):
+            if isinstance(result, Exception):
+                logger.error(f"Ingest batch call failed: {result}")
 
-    def handle_ecg_stream(self, topic, payload):
+    async def handle_ecg_stream(self, topic, raw_payload, live):
         _, doctor_id, patient_id = topic.split("/")
-        values = payload["values"]
+        try:
+            samples, _ = decode_payload(raw_payload)
+        except Exception as e:
+            logger.warning(f"Malformed ECG payload on {topic}: {e}")
+            return
         logger.info(f"ECG RX from  | D:{doctor_id} P:{patient_id}")
-        # Store / forward via WebSocket later
+        await self.add_beat(doctor_id, patient_id, samples, live, payload_seq(raw_payload))
+
+    async def handle_raw_stream(self, topic, raw_payload, live):
+        _, doctor_id, patient_id = topic.split("/")
+        try:
+            samples, _ = decode_payload(raw_payload)
+        except Exception as e:
+            logger.warning(f"Malformed raw ECG payload on {topic}: {e}")
+            return
+        seq = payload_seq(raw_payload)
+        for beat in self.segmenters.push((doctor_id, patient_id), samples):
+            await self.add_beat(doctor_id, patient_id, beat, live, seq)
+
+    def handle_command(self, topic, raw_payload):
+        _, doctor_id, patient_id = topic.split("/")
+        if raw_payload.decode(errors="replace").strip() in ("start", "stop"):
+            # Runs on the bridge loop like handle_raw_stream, so no chunk is mid-push
+            self.segmenters.drop((doctor_id, patient_id))
+
+    async def add_beat(self, doctor_id, patient_id, samples, live, seq=None):
+        """Forward one beat to the live view and queue it for the session stream.
+
+        ``seq`` is the frame seq of the message the beat came from (None for
+        JSON payloads); edge predictions refer back to it.
+        """
         payload = {
             "doctor_id":doctor_id,
             "patient_id":patient_id,
-            "values": values
+            "values": samples.tolist()
         }
-        self.send_live_signals(doctor_id,patient_id,payload)
-        payload = {
-                "ts": time.time_ns(),
-                "values": json.dumps(values)
+        group_name = GROUP_NAME.format(doctor_id=doctor_id,patient_id=patient_id)
+        live.setdefault(group_name, []).append(payload)
+        session_id = await self.active_sessions.aget(doctor_id, patient_id)
+        if session_id is None:
+            logger.debug(f"No active session for D:{doctor_id} P:{patient_id}, not storing beat")
+            return
+        fields = {
+            "ts": time.time_ns(),
+            ECG_SAMPLES_FIELD: pack_ecg_values(samples)
         }
-        r.xadd(
-            REDIS_SESSION_FRMT.format(doctor_id=doctor_id,patient_id=patient_id),
-            {
-                "ts": time.time_ns(),
-                "values": json.dumps(values)
-            },
-            maxlen=10000,
-            approximate=True
-        )
-        # persist_ecg_data_task.delay(session_id, values, datetime.now())
+        if seq is not None:
+            fields["seq"] = seq
+        self.writer.add(session_stream_key(session_id), fields)
 
-        
-
-    def handle_prediction(self, topic, payload):
+    async def handle_prediction(self, topic, payload, events):
         _, doctor_id, patient_id = topic.split("/")
         prediction = payload["prediction"]
         confidence = payload.get("confidence")
         group_name = GROUP_NAME.format(doctor_id=doctor_id,patient_id=patient_id)
         logger.success(f"PREDICTION | D:{doctor_id} P:{patient_id} → {prediction}")
-        try:
-            payload= {
+        session_id = await self.store_prediction(doctor_id, patient_id, prediction, confidence)
+        events.append((group_name, {
+            "type": "send.prediction",  # will call send_prediction on consumers
+            "data": {
                 "prediction": prediction,
                 "confidence":confidence
             }
-            if CHANNEL_LAYER :
-                async_to_sync(CHANNEL_LAYER.group_send)(
-                    group_name,
-                    {
-                        "type": "send.prediction",  # will call send_prediction on consumers
-                        "data":payload
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Failed to send prediction to websocket group {group_name}: {e}")
+        }))
+        # The edge has classified the session's beats up to those of frame "seq"
+        return session_stream_key(session_id) if session_id is not None else None, payload.get("seq")
+
+    async def store_prediction(self, doctor_id, patient_id, prediction, confidence):
+        """Queue predictions of an active session for persistence (BeatPrediction); returns its id."""
+        session_id = await self.active_sessions.aget(doctor_id, patient_id)
+        if session_id is None:
+            return None
+        labels = prediction if isinstance(prediction, list) else [prediction]
+        confidences = confidence if isinstance(confidence, list) else [confidence] * len(labels)
+        self.writer.add(prediction_stream_key(session_id), {
+            "ts": time.time_ns(),
+            "labels": json.dumps(labels),
+            "confidences": json.dumps(confidences),
+        })
+        return session_id
+
+    async def group_send(self, group_name, event):
+        if self.channel_layer:
+            await self.channel_layer.group_send(group_name, event)
+
+    def stats(self):
+        return {
+            "bridge": self.bridge.stats(),
+            "writer": self.writer.stats() if self.writer is not None else {},
+            "segmenter": self.segmenters.stats(),
+        }
 
-    def handle_device_registration(self, payload):
-        """Handle device registration"""
+    def handle_device_heartbeat(self, topic, payload, seen):
         device_id = payload.get('device_id')
         if device_id:
-            device, created = Device.objects.get_or_create(device_id=device_id)
-            device.last_seen = timezone.now()
-            device.save()
-            if created:
-                logger.success(f"New device registered: {device_id}")
-            else:
-                logger.info(f"Device updated: {device_id}")
-
-    def  send_live_signals(self,doctor_id,patient_id,payload):
-        try:
-            group_name = GROUP_NAME.format(doctor_id=doctor_id,patient_id=patient_id)
-            if CHANNEL_LAYER :
-                async_to_sync(CHANNEL_LAYER.group_send)(
-                    group_name,
-                    {
-                        "type": "ecg.message",  # will call ecg_message on consumers
-                        "data": payload
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Failed to forward ECG to websocket group {group_name}: {e}")
+            seen.setdefault(heartbeats_key(payload), {})[device_id] = time.time()
+            if topic == DEVICE_REGISTER_TOPIC:
+                logger.info(f"Device registered: {device_id}")
+
+    def connect(self, subscribe=False):
+        """Initialize and connect to MQTT broker; ``subscribe`` also starts ingest.
 
-    def connect(self):
-        """Initialize and connect to MQTT broker"""
+        Returns False if the broker could not be reached.
+        """
+        self.subscribe = subscribe
         try:
-            self.client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2)
+            if subscribe:
+                self.bridge.start()
+            self.client = mqtt.Client(
+                callback_api_version=CallbackAPIVersion.VERSION2,
+                # shared subscriptions need MQTT v5
+                protocol=mqtt.MQTTv5 if self.share_group else mqtt.MQTTv311,
+            )
             # Set callbacks
             self.client.on_connect = self.on_connect
             self.client.on_disconnect = self.on_disconnect
@@ -154,9 +327,12 @@ class MQTTClient:
             # Start loop in background
             self.client.loop_start()
             logger.info("MQTT client started")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
+            self.client = None
+            return False
 
     def disconnect(self):
         """Disconnect from MQTT broker"""
@@ -164,13 +340,26 @@ class MQTTClient:
             self.client.loop_stop()
             self.client.disconnect()
             logger.info("MQTT client disconnected")
+        if self.subscribe:
+            # finish writing what paho already handed over
+            self.bridge.stop()
+            logger.info(f"MQTT ingest stats | {self.stats()}")
+
+    def ensure_connected(self, timeout=None):
+        """Connect for publishing on first use; waits up to ``timeout`` seconds for the broker."""
+        if self.client is None:
+            with self.connect_lock:
+                if self.client is None and not self.connect(subscribe=False):
+                    return False
+        timeout = settings.MQTT_CONNECT_TIMEOUT if timeout is None else timeout
+        return self.ready.wait(timeout)
 
     def publish(self, topic, message):
         """Publish message to MQTT broker"""
-        if self.client and self.connected:
+        if self.ensure_connected():
             self.client.publish(topic, message)
         else:
             logger.warning("Cannot publish - MQTT client not connected")
 
-# Global MQTT client instance
+# Global MQTT client instance, used by web/worker processes to publish commands
 mqtt_client = MQTTClient()
\ No newline at end of file
@@ -1,6 +1,109 @@
 # ecg/redis_client.py
+import asyncio
+import os
+import threading
+import weakref
+import numpy as np
 import redis
+import redis.asyncio
 from django.conf import settings
 
-def get_redis():
-    return redis.Redis(host="localhost",port=6379,decode_responses=True,socket_connect_timeout=1,socket_timeout=1,)
+# ECG samples are stored in stream entries as packed little-endian float32
+# under ECG_SAMPLES_FIELD; older entries hold JSON text under "values"
+ECG_VALUES_DTYPE = np.dtype("<f4")
+ECG_SAMPLES_FIELD = "samples"
+
+# Process-wide clients, one per decode_responses mode. Async clients are also
+# keyed by event loop, since redis.asyncio connections belong to one loop.
+_lock = threading.Lock()
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+# Set by use_fake_redis(): every client then talks to this in-memory server
+_fake_server = None
+
+def _pool_kwargs(decode_responses):
+    return dict(
+        decode_responses=decode_responses,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+def get_redis(decode_responses=True):
+    """Shared client on the process-wide pool for REDIS_URL."""
+    client = _clients.get(decode_responses)
+    if client is None:
+        with _lock:
+            client = _clients.get(decode_responses)
+            if client is None and _fake_server is not None:
+                import fakeredis
+                client = _clients[decode_responses] = fakeredis.FakeRedis(server=_fake_server, decode_responses=decode_responses)
+            elif client is None:
+                pool = redis.ConnectionPool.from_url(settings.REDIS_URL, **_pool_kwargs(decode_responses))
+                client = _clients[decode_responses] = redis.Redis(connection_pool=pool)
+    return client
+
+def get_binary_redis():
+    """Client that returns raw bytes, needed to read packed ECG samples back."""
+    return get_redis(decode_responses=False)
+
+def get_async_redis(decode_responses=True):
+    """Shared ``redis.asyncio`` client for the running event loop.
+
+    Called outside a running loop it returns a new, unshared client whose
+    connections bind to the first loop that uses it.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _new_async_redis(decode_responses)
+    clients = _async_clients.setdefault(loop, {})
+    if decode_responses not in clients:
+        clients[decode_responses] = _new_async_redis(decode_responses)
+    return clients[decode_responses]
+
+def _new_async_redis(decode_responses):
+    if _fake_server is not None:
+        import fakeredis
+        return fakeredis.FakeAsyncRedis(server=_fake_server, decode_responses=decode_responses)
+    return redis.asyncio.Redis.from_url(settings.REDIS_URL, **_pool_kwargs(decode_responses))
+
+def use_fake_redis():
+    """Back every client of this process with one in-memory fakeredis server.
+
+    For benchmarks and local runs without Redis; needs the ``fakeredis``
+    package. Shared clients that already exist (module-level
+    ``r = get_redis()``) are switched over too. Async clients already handed
+    out keep using REDIS_URL.
+    """
+    global _fake_server
+    import fakeredis
+    with _lock:
+        _fake_server = fakeredis.FakeServer()
+        for decode_responses, client in _clients.items():
+            fake = fakeredis.FakeRedis(server=_fake_server, decode_responses=decode_responses)
+            client.connection_pool = fake.connection_pool
+        _async_clients.clear()
+
+def _reset_after_fork():
+    # A forked child (e.g. a Celery prefork worker) must not reuse the parent's
+    # sockets: drop them without closing, the pools reconnect on next use
+    global _lock
+    _lock = threading.Lock()
+    for client in _clients.values():
+        client.connection_pool.reset()
+    _async_clients.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def pack_ecg_values(values) -> bytes:
+    return np.asarray(values, dtype=ECG_VALUES_DTYPE).tobytes()
+
+def unpack_ecg_values(blobs) -> np.ndarray:
+    """Decode a list of equally sized packed entries into one (n, samples) float32 array."""
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=ECG_VALUES_DTYPE).reshape(len(blobs), -1)
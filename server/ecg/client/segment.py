@@ -0,0 +1,15 @@
+# ecg/client/segment.py
+# Beat segmentation for raw/ streams lives next to the device code
+# (devices/ecg_segment.py) so the Jetson worker and this server cut beats the same way.
+import sys
+from django.conf import settings
+
+if str(settings.DEVICES_DIR) not in sys.path:
+    sys.path.append(str(settings.DEVICES_DIR))
+
+from ecg_segment import (  # noqa: E402
+    BEAT_LENGTH,
+    SAMPLE_RATE_HZ,
+    BeatSegmenter,
+    SegmenterPool,
+)
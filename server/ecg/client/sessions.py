@@ -0,0 +1,165 @@
+# ecg/client/sessions.py
+import time
+
+# Redis index of running recordings: (doctor, patient) -> session id, plus the
+# set of active session ids, so ingest and persistence never query Postgres
+ACTIVE_SESSIONS_KEY = "ecg:active_sessions"
+ACTIVE_SESSION_IDS_KEY = "ecg:active_session_ids"
+ACTIVE_SESSION_FIELD_FRMT = "{doctor_id}/{patient_id}"
+# Stopped sessions whose beat stream still awaits persistence or inference:
+# session id -> "<doctor>/<patient>", removed when ecg.tasks drops the stream
+DRAINING_SESSIONS_KEY = "ecg:draining_sessions"
+SESSION_STREAM_FRMT = "ecg:session:{session_id}"
+PREDICTION_STREAM_FRMT = "ecg:predictions:{session_id}"
+# Last ecg:session:<id> entry classified, per stream. The server fallback
+# (ecg.inference) moves it to the last entry it classified. Edge predictions
+# carry the frame seq of the message they classified, which ingest also
+# stores in each beat's entry, and move it to the newest entry with that seq.
+# Either side can thus take over from the other without classifying beats
+# twice or skipping any; persistence never trims a stream past it
+INFERENCE_CURSORS_KEY = "ecg:inference:cursors"
+# Edge predictions are matched against this many of the stream's newest entries
+CLASSIFIED_SEQ_WINDOW = 256
+# KEYS: cursors hash, stream. ARGV: entry id, or "" followed by a frame seq
+# and how many of the newest entries to search for it. Only ever moves the
+# cursor forward, and never for a deleted stream; returns 1 if it moved
+ADVANCE_CURSOR_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then return 0 end
+local id = ARGV[1]
+if id == '' then
+    for _, entry in ipairs(redis.call('XREVRANGE', KEYS[2], '+', '-', 'COUNT', ARGV[3])) do
+        local fields = entry[2]
+        for i = 1, #fields, 2 do
+            if fields[i] == 'seq' and fields[i + 1] == ARGV[2] then id = entry[1] end
+        end
+        if id ~= '' then break end
+    end
+    if id == '' then return 0 end
+end
+local current = redis.call('HGET', KEYS[1], KEYS[2])
+if current then
+    local ms, seq = string.match(current, '(%d+)-(%d+)')
+    local new_ms, new_seq = string.match(id, '(%d+)-(%d+)')
+    ms, seq, new_ms, new_seq = tonumber(ms), tonumber(seq), tonumber(new_ms), tonumber(new_seq)
+    if new_ms < ms or (new_ms == ms and new_seq <= seq) then return 0 end
+end
+redis.call('HSET', KEYS[1], KEYS[2], id)
+return 1
+"""
+# Streams written before they were keyed by session: one per doctor/patient,
+# with "session_id" marker entries between the readings
+LEGACY_SESSION_STREAM_FRMT = "ecg:session:{doctor_id}/{patient_id}"
+
+
+def session_stream_key(session_id) -> str:
+    return SESSION_STREAM_FRMT.format(session_id=session_id)
+
+
+def prediction_stream_key(session_id) -> str:
+    return PREDICTION_STREAM_FRMT.format(session_id=session_id)
+
+
+def session_id_from_stream_key(stream_key):
+    """Session id encoded in an ecg:session:<id> / ecg:predictions:<id> key, or None."""
+    suffix = stream_key.rsplit(":", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def stream_id_order(entry_id):
+    """Sort key of a stream entry id ("<ms>-<seq>", str or bytes)."""
+    ms, _, seq = (entry_id.decode() if isinstance(entry_id, bytes) else entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def advance_inference_cursor(redis_client, stream_key, entry_id):
+    """Move ``stream_key``'s inference cursor forward to ``entry_id``.
+
+    Returns the (awaitable, for async clients or pipelines) script reply.
+    """
+    return redis_client.eval(ADVANCE_CURSOR_SCRIPT, 2, INFERENCE_CURSORS_KEY, stream_key, entry_id)
+
+
+def advance_inference_cursor_to_seq(redis_client, stream_key, seq, window=CLASSIFIED_SEQ_WINDOW):
+    """Move the cursor forward to the newest entry stored from frame ``seq``, if still among the last ``window``."""
+    return redis_client.eval(ADVANCE_CURSOR_SCRIPT, 2, INFERENCE_CURSORS_KEY, stream_key, "", seq, window)
+
+
+def is_legacy_stream_key(stream_key) -> bool:
+    """True for an ecg:session:<doctor>/<patient> stream (see LEGACY_SESSION_STREAM_FRMT)."""
+    return stream_key.startswith("ecg:session:") and "/" in stream_key
+
+
+def activate_session(redis_client, doctor_id, patient_id, session_id):
+    field = ACTIVE_SESSION_FIELD_FRMT.format(doctor_id=doctor_id, patient_id=patient_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(ACTIVE_SESSIONS_KEY, field, session_id)
+    pipe.sadd(ACTIVE_SESSION_IDS_KEY, session_id)
+    pipe.execute()
+
+
+def deactivate_session(redis_client, doctor_id, patient_id, session_id):
+    field = ACTIVE_SESSION_FIELD_FRMT.format(doctor_id=doctor_id, patient_id=patient_id)
+    pipe = redis_client.pipeline()
+    pipe.hdel(ACTIVE_SESSIONS_KEY, field)
+    pipe.srem(ACTIVE_SESSION_IDS_KEY, session_id)
+    pipe.hset(DRAINING_SESSIONS_KEY, session_id, field)
+    pipe.execute()
+
+
+def get_active_session(redis_client, doctor_id, patient_id):
+    field = ACTIVE_SESSION_FIELD_FRMT.format(doctor_id=doctor_id, patient_id=patient_id)
+    session_id = redis_client.hget(ACTIVE_SESSIONS_KEY, field)
+    return int(session_id) if session_id is not None else None
+
+
+async def aget_active_session(redis_client, doctor_id, patient_id):
+    """``get_active_session`` for a ``redis.asyncio`` client."""
+    field = ACTIVE_SESSION_FIELD_FRMT.format(doctor_id=doctor_id, patient_id=patient_id)
+    session_id = await redis_client.hget(ACTIVE_SESSIONS_KEY, field)
+    return int(session_id) if session_id is not None else None
+
+
+def is_session_active(redis_client, session_id) -> bool:
+    return bool(redis_client.sismember(ACTIVE_SESSION_IDS_KEY, session_id))
+
+
+class ActiveSessionCache:
+    """Per-process cache in front of the Redis session index.
+
+    Active sessions are answered locally for ``ttl`` seconds, so the ingest
+    hot path only reaches Redis about once per patient per ``ttl``. A stopped
+    session may keep receiving beats for at most ``ttl`` seconds.
+
+    ``get`` takes a regular Redis client, ``aget`` a ``redis.asyncio`` one.
+    """
+
+    def __init__(self, redis_client, ttl=1.0):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.entries = {}
+
+    def cached(self, doctor_id, patient_id):
+        entry = self.entries.get((doctor_id, patient_id))
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def remember(self, doctor_id, patient_id, session_id):
+        # Misses are not cached so a freshly started session is seen immediately
+        if session_id is not None:
+            self.entries[(doctor_id, patient_id)] = (session_id, time.monotonic() + self.ttl)
+        else:
+            self.entries.pop((doctor_id, patient_id), None)
+        return session_id
+
+    def get(self, doctor_id, patient_id):
+        session_id = self.cached(doctor_id, patient_id)
+        if session_id is None:
+            session_id = self.remember(doctor_id, patient_id, get_active_session(self.redis, doctor_id, patient_id))
+        return session_id
+
+    async def aget(self, doctor_id, patient_id):
+        session_id = self.cached(doctor_id, patient_id)
+        if session_id is None:
+            session_id = self.remember(doctor_id, patient_id, await aget_active_session(self.redis, doctor_id, patient_id))
+        return session_id
@@ -0,0 +1,106 @@
+# ecg/client/writer.py
+import asyncio
+import time
+from collections import deque
+import numpy as np
+from loguru import logger
+from redis.exceptions import RedisError
+
+STREAM_MAXLEN = 10000
+
+
+class BufferedStreamWriter:
+    """Buffers XADDs and writes them through one non-transactional pipeline.
+
+    A flush happens once ``max_entries`` entries are pending (see ``due``) or
+    ``max_delay`` seconds after the first buffered entry, whichever comes
+    first. Flushes are serialised so entries reach every stream in the order
+    they were added. Entries Redis rejects, or a whole pipeline on a
+    connection error, are retried up to ``retries`` times with exponential
+    backoff; after that they are dropped and counted. Must be used from a
+    single event loop.
+    """
+
+    def __init__(self, redis_client, max_entries=50, max_delay=0.02, retries=3,
+                 retry_delay=0.05, maxlen=STREAM_MAXLEN):
+        self.redis = redis_client
+        self.max_entries = max(1, max_entries)
+        self.max_delay = max_delay
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.maxlen = maxlen
+        self.buffer = []
+        self.timer = None
+        self.lock = asyncio.Lock()
+        self.flush_sizes = deque(maxlen=1024)
+        self.flush_latencies = deque(maxlen=1024)
+        self.counters = {
+            "added": 0,
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "retries": 0,
+        }
+
+    @property
+    def due(self) -> bool:
+        return len(self.buffer) >= self.max_entries
+
+    def add(self, stream_key, fields):
+        self.buffer.append((stream_key, fields))
+        self.counters["added"] += 1
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        async with self.lock:
+            entries, self.buffer = self.buffer, []
+            if not entries:
+                return
+            started = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                entries, error = await self._write(entries)
+                if not entries:
+                    break
+            else:
+                self.counters["dropped"] += len(entries)
+                logger.error(f"Dropped {len(entries)} stream entries after {self.retries} retries: {error}")
+            self.counters["flushes"] += 1
+            self.flush_latencies.append(time.perf_counter() - started)
+
+    async def _write(self, entries):
+        """Send ``entries`` in one pipeline; returns (entries that failed, last error)."""
+        pipe = self.redis.pipeline(transaction=False)
+        for stream_key, fields in entries:
+            pipe.xadd(stream_key, fields, maxlen=self.maxlen, approximate=True)
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except (RedisError, OSError) as e:
+            return entries, e
+        failed = [entry for entry, result in zip(entries, results) if isinstance(result, Exception)]
+        written = len(entries) - len(failed)
+        self.counters["written"] += written
+        self.flush_sizes.append(written)
+        errors = [result for result in results if isinstance(result, Exception)]
+        return failed, errors[-1] if errors else None
+
+    def stats(self):
+        sizes = np.asarray(self.flush_sizes, dtype=np.float64)
+        latencies = np.asarray(self.flush_latencies, dtype=np.float64) * 1000
+        stats = dict(self.counters, pending=len(self.buffer))
+        if sizes.size:
+            stats.update(flush_size_mean=float(sizes.mean()), flush_size_max=int(sizes.max()))
+        if latencies.size:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(flush_ms_p50=float(p50), flush_ms_p95=float(p95), flush_ms_p99=float(p99))
+        return stats
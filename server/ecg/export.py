@@ -0,0 +1,117 @@
+"""Streaming exporters for a recording session's ECG readings.
+
+Rows come off a server-side cursor in chunks of ``ECG_EXPORT_CHUNK_SIZE``
+and are encoded chunk by chunk, so memory use does not depend on how long
+the session is. The exporters are async generators (see ecg/streaming.py)
+so the ASGI handler streams them instead of buffering the file.
+"""
+import io
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Min
+from django.db.models.functions import Length
+from ecg.fields import PackedFloat32Field
+from ecg.models import SensorReadings
+from ecg.streaming import achunks
+
+EXPORT_FORMATS = {
+    "npy": ("application/octet-stream", "npy"),
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+SAMPLE_BYTES = PackedFloat32Field.dtype.itemsize
+
+
+class MixedSampleWidths(ValueError):
+    """The selected readings do not all hold the same number of samples."""
+
+
+def session_readings(session_id, start=None, end=None):
+    """Readings of a session in timestamp order, pinned to the rows that exist now.
+
+    Returns ``(queryset, count, samples)``, ``samples`` being the width of
+    every row (None when there are no rows). Bounding the ids keeps the row
+    count stable while a live session keeps writing, which the NPY header
+    relies on. Raises ``MixedSampleWidths`` when row widths differ, since no
+    export format can hold them.
+    """
+    readings = SensorReadings.objects.filter(session_id=session_id)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    stats = readings.aggregate(
+        count=Count("id"), max_id=Max("id"),
+        min_bytes=Min(Length("ecg_values")), max_bytes=Max(Length("ecg_values")),
+    )
+    if stats["min_bytes"] != stats["max_bytes"]:
+        raise MixedSampleWidths(
+            f"Readings hold between {stats['min_bytes'] // SAMPLE_BYTES} "
+            f"and {stats['max_bytes'] // SAMPLE_BYTES} samples"
+        )
+    samples = stats["min_bytes"] // SAMPLE_BYTES if stats["min_bytes"] is not None else None
+    if stats["max_id"] is not None:
+        readings = readings.filter(id__lte=stats["max_id"])
+    return readings.order_by("timestamp", "id"), stats["count"], samples
+
+
+async def iter_chunks(readings):
+    """Yield (timestamps datetime64[us], (n, samples) float32) per chunk."""
+    chunk_size = settings.ECG_EXPORT_CHUNK_SIZE
+    rows = readings.values_list("timestamp", "ecg_values").iterator(chunk_size=chunk_size)
+    async for chunk in achunks(rows, chunk_size):
+        timestamps = np.array([ts.replace(tzinfo=None) for ts, _ in chunk], dtype="datetime64[us]")
+        yield timestamps, np.stack([values for _, values in chunk])
+
+
+async def stream_npy(readings, count, samples):
+    """Structured NPY: fields ``timestamp`` (datetime64[us], UTC) and ``ecg`` (float32[samples])."""
+    dtype = np.dtype([("timestamp", "<M8[us]"), ("ecg", "<f4", (samples,))])
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)}
+    )
+    yield header.getvalue()
+
+    written = 0
+    async for timestamps, values in iter_chunks(readings):
+        n = min(len(timestamps), count - written)
+        block = np.zeros(n, dtype=dtype)
+        block["timestamp"] = timestamps[:n]
+        block["ecg"] = values[:n]
+        yield block.tobytes()
+        written += n
+        if written == count:
+            break
+    # Rows deleted mid-export: pad so the file still matches its header
+    if written < count:
+        yield np.zeros(count - written, dtype=dtype).tobytes()
+
+
+async def stream_csv(readings, samples):
+    yield "timestamp," + ",".join(f"v{i}" for i in range(samples)) + "\n"
+    async for timestamps, values in iter_chunks(readings):
+        out = io.StringIO()
+        np.savetxt(out, values, fmt="%.7g", delimiter=",")
+        stamps = np.datetime_as_string(timestamps, unit="us", timezone="UTC")
+        yield "".join(f"{stamp},{line}\n" for stamp, line in zip(stamps, out.getvalue().splitlines()))
+
+
+async def stream_arrow(readings, samples):
+    """Arrow IPC stream with ``timestamp`` (timestamp[us, UTC]) and ``ecg`` (fixed_size_list<float32>)."""
+    import pyarrow as pa
+
+    schema = pa.schema([
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("ecg", pa.list_(pa.float32(), samples)),
+    ])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    async for timestamps, values in iter_chunks(readings):
+        ecg = pa.FixedSizeListArray.from_arrays(pa.array(values.ravel(), type=pa.float32()), samples)
+        writer.write_batch(pa.record_batch([pa.array(timestamps, type=schema.field("timestamp").type), ecg], schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
@@ -0,0 +1,216 @@
+"""Server-side beat classification for when no edge worker is online.
+
+``manage.py run_inference`` runs a ``FallbackInference`` loop. While an edge
+inference worker (``devices/jetson/worker.py``) has sent a heartbeat within
+``INFERENCE_EDGE_TIMEOUT`` seconds it stays idle. Otherwise it reads new
+beats from the ``ecg:session:<id>`` streams of active sessions, classifies
+everything it read in one batched ``ECGTFLiteModel`` call (the same code
+the Jetson runs) and publishes the results the way ingest handles an edge
+prediction: an ``ecg:predictions:<id>`` stream entry, persisted as
+``BeatPrediction`` rows, and a ``send.prediction`` group_send per message.
+
+Both paths share one cursor per session stream (``INFERENCE_CURSORS_KEY``):
+ingest advances it when edge predictions arrive and this loop when it has
+classified beats, so a takeover starts after the beats the other side
+already classified instead of classifying them again. Streams of stopped
+sessions are classified to the end too (``DRAINING_SESSIONS_KEY``), since
+persistence keeps them until this cursor reaches their last entry.
+"""
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+import numpy as np
+from django.conf import settings
+from loguru import logger
+from ecg.client.bridge import gather_bounded
+from ecg.client.devices import EDGE_WORKER_HEARTBEATS_KEY, SERVER_INFERENCE_HEARTBEATS_KEY, record_heartbeats
+from ecg.client.mqtt import GROUP_NAME, patient_partition
+from ecg.client.sessions import (
+    ACTIVE_SESSIONS_KEY, DRAINING_SESSIONS_KEY, INFERENCE_CURSORS_KEY, advance_inference_cursor,
+    session_stream_key, prediction_stream_key,
+)
+from ecg.client.writer import BufferedStreamWriter
+from ecg.tasks import decode_ecg_entries
+
+INPUT_LENGTH = 187
+
+
+def load_model(model_path=None, max_batch=None, num_threads=None):
+    """``ECGTFLiteModel`` from devices/jetson, with buckets sized for server batches."""
+    jetson_dir = str(settings.DEVICES_DIR / "jetson")
+    if jetson_dir not in sys.path:
+        sys.path.append(jetson_dir)
+    from tflite_model import ECGTFLiteModel
+
+    max_batch = max_batch or settings.INFERENCE_MAX_BATCH
+    buckets = sorted({1, 16, min(64, max_batch), max_batch})
+    return ECGTFLiteModel(
+        model_path or settings.INFERENCE_MODEL_PATH,
+        buckets=buckets,
+        num_threads=num_threads or settings.INFERENCE_THREADS,
+    )
+
+
+class FallbackInference:
+    """Classifies beats from the session streams while no edge worker is online.
+
+    Each ``step`` blocks up to ``block_ms`` on one XREAD over the streams of
+    every active or draining session this process owns
+    (``partitions``/``partition`` split patients like ``MQTT_PARTITIONS``),
+    reading at most ``max_batch`` entries per stream. All beats read are
+    classified together, prediction entries are written through a
+    ``BufferedStreamWriter`` and the cursors advanced once they are
+    written. Cursors are re-read from Redis on every takeover, since the
+    edge moved them while this process was on standby; a session nobody
+    has classified yet starts at its first entry. Edge heartbeats and the
+    sessions are re-read every ``check_interval`` seconds, and while
+    classifying the process records its own heartbeat so persistence waits
+    for it; ``force`` ignores the edge.
+    """
+
+    def __init__(self, model, redis_client, channel_layer=None, max_batch=None, block_ms=None,
+                 edge_timeout=None, partitions=1, partition=0, force=False, check_interval=1.0):
+        self.model = model
+        self.redis = redis_client
+        self.channel_layer = channel_layer
+        self.max_batch = max_batch or settings.INFERENCE_MAX_BATCH
+        self.block_ms = block_ms or settings.INFERENCE_BLOCK_MS
+        self.edge_timeout = settings.INFERENCE_EDGE_TIMEOUT if edge_timeout is None else edge_timeout
+        self.partitions = max(1, partitions)
+        self.partition = partition
+        self.force = force
+        self.check_interval = check_interval
+        self.worker_id = f"run_inference:{self.partition}/{self.partitions}"
+        self.writer = BufferedStreamWriter(redis_client, max_entries=self.max_batch)
+        self.active = False
+        self.next_check = 0.0
+        self.sessions = {}      # stream key -> (session id, doctor id, patient id)
+        self.cursors = {}       # stream key -> last classified entry id
+        self.batch_sizes = deque(maxlen=1024)
+        self.latencies = deque(maxlen=1024)
+        self.counters = {
+            "batches": 0,
+            "messages": 0,
+            "beats": 0,
+            "malformed": 0,
+        }
+
+    async def edge_online(self) -> bool:
+        latest = await self.redis.zrange(EDGE_WORKER_HEARTBEATS_KEY, -1, -1, withscores=True)
+        return bool(latest) and time.time() - latest[0][1] <= self.edge_timeout
+
+    async def refresh(self):
+        active = self.force or not await self.edge_online()
+        if active != self.active:
+            logger.warning("No edge worker online, classifying on the server" if active
+                           else "Edge worker online, server inference on standby")
+            self.active = active
+            self.cursors.clear()
+        if not active:
+            return
+        await record_heartbeats(self.redis, {self.worker_id: time.time()}, SERVER_INFERENCE_HEARTBEATS_KEY)
+
+        pairs = [(field, session_id) for field, session_id in (await self.redis.hgetall(ACTIVE_SESSIONS_KEY)).items()]
+        pairs += [(field, session_id) for session_id, field in (await self.redis.hgetall(DRAINING_SESSIONS_KEY)).items()]
+        sessions = {}
+        for field, session_id in pairs:
+            doctor_id, patient_id = (field.decode() if isinstance(field, bytes) else field).split("/")
+            if patient_partition(doctor_id, patient_id, self.partitions) == self.partition:
+                sessions[session_stream_key(int(session_id))] = (int(session_id), doctor_id, patient_id)
+        new = [key for key in sessions if key not in self.cursors]
+        if new:
+            stored = await self.redis.hmget(INFERENCE_CURSORS_KEY, new)
+            for key, cursor in zip(new, stored):
+                self.cursors[key] = cursor.decode() if isinstance(cursor, bytes) else cursor or "0-0"
+        # Streams persistence has dropped; it also removed their cursors
+        for key in [key for key in self.cursors if key not in sessions]:
+            del self.cursors[key]
+        self.sessions = sessions
+
+    async def step(self) -> int:
+        """Classify one XREAD worth of beats; returns the number of beats classified."""
+        if time.monotonic() >= self.next_check:
+            self.next_check = time.monotonic() + self.check_interval
+            await self.refresh()
+        if not self.active or not self.sessions:
+            await asyncio.sleep(self.block_ms / 1000)
+            return 0
+
+        replies = await self.redis.xread(
+            {key: self.cursors[key] for key in self.sessions}, count=self.max_batch, block=self.block_ms,
+        )
+        beats, messages, cursors = [], [], {}
+        for stream_key, entries in replies or []:
+            stream_key = stream_key.decode() if isinstance(stream_key, bytes) else stream_key
+            cursors[stream_key] = entries[-1][0].decode()
+            for _, values in decode_ecg_entries(stream_key, entries):
+                if not len(values) or len(values) % INPUT_LENGTH:
+                    self.counters["malformed"] += 1
+                    continue
+                beats.append(values)
+                messages.append((stream_key, len(values) // INPUT_LENGTH))
+        if not cursors:
+            return 0
+
+        classified = 0
+        if beats:
+            started = time.perf_counter()
+            labels, confidences = self.model.predict(np.concatenate(beats).reshape(-1, INPUT_LENGTH, 1))
+            self.latencies.append(time.perf_counter() - started)
+            classified = len(labels)
+            self.batch_sizes.append(classified)
+            await self.publish(messages, labels, confidences.tolist())
+        # Cursors only move once the predictions are in Redis
+        await self.writer.flush()
+        self.cursors.update(cursors)
+        pipe = self.redis.pipeline(transaction=False)
+        for stream_key, entry_id in cursors.items():
+            advance_inference_cursor(pipe, stream_key, entry_id)
+        await pipe.execute()
+        self.counters["batches"] += 1
+        self.counters["messages"] += len(messages)
+        self.counters["beats"] += classified
+        return classified
+
+    async def publish(self, messages, labels, confidences):
+        events, offset = [], 0
+        for stream_key, count in messages:
+            session_id, doctor_id, patient_id = self.sessions[stream_key]
+            prediction = labels[offset:offset + count]
+            confidence = confidences[offset:offset + count]
+            offset += count
+            self.writer.add(prediction_stream_key(session_id), {
+                "ts": time.time_ns(),
+                "labels": json.dumps(prediction),
+                "confidences": json.dumps(confidence),
+            })
+            if self.channel_layer:
+                events.append(self.channel_layer.group_send(
+                    GROUP_NAME.format(doctor_id=doctor_id, patient_id=patient_id),
+                    {"type": "send.prediction", "data": {"prediction": prediction, "confidence": confidence}},
+                ))
+        for result in await gather_bounded(events, settings.MQTT_INGEST_CONCURRENCY):
+            if isinstance(result, Exception):
+                logger.error(f"Prediction group_send failed: {result}")
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                await self.step()
+            except Exception as e:
+                logger.exception(f"Server inference step failed: {e}")
+                await asyncio.sleep(1)
+        await self.writer.flush()
+
+    def stats(self):
+        sizes = np.asarray(self.batch_sizes, dtype=np.float64)
+        latencies = np.asarray(self.latencies, dtype=np.float64) * 1000
+        stats = dict(self.counters, active=self.active, sessions=len(self.sessions), writer=self.writer.stats())
+        if sizes.size:
+            stats.update(batch_size_mean=float(sizes.mean()), batch_size_max=int(sizes.max()))
+        if latencies.size:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(predict_ms_p50=float(p50), predict_ms_p95=float(p95), predict_ms_p99=float(p99))
+        return stats
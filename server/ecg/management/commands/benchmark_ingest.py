@@ -0,0 +1,218 @@
+import json
+import platform
+import sys
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from loguru import logger
+from ecg.client.redis import use_fake_redis
+
+# Stand-in for paho's MQTTMessage: on_message only reads these two attributes
+Message = namedtuple("Message", ["topic", "payload"])
+BENCH_NAME = "ingest-benchmark"
+
+
+def percentiles(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    if not values.size:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(values.max()),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the ingest path end to end: MQTTClient.on_message -> ingest loop -> "
+        "Redis stream -> drain_session_stream -> SensorReadings. Beats are handed to "
+        "on_message the way paho's network thread does, so no broker is needed. "
+        "Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=20, help="Simulated patients, one session each")
+        parser.add_argument("--rate", type=float, default=4.0,
+                            help="Beats per second per patient; 0 publishes as fast as possible")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to publish for")
+        parser.add_argument("--codec", choices=("json", "float32", "int16"), default="float32")
+        parser.add_argument("--samples", type=int, default=187, help="Samples per beat")
+        parser.add_argument("--persist-interval", type=float, default=1.0,
+                            help="Seconds between persistence passes (the Celery beat runs every 5)")
+        parser.add_argument("--drain-timeout", type=float, default=60.0,
+                            help="Seconds to wait for persistence to catch up after publishing")
+        parser.add_argument("--fakeredis", action="store_true",
+                            help="Use an in-memory fakeredis server and channel layer instead of REDIS_URL")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+        parser.add_argument("--log-level", default="WARNING", help="loguru level while the benchmark runs")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark sessions and readings")
+
+    def handle(self, *args, **options):
+        logger.remove()
+        logger.add(sys.stderr, level=options["log_level"])
+        if options["patients"] < 1 or options["duration"] <= 0:
+            raise CommandError("--patients must be at least 1 and --duration positive")
+        if options["fakeredis"]:
+            try:
+                use_fake_redis()
+            except ImportError:
+                raise CommandError("--fakeredis needs the fakeredis package")
+
+        # Imported after use_fake_redis() so new clients are fakes from the start
+        from channels.layers import InMemoryChannelLayer
+        from ecg.client.mqtt import MQTTClient
+        from ecg.client.frame import encode_payload
+        from ecg.client.redis import get_redis
+        from ecg.client.sessions import activate_session, deactivate_session, session_stream_key
+        from ecg.models import Doctor, Patient, RecordingSession, SensorReadings
+        from ecg.tasks import drain_session_stream, build_sensor_readings, drop_stream
+
+        r = get_redis()
+        doctor = Doctor.objects.create(full_name=f"{BENCH_NAME}-{time.time_ns()}", password="!")
+        patients = Patient.objects.bulk_create(
+            Patient(full_name=f"{BENCH_NAME}-{i}", password="!") for i in range(options["patients"])
+        )
+        sessions = RecordingSession.objects.bulk_create(
+            RecordingSession(doctor=doctor, patient=patient) for patient in patients
+        )
+        for session in sessions:
+            activate_session(r, doctor.id, session.patient_id, session.id)
+
+        topics = [(f"stream/{doctor.id}/{session.patient_id}", session.id) for session in sessions]
+        publish_ns = {session.id: [] for session in sessions}
+        persisted = {session.id: 0 for session in sessions}
+        on_message_ms, end_to_end_ms = [], []
+        stop = threading.Event()
+
+        def persist_loop():
+            # Runs drain_session_stream like persist_ecg_stream does, and pairs
+            # every committed row with its publish time (per-session order is kept)
+            deadline = None
+            try:
+                while True:
+                    if stop.is_set() and deadline is None:
+                        deadline = time.monotonic() + options["drain_timeout"]
+                    rows = 0
+                    for session_id in publish_ns:
+                        n = drain_session_stream(session_stream_key(session_id), SensorReadings, build_sensor_readings)
+                        if n:
+                            committed = time.time_ns()
+                            start = persisted[session_id]
+                            sent = publish_ns[session_id][start:start + n]
+                            end_to_end_ms.extend((committed - t) / 1e6 for t in sent)
+                            persisted[session_id] = start + n
+                        rows += n
+                    if deadline is not None and (not rows or time.monotonic() > deadline):
+                        break
+                    if not rows:
+                        stop.wait(options["persist_interval"])
+            finally:
+                connection.close()
+
+        client = MQTTClient(share_group="", partitions=1, partition=0)
+        if options["fakeredis"]:
+            client.channel_layer = InMemoryChannelLayer()
+        client.bridge.start()
+        persister = threading.Thread(target=persist_loop, name="benchmark-persist", daemon=True)
+        persister.start()
+
+        payload = encode_payload(np.random.default_rng(0).random(options["samples"], dtype=np.float32),
+                                 options["codec"])
+        interval = 1.0 / (options["rate"] * len(topics)) if options["rate"] else 0.0
+        published, max_behind = 0, 0.0
+        started = time.perf_counter()
+        next_at, end = started, started + options["duration"]
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            if interval:
+                # Drift-free schedule: sleep to the next slot, never re-anchor on now
+                if next_at > now:
+                    time.sleep(next_at - now)
+                else:
+                    max_behind = max(max_behind, now - next_at)
+                next_at += interval
+            topic, session_id = topics[published % len(topics)]
+            publish_ns[session_id].append(time.time_ns())
+            call_started = time.perf_counter_ns()
+            client.on_message(None, None, Message(topic, payload))
+            on_message_ms.append((time.perf_counter_ns() - call_started) / 1e6)
+            published += 1
+        publish_seconds = time.perf_counter() - started
+
+        client.bridge.stop(timeout=options["drain_timeout"])
+        ingest_seconds = time.perf_counter() - started
+        stop.set()
+        persister.join()
+        persist_seconds = time.perf_counter() - started
+
+        # Row timestamps are the ingest loop's handling time ("ts" of the stream entry)
+        ingest_ms = []
+        for session_id, sent in publish_ns.items():
+            handled = SensorReadings.objects.filter(session_id=session_id).order_by("timestamp", "id")
+            for publish_time, timestamp in zip(sent, handled.values_list("timestamp", flat=True)):
+                ingest_ms.append((timestamp.timestamp() * 1e9 - publish_time) / 1e6)
+
+        stats = client.stats()
+        total_persisted = sum(persisted.values())
+        report = {
+            "config": {
+                key: options[key]
+                for key in ("patients", "rate", "duration", "codec", "samples", "persist_interval", "fakeredis")
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "redis": "fakeredis" if options["fakeredis"] else "REDIS_URL",
+                "ingest_max_batch": settings.MQTT_INGEST_MAX_BATCH,
+                "flush_entries": settings.MQTT_INGEST_FLUSH_ENTRIES,
+                "flush_ms": settings.MQTT_INGEST_FLUSH_MS,
+            },
+            "published": published,
+            "offered_msgs_per_sec": options["rate"] * len(topics) or None,
+            "publish_msgs_per_sec": published / publish_seconds,
+            "publisher_max_behind_ms": max_behind * 1000,
+            "ingested": stats["writer"].get("written", 0),
+            "ingest_msgs_per_sec": stats["writer"].get("written", 0) / ingest_seconds,
+            "persisted": total_persisted,
+            "persist_msgs_per_sec": total_persisted / persist_seconds,
+            "persistence_tail_seconds": persist_seconds - publish_seconds,
+            "dropped": stats["bridge"]["dropped"] + stats["writer"].get("dropped", 0),
+            # Latency pairing assumes nothing was dropped
+            "latency_exact": published == total_persisted,
+            "stages_ms": {
+                "on_message": percentiles(on_message_ms),
+                "publish_to_ingest": percentiles(ingest_ms),
+                "redis_flush": {
+                    key.replace("flush_ms_", ""): value
+                    for key, value in stats["writer"].items() if key.startswith("flush_ms_")
+                },
+                "publish_to_persisted": percentiles(end_to_end_ms),
+            },
+            "bridge": stats["bridge"],
+            "writer": stats["writer"],
+        }
+
+        for session in sessions:
+            deactivate_session(r, doctor.id, session.patient_id, session.id)
+            if not options["keep"]:
+                drop_stream(session_stream_key(session.id))
+        if not options["keep"]:
+            Patient.objects.filter(id__in=[patient.id for patient in patients]).delete()
+            doctor.delete()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,71 @@
+import asyncio
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from loguru import logger
+from channels.layers import get_channel_layer
+from ecg.client.redis import get_redis, get_async_redis
+from ecg.inference import FallbackInference, load_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Classify beats from the Redis session streams on this server while no edge "
+        "inference worker is online. Use --partitions/--partition to run several."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default=None, help="TFLite model (default: INFERENCE_MODEL_PATH)")
+        parser.add_argument("--max-batch", type=int, default=None,
+                            help="Stream entries read per session per batch (default: INFERENCE_MAX_BATCH)")
+        parser.add_argument("--threads", type=int, default=None,
+                            help="Interpreter threads (default: INFERENCE_THREADS)")
+        parser.add_argument("--partitions", type=int, default=1, help="Number of hash partitions")
+        parser.add_argument("--partition", type=int, default=0, help="Partition handled by this process")
+        parser.add_argument("--force", action="store_true", help="Classify even while an edge worker is online")
+        parser.add_argument("--stats-interval", type=float, default=30.0,
+                            help="Seconds between stats log lines, 0 to disable")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["partition"] < max(1, options["partitions"]):
+            raise CommandError(f"--partition must be in [0, {options['partitions']})")
+        try:
+            get_redis().ping()
+        except Exception as e:
+            raise CommandError(f"Redis unavailable at {settings.REDIS_URL}: {e}")
+        try:
+            model = load_model(options["model"], options["max_batch"], options["threads"])
+        except Exception as e:
+            raise CommandError(f"Could not load the TFLite model: {e}")
+        asyncio.run(self.run(model, options))
+
+    async def run(self, model, options):
+        engine = FallbackInference(
+            model,
+            get_async_redis(decode_responses=False),
+            channel_layer=get_channel_layer(),
+            max_batch=options["max_batch"],
+            partitions=options["partitions"],
+            partition=options["partition"],
+            force=options["force"],
+        )
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        async def log_stats(interval):
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except asyncio.TimeoutError:
+                    logger.info(f"Server inference stats | {engine.stats()}")
+
+        stats_task = asyncio.ensure_future(log_stats(options["stats_interval"])) if options["stats_interval"] else None
+        logger.info(f"Server inference started | partition={options['partition']}/{options['partitions']}")
+        try:
+            await engine.run(stop)
+        finally:
+            if stats_task:
+                stats_task.cancel()
+            logger.info(f"Server inference stats | {engine.stats()}")
@@ -0,0 +1,51 @@
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from loguru import logger
+from ecg.client.mqtt import MQTTClient
+from ecg.client.redis import get_redis
+
+
+class Command(BaseCommand):
+    help = (
+        "Subscribe to device MQTT topics and ingest ECG beats and predictions. "
+        "Run one per core; use --share-group or --partitions/--partition to split the load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--share-group", default=None,
+                            help="MQTT v5 shared subscription group (default: MQTT_SHARE_GROUP)")
+        parser.add_argument("--partitions", type=int, default=None,
+                            help="Number of hash partitions (default: MQTT_PARTITIONS)")
+        parser.add_argument("--partition", type=int, default=None,
+                            help="Partition handled by this process (default: MQTT_PARTITION)")
+        parser.add_argument("--stats-interval", type=float, default=30.0,
+                            help="Seconds between ingest stats log lines, 0 to disable")
+
+    def handle(self, *args, **options):
+        try:
+            get_redis().ping()
+        except Exception as e:
+            raise CommandError(f"Redis unavailable at {settings.REDIS_URL}: {e}")
+        logger.info("Redis Available")
+
+        client = MQTTClient(
+            share_group=options["share_group"],
+            partitions=options["partitions"],
+            partition=options["partition"],
+        )
+        if not client.connect(subscribe=True):
+            client.disconnect()
+            raise CommandError(f"Could not connect to MQTT broker {settings.MQTT_HOST}:{settings.MQTT_PORT}")
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        interval = options["stats_interval"] or None
+        try:
+            while not stop.wait(interval):
+                logger.info(f"MQTT ingest stats | {client.stats()}")
+        finally:
+            client.disconnect()
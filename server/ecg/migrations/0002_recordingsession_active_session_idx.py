@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recordingsession',
+            index=models.Index(condition=models.Q(('stopped_at__isnull', True)), fields=['doctor', 'patient'], name='active_session_idx'),
+        ),
+    ]
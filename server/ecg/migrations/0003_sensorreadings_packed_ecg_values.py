@@ -0,0 +1,68 @@
+# Converts SensorReadings.ecg_values from JSON text to packed float32 bytea
+
+from django.db import migrations, models
+
+import ecg.fields
+
+BATCH_SIZE = 2000
+
+
+def pack_json_values(apps, schema_editor):
+    SensorReadings = apps.get_model("ecg", "SensorReadings")
+    batch = []
+    for reading in SensorReadings.objects.only("id", "ecg_values").iterator(chunk_size=BATCH_SIZE):
+        reading.ecg_samples = reading.ecg_values
+        batch.append(reading)
+        if len(batch) >= BATCH_SIZE:
+            SensorReadings.objects.bulk_update(batch, ["ecg_samples"])
+            batch = []
+    if batch:
+        SensorReadings.objects.bulk_update(batch, ["ecg_samples"])
+
+
+def unpack_to_json_values(apps, schema_editor):
+    SensorReadings = apps.get_model("ecg", "SensorReadings")
+    batch = []
+    for reading in SensorReadings.objects.only("id", "ecg_samples").iterator(chunk_size=BATCH_SIZE):
+        reading.ecg_values = reading.ecg_samples.tolist()
+        batch.append(reading)
+        if len(batch) >= BATCH_SIZE:
+            SensorReadings.objects.bulk_update(batch, ["ecg_values"])
+            batch = []
+    if batch:
+        SensorReadings.objects.bulk_update(batch, ["ecg_values"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg', '0002_recordingsession_active_session_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensorreadings',
+            name='ecg_samples',
+            field=ecg.fields.PackedFloat32Field(null=True),
+        ),
+        migrations.AlterField(
+            model_name='sensorreadings',
+            name='ecg_values',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(pack_json_values, unpack_to_json_values),
+        migrations.RemoveField(
+            model_name='sensorreadings',
+            name='ecg_values',
+        ),
+        migrations.RenameField(
+            model_name='sensorreadings',
+            old_name='ecg_samples',
+            new_name='ecg_values',
+        ),
+        migrations.AlterField(
+            model_name='sensorreadings',
+            name='ecg_values',
+            field=ecg.fields.PackedFloat32Field(),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg', '0003_sensorreadings_packed_ecg_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BeatPrediction',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('label', models.CharField(max_length=50)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='predictions', to='ecg.recordingsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'timestamp'], name='prediction_session_ts_idx')],
+            },
+        ),
+    ]
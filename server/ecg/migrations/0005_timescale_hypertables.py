@@ -0,0 +1,94 @@
+# Turns SensorReadings and BeatPrediction into TimescaleDB hypertables with
+# native compression and per-minute continuous aggregates. Skipped on
+# databases without the timescaledb extension (e.g. SQLite in development).
+
+from django.conf import settings
+from django.db import migrations
+
+HYPERTABLES = ("ecg_sensorreadings", "ecg_beatprediction")
+
+CONTINUOUS_AGGREGATES = {
+    "ecg_session_beats_1m": """
+        SELECT session_id,
+               time_bucket(INTERVAL '1 minute', "timestamp") AS bucket,
+               count(*) AS beats
+        FROM ecg_sensorreadings
+        GROUP BY session_id, bucket
+    """,
+    "ecg_session_classes_1m": """
+        SELECT session_id,
+               time_bucket(INTERVAL '1 minute', "timestamp") AS bucket,
+               label,
+               count(*) AS beats
+        FROM ecg_beatprediction
+        GROUP BY session_id, bucket, label
+    """,
+}
+
+
+def timescale_available(schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+        return cursor.fetchone() is not None
+
+
+def create_hypertables(apps, schema_editor):
+    if not timescale_available(schema_editor):
+        return
+    chunk_interval = settings.TIMESCALE_CHUNK_INTERVAL
+    compress_after = settings.TIMESCALE_COMPRESS_AFTER
+    with schema_editor.connection.cursor() as cursor:
+        for table in HYPERTABLES:
+            # Unique indexes of a hypertable must include the time column
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey')
+            cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")')
+            cursor.execute(
+                "SELECT create_hypertable(%s::regclass, 'timestamp', chunk_time_interval => %s::interval, migrate_data => true)",
+                [table, chunk_interval],
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} SET (timescaledb.compress, "
+                f"timescaledb.compress_segmentby = 'session_id', timescaledb.compress_orderby = '\"timestamp\"')"
+            )
+            cursor.execute(
+                "SELECT add_compression_policy(%s::regclass, %s::interval, if_not_exists => true)",
+                [table, compress_after],
+            )
+
+        for view, query in CONTINUOUS_AGGREGATES.items():
+            cursor.execute(
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} "
+                f"WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS {query} WITH NO DATA"
+            )
+            cursor.execute(
+                "SELECT add_continuous_aggregate_policy(%s::regclass, start_offset => INTERVAL '1 day', "
+                "end_offset => INTERVAL '1 minute', schedule_interval => INTERVAL '1 minute', if_not_exists => true)",
+                [view],
+            )
+
+
+def drop_continuous_aggregates(apps, schema_editor):
+    # Hypertables cannot be turned back into plain tables; only the
+    # aggregates and the compression policies are removed.
+    if not timescale_available(schema_editor):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for view in CONTINUOUS_AGGREGATES:
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view}")
+        for table in HYPERTABLES:
+            cursor.execute("SELECT remove_compression_policy(%s::regclass, if_exists => true)", [table])
+
+
+class Migration(migrations.Migration):
+    # Continuous aggregates cannot be created inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ecg', '0004_beatprediction'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_hypertables, drop_continuous_aggregates),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg', '0005_timescale_hypertables'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recordingsession',
+            index=models.Index(fields=['-started_at', '-id'], name='session_started_idx'),
+        ),
+    ]
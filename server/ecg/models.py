@@ -1,5 +1,7 @@
+import numpy as np
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
+from ecg.fields import PackedFloat32Field
 # from timescale.db.models.models import TimescaleModel
 
 class Doctor(models.Model):
@@ -42,6 +44,16 @@ class RecordingSession(models.Model):
     verdict = models.CharField(max_length=50, default='pending')
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            # Start/stop look up the running session of a doctor/patient pair
+            models.Index(
+                fields=["doctor", "patient"],
+                condition=models.Q(stopped_at__isnull=True),
+                name="active_session_idx",
+            ),
+            # Keyset pagination of the recordings list
+            models.Index(fields=["-started_at", "-id"], name="session_started_idx"),
+        ]
     def __str__(self):
         return f"Session {self.id} - Dr.{self.doctor_id} - Pt.{self.patient_id}"
 
@@ -52,11 +64,29 @@ class Device(models.Model):
     def __str__(self):
         return self.device_id
     
+class SensorReadingsQuerySet(models.QuerySet):
+    def as_array(self) -> np.ndarray:
+        """Readings in timestamp order as one (n, samples) float32 array."""
+        rows = list(self.order_by("timestamp").values_list("ecg_values", flat=True))
+        if not rows:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack(rows)
+
+    def session_array(self, session_id, start=None, end=None) -> np.ndarray:
+        """A session's readings (optionally within [start, end]) as an (n, 187) array."""
+        readings = self.filter(session_id=session_id)
+        if start is not None:
+            readings = readings.filter(timestamp__gte=start)
+        if end is not None:
+            readings = readings.filter(timestamp__lte=end)
+        return readings.as_array()
+
 class SensorReadings(models.Model):
     id = models.BigAutoField(primary_key=True)
     session = models.ForeignKey(RecordingSession,on_delete=models.CASCADE,related_name="sensor_readings")
     timestamp = models.DateTimeField(db_index=True)
-    ecg_values = models.JSONField() # 187 ECG values stored together
+    ecg_values = PackedFloat32Field() # 187 ECG values packed as float32
+    objects = SensorReadingsQuerySet.as_manager()
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -66,4 +96,16 @@ class SensorReadings(models.Model):
         ]
 
     def __str__(self):
-        return f"ECG @ {self.timestamp} | Session {self.id}"
\ No newline at end of file
+        return f"ECG @ {self.timestamp} | Session {self.id}"
+
+class BeatPrediction(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    session = models.ForeignKey(RecordingSession,on_delete=models.CASCADE,related_name="predictions")
+    timestamp = models.DateTimeField(db_index=True)
+    label = models.CharField(max_length=50)
+    confidence = models.FloatField(null=True, blank=True)
+    class Meta:
+        indexes = [models.Index(fields=["session", "timestamp"], name="prediction_session_ts_idx")]
+
+    def __str__(self):
+        return f"{self.label} @ {self.timestamp} | Session {self.session_id}"
@@ -0,0 +1,84 @@
+"""Keyset (cursor) pagination with streamed JSON output for list endpoints.
+
+Pages are selected with ``WHERE (a, b) < (cursor_a, cursor_b)`` on indexed
+columns instead of OFFSET, so every page costs the same no matter how deep
+the client has paged. Requests without ``limit`` or ``cursor`` get the whole
+list in one response (``next_cursor`` is null), so existing clients that do
+not page keep seeing every row. Rows are pulled from a server-side cursor in
+chunks and written to the response as they are serialized, so memory stays
+flat with list size.
+"""
+import base64
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from ecg.streaming import achunks
+
+
+class KeysetPagination:
+    def __init__(self, ordering, page_size=None, max_page_size=None):
+        # e.g. ("-started_at", "-id"); the last field must be unique
+        self.ordering = ordering
+        self.fields = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+        self.page_size = page_size or settings.ECG_LIST_PAGE_SIZE
+        self.max_page_size = max_page_size or settings.ECG_LIST_MAX_PAGE_SIZE
+
+    def encode_cursor(self, obj) -> str:
+        model = type(obj)
+        values = [model._meta.get_field(name).value_to_string(obj) for name, _ in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except Exception:
+            raise ValidationError({"cursor": "Invalid cursor"})
+
+    def after(self, queryset, cursor):
+        """Rows strictly after ``cursor`` in this ordering."""
+        values = self.decode_cursor(queryset.model, cursor)
+        condition, equal = Q(), Q()
+        for (name, descending), value in zip(self.fields, values):
+            condition |= equal & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal &= Q(**{name: value})
+        return queryset.filter(condition)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get("limit", self.page_size))
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer"})
+        return max(1, min(limit, self.max_page_size))
+
+    def paginate(self, queryset, request):
+        """Return (queryset of at most limit + 1 rows, limit), or (all rows, None) when not paging."""
+        cursor = request.query_params.get("cursor")
+        if not cursor and "limit" not in request.query_params:
+            return queryset.order_by(*self.ordering), None
+        if cursor:
+            queryset = self.after(queryset, cursor)
+        limit = self.get_limit(request)
+        return queryset.order_by(*self.ordering)[:limit + 1], limit
+
+    def stream_response(self, result_key, queryset, limit, serialize, chunk_size=500):
+        """Stream ``{result_key: [...], "next_cursor": ...}`` chunk by chunk."""
+        async def generate():
+            yield f'{{"{result_key}": ['
+            last, count, has_more = None, 0, False
+            rows = ((obj, serialize(obj)) for obj in queryset.iterator(chunk_size=chunk_size))
+            async for chunk in achunks(rows, chunk_size):
+                if limit is not None and count + len(chunk) > limit:
+                    chunk, has_more = chunk[:limit - count], True
+                if chunk:
+                    yield ("," if count else "") + ",".join(json.dumps(data, cls=DjangoJSONEncoder) for _, data in chunk)
+                    last, count = chunk[-1][0], count + len(chunk)
+                if has_more:
+                    break
+            next_cursor = self.encode_cursor(last) if has_more else None
+            yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+        return StreamingHttpResponse(generate(), content_type="application/json")
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+class TimeRangeSerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        start, end = attrs.get("start"), attrs.get("end")
+        if start and end and start > end:
+            raise serializers.ValidationError("start must be before end")
+        return attrs
+
+class ExportSerializer(TimeRangeSerializer):
+    format = serializers.ChoiceField(choices=["npy", "csv", "arrow"], default="npy")
@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.conf import settings
 from ecg.models import RecordingSession, Device
+from ecg.client.devices import is_online
 from rest_framework import serializers
 
 class RecordingSessionSerializer(serializers.ModelSerializer):
@@ -8,6 +10,35 @@ class RecordingSessionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class DeviceSerializer(serializers.ModelSerializer):
+    # From the Redis heartbeat hash, passed in as context["heartbeats"]
+    online = serializers.SerializerMethodField()
+    last_heartbeat = serializers.SerializerMethodField()
+
     class Meta:
         model = Device
         fields = '__all__'
+
+    def get_last_heartbeat(self, obj):
+        return self.context.get("heartbeats", {}).get(obj.device_id)
+
+    def get_online(self, obj):
+        return is_online(self.get_last_heartbeat(obj), settings.DEVICE_ONLINE_TIMEOUT)
+
+class RecordingFilterSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField(required=False)
+    patient = serializers.IntegerField(required=False)
+    active = serializers.BooleanField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+class PatientFilterSerializer(serializers.Serializer):
+    # Patients who share at least one recording session with this doctor
+    doctor = serializers.IntegerField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+class DoctorFilterSerializer(serializers.Serializer):
+    # Doctors who share at least one recording session with this patient
+    patient = serializers.IntegerField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
@@ -0,0 +1,22 @@
+"""Helpers for StreamingHttpResponse bodies under ASGI.
+
+Django's ASGI handler consumes a synchronous streaming body by running the
+whole iterator through ``sync_to_async`` first, which buffers the response
+in memory. Streaming views therefore hand it async generators, and those
+pull database rows through ``achunks``: each chunk is fetched (and
+transformed) on Django's sync thread, so server-side cursors and lazy model
+access keep working while only one chunk is held at a time.
+"""
+from itertools import islice
+from asgiref.sync import sync_to_async
+
+
+async def achunks(iterable, chunk_size):
+    """Yield lists of up to ``chunk_size`` items of a sync iterable, each read off the event loop."""
+    iterator = iter(iterable)
+    next_chunk = sync_to_async(lambda: list(islice(iterator, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        if not chunk:
+            return
+        yield chunk
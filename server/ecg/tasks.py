@@ -2,97 +2,397 @@ from celery import shared_task
 from django.db import transaction,IntegrityError
 from datetime import datetime
 import json
-from ecg.client.redis import get_redis
+import time
+from ecg.client.redis import get_binary_redis, unpack_ecg_values, ECG_SAMPLES_FIELD, ECG_VALUES_DTYPE
+from ecg.client.sessions import (
+    DRAINING_SESSIONS_KEY, INFERENCE_CURSORS_KEY, is_session_active, is_legacy_stream_key,
+    session_id_from_stream_key, stream_id_order,
+)
+from ecg.client.devices import (
+    DEVICE_HEARTBEATS_KEY, EDGE_WORKER_HEARTBEATS_KEY, SERVER_INFERENCE_HEARTBEATS_KEY, LEGACY_HEARTBEATS_KEYS,
+    get_heartbeats_since, prune_heartbeats,
+)
+from django.conf import settings
 from django.utils import timezone
 from datetime import timezone as dt_timezone
-from .models import SensorReadings,RecordingSession
+from .models import SensorReadings,RecordingSession,BeatPrediction,Device
 import redis
+import numpy as np
 import logging
 logger = logging.getLogger(__name__)
-r = get_redis()
+r = get_binary_redis()
 ECG_STREAM_NAME_PATTERN = "ecg:session:*"
+PREDICTION_STREAM_NAME_PATTERN = "ecg:predictions:*"
+ECG_CURSOR_FRMT = "ecg:cursor:{stream_key}"
+ECG_LOCK_FRMT = "ecg:lock:{stream_key}"
+ECG_PERSIST_LOCK_TIMEOUT = 60
+SAMPLES_FIELD = ECG_SAMPLES_FIELD.encode()
+# Unix time up to which device heartbeats were copied to Device.last_seen.
+# Each run re-reads this much before it, for ingest processes whose clocks lag
+HEARTBEAT_SYNC_CURSOR_KEY = "ecg:device_last_seen:synced"
+HEARTBEAT_SYNC_OVERLAP_S = 5.0
 
-def get_all_ecg_streams(redis_client:redis.Redis):
+def get_all_ecg_streams(redis_client:redis.Redis, pattern=ECG_STREAM_NAME_PATTERN):
     # https://www.dragonflydb.io/code-examples/getting-all-keys-matching-pattern-redis-python
-    return [stream_name for stream_name in redis_client.scan_iter(ECG_STREAM_NAME_PATTERN)]
+    return [
+        stream_name.decode() if isinstance(stream_name, bytes) else stream_name
+        for stream_name in redis_client.scan_iter(pattern)
+    ]
 
 
-@shared_task(
-    bind=True,
-    autoretry_for=(redis.RedisError, ConnectionError, TimeoutError),
-    retry_backoff=5,
-    retry_kwargs={"max_retries": 5},
-)
-def persist_ecg_stream(self, stream_key: str):
+def decode_ecg_entries(stream_key, entries):
+    """Decode raw stream entries into ``[(timestamp, values)]`` in stream order."""
+    decoded, blobs = [], []
+    for entry_id, data in entries:
+        try:
+            timestamp = datetime.fromtimestamp(int(data[b"ts"]) / 1e9, tz=dt_timezone.utc)
+            if SAMPLES_FIELD in data:
+                blob = data[SAMPLES_FIELD]
+                if len(blob) % ECG_VALUES_DTYPE.itemsize:
+                    raise ValueError(f"{len(blob)} bytes is not a whole number of samples")
+                values = blob
+            else:
+                # Entries written before samples were packed
+                values = np.asarray(json.loads(data[b"values"]), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Malformed ECG entry {entry_id} in {stream_key}: {e}")
+            continue
+        decoded.append((timestamp, values))
+        if isinstance(values, bytes):
+            blobs.append(values)
+
+    # Decode every packed entry in one vectorised pass when they are all the same size
+    if blobs and all(len(blob) == len(blobs[0]) for blob in blobs):
+        samples = iter(unpack_ecg_values(blobs))
+    else:
+        samples = (unpack_ecg_values([blob])[0] for blob in blobs)
+
+    return [
+        (timestamp, next(samples) if isinstance(values, bytes) else values)
+        for timestamp, values in decoded
+    ]
+
+
+def decode_prediction_entries(stream_key, entries):
+    """Decode prediction stream entries into ``[(timestamp, label, confidence)]``."""
+    decoded = []
+    for entry_id, data in entries:
+        try:
+            timestamp = datetime.fromtimestamp(int(data[b"ts"]) / 1e9, tz=dt_timezone.utc)
+            labels = json.loads(data[b"labels"])
+            confidences = json.loads(data[b"confidences"]) if b"confidences" in data else [None] * len(labels)
+        except Exception as e:
+            logger.warning(f"Malformed prediction entry {entry_id} in {stream_key}: {e}")
+            continue
+        decoded.extend((timestamp, label, confidence) for label, confidence in zip(labels, confidences))
+    return decoded
+
 
-    entries = r.xrange(stream_key, count=1)
-    if not entries:
-        logger.warning(f"Empty stream: {stream_key}")
-        return
+def drop_stream(stream_key, session_id=None):
+    """Delete a stream and its cursors; ``session_id`` also ends the session's draining."""
+    pipe = r.pipeline()
+    pipe.delete(stream_key, ECG_CURSOR_FRMT.format(stream_key=stream_key))
+    pipe.hdel(INFERENCE_CURSORS_KEY, stream_key)
+    if session_id is not None:
+        pipe.hdel(DRAINING_SESSIONS_KEY, session_id)
+    pipe.execute()
 
-    _, first_data = entries[0]
 
+def inference_online() -> bool:
+    """Whether an edge worker or ``manage.py run_inference`` sent a heartbeat within INFERENCE_EDGE_TIMEOUT."""
+    since = time.time() - settings.INFERENCE_EDGE_TIMEOUT
+    return any(r.zcount(key, since, "+inf") for key in (EDGE_WORKER_HEARTBEATS_KEY, SERVER_INFERENCE_HEARTBEATS_KEY))
+
+
+def trim_point(stream_key, last_id, follow_inference, online=True):
+    """Entry id a stream may be trimmed to once ``last_id`` is persisted.
+
+    Beat streams also wait for inference (edge or server) to classify them,
+    as long as some inference consumer is ``online``: they are trimmed to
+    the older of the two cursors, but never keep more than
+    ``ECG_INFERENCE_MAX_LAG_S`` of stream time before ``last_id``.
+    """
+    if not follow_inference or not online:
+        return last_id
+    last_ms, _ = stream_id_order(last_id)
+    trim_to = f"{max(0, last_ms - int(settings.ECG_INFERENCE_MAX_LAG_S * 1000))}-0"
+    classified = r.hget(INFERENCE_CURSORS_KEY, stream_key)
+    if classified is not None:
+        trim_to = max(trim_to, classified.decode(), key=stream_id_order)
+    return min(last_id, trim_to, key=stream_id_order)
+
+
+def inference_caught_up(stream_key, last_id, online=True) -> bool:
+    """Whether a stopped session's beat stream, persisted up to its newest entry ``last_id``, may be dropped.
+
+    True once inference has classified up to ``last_id``, when no inference
+    consumer is ``online``, or when ``last_id`` is older than
+    ``ECG_INFERENCE_MAX_LAG_S`` (the tail is then dropped unclassified).
+    """
+    if not online:
+        return True
+    classified = r.hget(INFERENCE_CURSORS_KEY, stream_key) or b"0-0"
+    if stream_id_order(classified) >= stream_id_order(last_id):
+        return True
+    age_s = time.time() - stream_id_order(last_id)[0] / 1000
+    if age_s <= settings.ECG_INFERENCE_MAX_LAG_S:
+        return False
+    logger.warning(f"Inference of {stream_key} is still behind {age_s:.0f}s after its last entry, dropping it")
+    return True
+
+
+def drain_session_stream(stream_key, model, build_rows, follow_inference=False):
+    """Persist entries added to a per-session stream since the last run.
+
+    The last persisted entry ID is kept in the ``ecg:cursor:<stream>`` hash.
+    Each run reads at most ``ECG_PERSIST_MAX_CHUNKS`` chunks of
+    ``ECG_PERSIST_CHUNK_SIZE`` new entries, turns each chunk into ``model``
+    rows with ``build_rows(session_id, entries)`` and trims everything up to
+    the cursor once the rows are committed. Streams of stopped sessions are
+    deleted once fully persisted. With ``follow_inference`` (beat streams)
+    both also wait for inference to classify the entries, see
+    ``trim_point`` and ``inference_caught_up``. Returns the number of rows
+    written.
+    """
+    session_id = session_id_from_stream_key(stream_key)
+    if session_id is None:
+        logger.warning(f"{stream_key} is not a session stream, skipping")
+        return 0
+
+    lock = r.lock(ECG_LOCK_FRMT.format(stream_key=stream_key), timeout=ECG_PERSIST_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        logger.info(f"{stream_key} is already being persisted, skipping")
+        return 0
+
+    persisted = 0
     try:
-        session_id = int(first_data["session_id"])
-    except (KeyError, ValueError):
-        logger.error(f"Invalid session metadata in {stream_key}")
-        return
+        # Checked before reading so entries written after a stop are still drained
+        session_active = is_session_active(r, session_id)
+        online = follow_inference and inference_online()
+        cursor_key = ECG_CURSOR_FRMT.format(stream_key=stream_key)
+        last_id = (r.hget(cursor_key, "last_id") or b"0-0").decode()
+
+        drained = False
+        for _ in range(settings.ECG_PERSIST_MAX_CHUNKS):
+            entries = r.xrange(stream_key, min=f"({last_id}", max="+", count=settings.ECG_PERSIST_CHUNK_SIZE)
+            if not entries:
+                drained = True
+                break
+
+            rows = build_rows(session_id, entries)
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(
+                        rows,
+                        batch_size=500,
+                        ignore_conflicts=True,
+                    )
+            except IntegrityError as e:
+                if not RecordingSession.objects.filter(id=session_id).exists():
+                    logger.warning(f"Session {session_id} does not exist. Dropping stream {stream_key}")
+                    drop_stream(stream_key, session_id if follow_inference else None)
+                    return persisted
+                logger.error(f"DB integrity error for {stream_key}: {e}")
+                return persisted
+
+            # Advance the cursor only once the chunk is committed
+            last_id = entries[-1][0].decode()
+            r.hset(cursor_key, "last_id", last_id)
+            r.xtrim(stream_key, minid=trim_point(stream_key, last_id, follow_inference, online), approximate=False)
+            persisted += len(rows)
+
+            if len(entries) < settings.ECG_PERSIST_CHUNK_SIZE:
+                drained = True
+                break
+
+        if drained and not session_active:
+            if follow_inference and not inference_caught_up(stream_key, last_id, online):
+                logger.info(f"Session {session_id} stopped and fully persisted, keeping {stream_key} for inference")
+            else:
+                drop_stream(stream_key, session_id if follow_inference else None)
+                logger.info(f"Session {session_id} stopped and fully persisted, removed {stream_key}")
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            logger.warning(f"Persist lock for {stream_key} expired before release")
+
+    if persisted:
+        logger.info(f"Persisted {persisted} {model.__name__} rows for session {session_id} (cursor {last_id})")
+    else:
+        logger.info(f"No new entries in {stream_key}")
+    return persisted
+
 
-    # 🚨 HARD CHECK — NO CREATION
+def drain_legacy_stream(stream_key):
+    """Persist and delete an ``ecg:session:<doctor>/<patient>`` stream.
+
+    These streams predate per-session keys: readings follow a ``session_id``
+    marker entry, and the session in force at the cursor is kept in the
+    cursor hash next to ``last_id``. Nothing writes to them any more, so the
+    whole stream is drained in one run (readings of sessions that no longer
+    exist are dropped) and then deleted with its cursor. Returns the number
+    of rows written.
+    """
+    lock = r.lock(ECG_LOCK_FRMT.format(stream_key=stream_key), timeout=ECG_PERSIST_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        logger.info(f"{stream_key} is already being persisted, skipping")
+        return 0
+
+    persisted = 0
     try:
-        session = RecordingSession.objects.get(id=session_id)
-    except RecordingSession.DoesNotExist:
-        logger.warning(
-            f"Session {session_id} does not exist. "
-            f"Skipping ECG stream {stream_key}"
-        )
-        return  # ← THIS is the critical change
+        cursor_key = ECG_CURSOR_FRMT.format(stream_key=stream_key)
+        cursor = r.hgetall(cursor_key)
+        last_id = cursor.get(b"last_id", b"0-0").decode()
+        session_id = int(cursor[b"session_id"]) if cursor.get(b"session_id", b"").isdigit() else None
+        sessions = {}  # session id -> exists
 
-    ecg_entries = r.xrange(stream_key, min="-", max="+")
-    readings = []
+        def readings(session_id, entries):
+            if not entries:
+                return []
+            if session_id is None:
+                logger.warning(f"{len(entries)} entries in {stream_key} have no session marker, dropping them")
+                return []
+            if session_id not in sessions:
+                sessions[session_id] = RecordingSession.objects.filter(id=session_id).exists()
+            if not sessions[session_id]:
+                logger.warning(f"Session {session_id} does not exist, dropping its entries in {stream_key}")
+                return []
+            return build_sensor_readings(session_id, entries)
 
-    for entry_id, data in ecg_entries:
-        if "session_id" in data:
-            continue
+        while True:
+            entries = r.xrange(stream_key, min=f"({last_id}", max="+", count=settings.ECG_PERSIST_CHUNK_SIZE)
+            if not entries:
+                break
+            rows, run = [], []
+            for entry_id, data in entries:
+                if b"session_id" not in data:
+                    run.append((entry_id, data))
+                    continue
+                rows.extend(readings(session_id, run))
+                run = []
+                session_id = int(data[b"session_id"]) if data[b"session_id"].isdigit() else None
+            rows.extend(readings(session_id, run))
+
+            with transaction.atomic():
+                SensorReadings.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+            last_id = entries[-1][0].decode()
+            cursor = {"last_id": last_id}
+            if session_id is not None:
+                cursor["session_id"] = session_id
+            r.hset(cursor_key, mapping=cursor)
+            persisted += len(rows)
 
+        drop_stream(stream_key)
+    finally:
         try:
-            ts_ns = int(data["ts"])
-            timestamp = datetime.fromtimestamp(ts_ns / 1e9, tz=dt_timezone.utc)
-            values = json.loads(data["values"])
-        except Exception as e:
-            logger.warning(f"Malformed ECG entry {entry_id}: {e}")
-            continue
+            lock.release()
+        except redis.exceptions.LockError:
+            logger.warning(f"Persist lock for {stream_key} expired before release")
+
+    logger.info(f"Migrated legacy stream {stream_key}: {persisted} SensorReadings rows, stream removed")
+    return persisted
 
-        readings.append(
-            SensorReadings(
-                session=session,
-                timestamp=timestamp,
-                ecg_values=values,
-            )
+
+def build_sensor_readings(session_id, entries):
+    return [
+        SensorReadings(
+            session_id=session_id,
+            timestamp=timestamp,
+            ecg_values=values,
         )
+        for timestamp, values in decode_ecg_entries(f"session {session_id}", entries)
+    ]
 
-    if not readings:
-        logger.info(f"No ECG readings for {stream_key}")
-        return
 
-    try:
-        with transaction.atomic():
-            SensorReadings.objects.bulk_create(
-                readings,
-                batch_size=500,
-                ignore_conflicts=True,
-            )
-    except IntegrityError as e:
-        logger.error(f"DB integrity error for {stream_key}: {e}")
-        return
-
-    logger.info(
-        f"Persisted {len(readings)} ECG rows for session {session_id}"
-    )
+def build_beat_predictions(session_id, entries):
+    return [
+        BeatPrediction(
+            session_id=session_id,
+            timestamp=timestamp,
+            label=label,
+            confidence=confidence,
+        )
+        for timestamp, label, confidence in decode_prediction_entries(f"session {session_id}", entries)
+    ]
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(redis.RedisError, ConnectionError, TimeoutError),
+    retry_backoff=5,
+    retry_kwargs={"max_retries": 5},
+)
+def persist_ecg_stream(self, stream_key: str):
+    """Persist new beats from an ``ecg:session:<id>`` stream (see drain_session_stream)."""
+    if is_legacy_stream_key(stream_key):
+        return drain_legacy_stream(stream_key)
+    return drain_session_stream(stream_key, SensorReadings, build_sensor_readings, follow_inference=True)
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(redis.RedisError, ConnectionError, TimeoutError),
+    retry_backoff=5,
+    retry_kwargs={"max_retries": 5},
+)
+def persist_prediction_stream(self, stream_key: str):
+    """Persist new predictions from an ``ecg:predictions:<id>`` stream."""
+    return drain_session_stream(stream_key, BeatPrediction, build_beat_predictions)
 
 
 @shared_task
 def persist_all_ecg_streams():
-    streams = get_all_ecg_streams(r)
-    for stream in streams:
+    for stream in get_all_ecg_streams(r):
         persist_ecg_stream.delay(stream)
+    for stream in get_all_ecg_streams(r, PREDICTION_STREAM_NAME_PATTERN):
+        persist_prediction_stream.delay(stream)
+
+@shared_task(
+    autoretry_for=(redis.RedisError, ConnectionError, TimeoutError),
+    retry_backoff=5,
+    retry_kwargs={"max_retries": 3},
+)
+def sync_device_heartbeats():
+    """Copy heartbeats recorded since the previous run to Device.last_seen.
+
+    Only devices scored in the heartbeat set since the stored cursor are
+    read, then written with one bulk_create and one bulk_update. Devices
+    silent for longer than ``DEVICE_HEARTBEAT_RETENTION`` are pruned from
+    the set (and from the inference worker sets) afterwards.
+    """
+    started = time.time()
+    synced = float(r.get(HEARTBEAT_SYNC_CURSOR_KEY) or 0)
+    heartbeats = get_heartbeats_since(r, max(0.0, synced - HEARTBEAT_SYNC_OVERLAP_S))
+    changed = 0
+    if heartbeats:
+        devices = Device.objects.in_bulk(list(heartbeats), field_name="device_id")
+        new_devices = [
+            Device(device_id=device_id, last_seen=seen)
+            for device_id, seen in heartbeats.items()
+            if device_id not in devices
+        ]
+        updated = []
+        for device_id, device in devices.items():
+            seen = heartbeats[device_id]
+            if device.last_seen is None or device.last_seen < seen:
+                device.last_seen = seen
+                updated.append(device)
+        with transaction.atomic():
+            Device.objects.bulk_create(new_devices, ignore_conflicts=True)
+            Device.objects.bulk_update(updated, ["last_seen"], batch_size=500)
+        for device in new_devices:
+            logger.info(f"New device registered: {device.device_id}")
+        changed = len(new_devices) + len(updated)
+        r.set(HEARTBEAT_SYNC_CURSOR_KEY, max(seen.timestamp() for seen in heartbeats.values()))
+
+    # Pruned ids were synced above (retention is far longer than the overlap)
+    horizon = started - settings.DEVICE_HEARTBEAT_RETENTION
+    pruned = sum(
+        prune_heartbeats(r, horizon, key)
+        for key in (DEVICE_HEARTBEATS_KEY, EDGE_WORKER_HEARTBEATS_KEY, SERVER_INFERENCE_HEARTBEATS_KEY)
+    )
+    if pruned:
+        logger.info(f"Pruned {pruned} devices silent since before {datetime.fromtimestamp(horizon, tz=dt_timezone.utc)}")
+    r.delete(*LEGACY_HEARTBEATS_KEYS)
+    return changed
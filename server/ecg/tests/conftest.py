@@ -0,0 +1,13 @@
+import pytest
+from ecg.client.redis import get_redis, use_fake_redis
+
+# Every Redis client of the test run (module-level ones included) talks to
+# one in-memory fakeredis server, emptied before each test
+use_fake_redis()
+
+
+@pytest.fixture(autouse=True)
+def redis_client():
+    client = get_redis()
+    client.flushall()
+    return client
@@ -0,0 +1,86 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core import signing
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+
+from ecg import auth
+
+factory = APIRequestFactory()
+
+
+def authenticate(header):
+    request = factory.get("/", HTTP_AUTHORIZATION=header)
+    return auth.ECGTokenAuthentication().authenticate(request)
+
+
+def test_issued_token_validates():
+    token = auth.issue_token(auth.ROLE_DOCTOR, 5)
+
+    user = auth.validate_token(token)
+
+    assert (user.role, user.id) == (auth.ROLE_DOCTOR, 5)
+    assert async_to_sync(auth.avalidate_token)(token).id == 5
+
+
+def test_tampered_token_is_rejected():
+    token = auth.issue_token(auth.ROLE_PATIENT, 5)
+    data = signing.loads(token, salt=auth.TOKEN_SALT)
+    forged = signing.dumps(dict(data, i=6), salt="not-the-salt", compress=False)
+
+    assert auth.validate_token(token[:-2] + "xx") is None
+    assert auth.validate_token(forged) is None
+    assert auth.validate_token("garbage") is None
+
+
+def test_revoked_or_expired_token_is_rejected(redis_client):
+    token = auth.issue_token(auth.ROLE_PATIENT, 5)
+    nonce = signing.loads(token, salt=auth.TOKEN_SALT)["n"]
+
+    redis_client.delete(auth.TOKEN_KEY_FRMT.format(nonce=nonce))
+
+    assert auth.validate_token(token) is None
+    assert async_to_sync(auth.avalidate_token)(token) is None
+
+
+def test_token_of_another_user_under_the_same_nonce_is_rejected(redis_client):
+    token = auth.issue_token(auth.ROLE_DOCTOR, 5)
+    nonce = signing.loads(token, salt=auth.TOKEN_SALT)["n"]
+
+    redis_client.set(auth.TOKEN_KEY_FRMT.format(nonce=nonce), f"{auth.ROLE_DOCTOR}:6")
+
+    assert auth.validate_token(token) is None
+
+
+@pytest.mark.parametrize("keyword", ["Token", "Bearer"])
+def test_authorization_header(keyword):
+    token = auth.issue_token(auth.ROLE_DOCTOR, 5)
+
+    user, credentials = authenticate(f"{keyword} {token}")
+
+    assert str(user) == "doctor:5"
+    assert credentials == token.encode()
+
+
+def test_other_schemes_are_left_to_other_authenticators():
+    assert authenticate("Basic dXNlcjpwYXNz") is None
+
+
+@pytest.mark.parametrize("header", ["Token", "Token bad-token", "Token a b"])
+def test_bad_token_is_anonymous_unless_auth_is_required(settings, header):
+    settings.ECG_AUTH_REQUIRED = False
+    assert authenticate(header) is None
+
+    settings.ECG_AUTH_REQUIRED = True
+    with pytest.raises(AuthenticationFailed):
+        authenticate(header)
+
+
+@pytest.mark.parametrize("user, allowed", [
+    (auth.TokenUser(auth.ROLE_DOCTOR, 1), True),
+    (auth.TokenUser(auth.ROLE_DOCTOR, 3), False),
+    (auth.TokenUser(auth.ROLE_PATIENT, 2), True),
+    (auth.TokenUser(auth.ROLE_PATIENT, 1), False),
+])
+def test_may_view_only_own_streams(user, allowed):
+    assert auth.may_view(user, 1, 2) is allowed
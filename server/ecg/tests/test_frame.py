@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from ecg.client.frame import (
+    CODEC_FLOAT32,
+    CODEC_INT16,
+    CODEC_JSON,
+    DTYPE_DELTA_INT16,
+    DTYPE_FLOAT32,
+    FrameError,
+    decode_frame,
+    decode_payload,
+    encode_frame,
+    encode_payload,
+    is_frame,
+)
+
+BEAT = np.sin(np.linspace(0, 2 * np.pi, 187)).astype(np.float32)
+
+
+def test_float32_frame_round_trip():
+    payload = encode_frame(BEAT, seq=7, timestamp_ns=1_700_000_000_123_456_789, dtype=DTYPE_FLOAT32)
+
+    frame = decode_frame(payload)
+
+    assert is_frame(payload)
+    assert len(payload) == 24 + 4 * BEAT.size
+    np.testing.assert_array_equal(frame.values, BEAT)
+    assert (frame.seq, frame.timestamp_ns, frame.dtype) == (7, 1_700_000_000_123_456_789, DTYPE_FLOAT32)
+
+
+def test_int16_frame_round_trip_within_one_step():
+    payload = encode_frame(BEAT, seq=2**32 + 3, dtype=DTYPE_DELTA_INT16)
+
+    frame = decode_frame(payload)
+
+    assert len(payload) == 24 + 2 * BEAT.size
+    assert frame.seq == 3  # wraps at 32 bits
+    step = float(np.abs(BEAT).max()) / 16383
+    np.testing.assert_allclose(frame.values, BEAT, atol=step)
+
+
+def test_int16_frame_of_silence():
+    frame = decode_frame(encode_frame(np.zeros(187), dtype=DTYPE_DELTA_INT16))
+
+    np.testing.assert_array_equal(frame.values, np.zeros(187, dtype=np.float32))
+
+
+@pytest.mark.parametrize("codec", [CODEC_JSON, CODEC_FLOAT32, CODEC_INT16])
+def test_payload_round_trip(codec):
+    payload = encode_payload(BEAT, codec)
+    # JSON is published as text and arrives as UTF-8 bytes
+    values, timestamp = decode_payload(payload.encode() if isinstance(payload, str) else payload)
+
+    assert values.dtype == np.float32
+    np.testing.assert_allclose(values, BEAT, atol=1e-4)
+    assert timestamp
+
+
+def test_codecs_agree_on_the_timestamp():
+    timestamps = []
+    for codec in (CODEC_JSON, CODEC_FLOAT32, CODEC_INT16):
+        payload = encode_payload(BEAT, codec)
+        _, timestamp = decode_payload(payload.encode() if isinstance(payload, str) else payload)
+        timestamps.append(datetime.fromisoformat(timestamp))
+
+    assert all(timestamp.utcoffset() == timedelta(0) for timestamp in timestamps)
+    assert max(timestamps) - min(timestamps) < timedelta(seconds=5)
+
+
+def test_frame_timestamp_is_the_device_time_in_utc():
+    _, timestamp = decode_payload(encode_frame(BEAT, timestamp_ns=1_700_000_000 * 10**9))
+
+    assert datetime.fromisoformat(timestamp) == datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)
+
+
+def test_legacy_json_payload():
+    payload = json.dumps({"timestamp": "2024-01-01T00:00:00", "values": [0.5, 1.0]}).encode()
+
+    values, timestamp = decode_payload(payload)
+
+    assert not is_frame(payload)
+    np.testing.assert_array_equal(values, np.array([0.5, 1.0], dtype=np.float32))
+    assert timestamp == "2024-01-01T00:00:00"
+
+
+@pytest.mark.parametrize("payload", [
+    b"EC\x01",                                              # shorter than the header
+    b"XX" + encode_frame(BEAT)[2:],                          # wrong magic
+    encode_frame(BEAT)[:2] + b"\x09" + encode_frame(BEAT)[3:],  # unknown version
+    encode_frame(BEAT)[:3] + b"\x09" + encode_frame(BEAT)[4:],  # unknown dtype
+])
+def test_bad_frames_are_rejected(payload):
+    with pytest.raises(FrameError):
+        decode_frame(payload)
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(FrameError):
+        encode_payload(BEAT, "float64")
@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+
+from ecg import tasks
+from ecg.client.redis import ECG_SAMPLES_FIELD, get_async_redis, pack_ecg_values
+from ecg.client.sessions import (
+    DRAINING_SESSIONS_KEY,
+    INFERENCE_CURSORS_KEY,
+    activate_session,
+    deactivate_session,
+    prediction_stream_key,
+    session_stream_key,
+)
+from ecg.inference import INPUT_LENGTH, FallbackInference
+from ecg.models import Doctor, Patient, RecordingSession, SensorReadings
+
+
+class CountingModel:
+    """Labels every beat "N" and remembers how many it saw."""
+
+    def __init__(self):
+        self.beats = 0
+
+    def predict(self, beats):
+        self.beats += len(beats)
+        return ["N"] * len(beats), np.ones(len(beats))
+
+
+@pytest.fixture
+def session(db):
+    session = RecordingSession.objects.create(
+        doctor=Doctor.objects.create(full_name="Dr. Fallback"),
+        patient=Patient.objects.create(full_name="Patient Fallback"),
+    )
+    activate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+    return session
+
+
+def run(scenario):
+    """Run ``scenario(engine)`` on one event loop, as manage.py run_inference does."""
+    async def main():
+        engine = FallbackInference(
+            CountingModel(), get_async_redis(decode_responses=False),
+            max_batch=4, block_ms=1, edge_timeout=30, check_interval=0,
+        )
+        await scenario(engine)
+    async_to_sync(main)()
+
+
+# Persistence runs on Django's sync thread, like a Celery task next to the loop
+persist = sync_to_async(
+    lambda stream_key: tasks.drain_session_stream(
+        stream_key, SensorReadings, tasks.build_sensor_readings, follow_inference=True,
+    )
+)
+
+
+def add_beats(stream_key, count):
+    return [
+        tasks.r.xadd(stream_key, {"ts": i, ECG_SAMPLES_FIELD: pack_ecg_values(np.full(INPUT_LENGTH, i))}).decode()
+        for i in range(count)
+    ]
+
+
+def labels(session):
+    return sum(len(json.loads(data[b"labels"])) for _, data in tasks.r.xrange(prediction_stream_key(session.id)))
+
+
+def test_stop_during_fallback_takeover_classifies_the_tail(session):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 10)
+
+    async def scenario(engine):
+        # No edge worker: the fallback takes over and gets through one batch
+        assert await engine.step() == 4
+        deactivate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+
+        # Persistence catches up but keeps what the fallback has not classified
+        assert await persist(stream_key) == 10
+        assert [entry_id.decode() for entry_id, _ in tasks.r.xrange(stream_key)] == ids[3:]
+        assert tasks.r.hexists(DRAINING_SESSIONS_KEY, session.id)
+
+        # The stopped session is still classified to its last beat
+        assert await engine.step() == 4
+        assert await engine.step() == 2
+        assert tasks.r.hget(INFERENCE_CURSORS_KEY, stream_key).decode() == ids[-1]
+
+        await persist(stream_key)
+        assert not tasks.r.exists(stream_key)
+        assert not tasks.r.hexists(DRAINING_SESSIONS_KEY, session.id)
+
+        assert await engine.step() == 0
+        assert engine.sessions == {}
+        assert engine.model.beats == labels(session) == 10
+
+    run(scenario)
+
+
+def test_takeover_resumes_after_the_edge_cursor(session):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 6)
+    tasks.r.hset(INFERENCE_CURSORS_KEY, stream_key, ids[3])
+
+    async def scenario(engine):
+        assert await engine.step() == 2
+        assert await engine.step() == 0
+        assert engine.model.beats == labels(session) == 2
+
+    run(scenario)
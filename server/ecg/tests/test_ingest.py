@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+
+from ecg.client.frame import encode_frame
+from ecg.client.mqtt import MQTTClient
+from ecg.client.sessions import (
+    INFERENCE_CURSORS_KEY,
+    activate_session,
+    advance_inference_cursor,
+    advance_inference_cursor_to_seq,
+    session_stream_key,
+)
+
+STREAM = session_stream_key(9)
+
+
+def cursor(redis_client):
+    return redis_client.hget(INFERENCE_CURSORS_KEY, STREAM)
+
+
+def add_entries(redis_client, seqs):
+    return [redis_client.xadd(STREAM, {"ts": 0, "seq": seq}) for seq in seqs]
+
+
+def test_cursor_only_moves_forward(redis_client):
+    first, second = add_entries(redis_client, [1, 2])
+
+    assert advance_inference_cursor(redis_client, STREAM, second) == 1
+    assert advance_inference_cursor(redis_client, STREAM, first) == 0
+    assert cursor(redis_client) == second
+
+
+def test_cursor_of_a_deleted_stream_is_not_recreated(redis_client):
+    assert advance_inference_cursor(redis_client, STREAM, "1-0") == 0
+    assert cursor(redis_client) is None
+
+
+def test_seq_moves_the_cursor_to_the_newest_entry_of_that_frame(redis_client):
+    # A raw/ chunk can complete several beats, all stored with its seq
+    ids = add_entries(redis_client, [1, 2, 2, 3, 4])
+
+    assert advance_inference_cursor_to_seq(redis_client, STREAM, 2) == 1
+    assert cursor(redis_client) == ids[2]
+
+
+def test_unknown_or_older_seq_leaves_the_cursor(redis_client):
+    ids = add_entries(redis_client, [1, 2, 3])
+    advance_inference_cursor_to_seq(redis_client, STREAM, 2)
+
+    assert advance_inference_cursor_to_seq(redis_client, STREAM, 7) == 0
+    assert advance_inference_cursor_to_seq(redis_client, STREAM, 1) == 0
+    assert advance_inference_cursor_to_seq(redis_client, STREAM, 3, window=0) == 0
+    assert cursor(redis_client) == ids[1]
+
+
+@pytest.fixture
+def ingest(redis_client):
+    activate_session(redis_client, 1, 2, 9)
+    client = MQTTClient(partitions=1, partition=0)
+    client.channel_layer = None
+    async_to_sync(client.start_ingest)()
+    return client
+
+
+def handle(client, messages):
+    async def run():
+        await client.handle_batch(messages)
+        await client.writer.flush()
+    async_to_sync(run)()
+
+
+def test_edge_prediction_covers_only_the_beats_it_classified(ingest, redis_client):
+    beat = np.zeros(187, dtype=np.float32)
+    handle(ingest, [("stream/1/2", encode_frame(beat, seq=seq)) for seq in (10, 11, 12)])
+    ids = [entry_id for entry_id, _ in redis_client.xrange(STREAM)]
+
+    # The prediction for seq 11 arrives after beat 12 was stored
+    handle(ingest, [("prediction/1/2", json.dumps({"prediction": ["N"], "seq": 11}).encode())])
+
+    assert cursor(redis_client) == ids[1]
+
+
+def test_edge_prediction_without_seq_leaves_the_cursor(ingest, redis_client):
+    handle(ingest, [("stream/1/2", json.dumps({"values": [0.0] * 187}).encode())])
+    handle(ingest, [("prediction/1/2", json.dumps({"prediction": ["N"]}).encode())])
+
+    assert redis_client.xlen(STREAM) == 1
+    assert cursor(redis_client) is None
@@ -0,0 +1,85 @@
+import json
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from ecg.models import Doctor, Patient, RecordingSession
+from ecg.views.general import RecordingListView
+
+factory = APIRequestFactory()
+
+
+@pytest.fixture
+def sessions(db):
+    doctor = Doctor.objects.create(full_name="Dr. Pages")
+    patient = Patient.objects.create(full_name="Patient Pages")
+    sessions = [RecordingSession.objects.create(doctor=doctor, patient=patient) for _ in range(7)]
+    # Two pairs share a start time, so pages must break ties on the id
+    now = timezone.now()
+    for i, session in enumerate(sessions):
+        session.started_at = now - timedelta(minutes=i // 2)
+    RecordingSession.objects.bulk_update(sessions, ["started_at"])
+    return sorted(sessions, key=lambda s: (s.started_at, s.id), reverse=True)
+
+
+def get(params):
+    response = RecordingListView.as_view()(factory.get("/api/recordings/", params))
+
+    async def body():
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    if not response.streaming:
+        return response.status_code, response.data
+    return response.status_code, json.loads(async_to_sync(body)())
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(sessions):
+    seen, params = [], {"limit": 3}
+    while True:
+        status, page = get(params)
+        assert status == 200
+        assert len(page["recordings"]) <= 3
+        seen.extend(row["id"] for row in page["recordings"])
+        if page["next_cursor"] is None:
+            break
+        params = {"limit": 3, "cursor": page["next_cursor"]}
+
+    assert seen == [session.id for session in sessions]
+
+
+def test_last_full_page_has_no_next_cursor(sessions):
+    _, first = get({"limit": 4})
+    _, last = get({"limit": 3, "cursor": first["next_cursor"]})
+
+    assert len(last["recordings"]) == 3
+    assert last["next_cursor"] is None
+
+
+def test_without_limit_or_cursor_every_row_is_returned(sessions, settings):
+    settings.ECG_LIST_PAGE_SIZE = 2
+
+    _, page = get({})
+
+    assert [row["id"] for row in page["recordings"]] == [session.id for session in sessions]
+    assert page["next_cursor"] is None
+
+
+def test_filters_apply_to_every_page(sessions):
+    other = RecordingSession.objects.create(
+        doctor=Doctor.objects.create(full_name="Dr. Other"), patient=sessions[0].patient,
+    )
+
+    _, page = get({"limit": 100, "doctor": other.doctor_id})
+
+    assert [row["id"] for row in page["recordings"]] == [other.id]
+
+
+@pytest.mark.parametrize("params", [{"cursor": "not-a-cursor"}, {"limit": "ten"}])
+def test_bad_paging_params_are_a_400(sessions, params):
+    status, data = get(params)
+
+    assert status == 400
+    assert set(data) == set(params)
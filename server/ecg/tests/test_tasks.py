@@ -0,0 +1,232 @@
+import time
+
+import numpy as np
+import pytest
+
+from ecg import tasks
+from ecg.client.devices import EDGE_WORKER_HEARTBEATS_KEY, record_heartbeats
+from ecg.client.redis import ECG_SAMPLES_FIELD, pack_ecg_values
+from ecg.client.sessions import (
+    DRAINING_SESSIONS_KEY,
+    activate_session,
+    advance_inference_cursor,
+    deactivate_session,
+    session_stream_key,
+)
+from ecg.models import Doctor, Patient, RecordingSession, SensorReadings
+
+START_NS = 1_700_000_000 * 10**9
+
+
+@pytest.fixture
+def session(db):
+    doctor = Doctor.objects.create(full_name="Dr. Stream")
+    patient = Patient.objects.create(full_name="Patient Stream")
+    session = RecordingSession.objects.create(doctor=doctor, patient=patient)
+    activate_session(tasks.r, doctor.id, patient.id, session.id)
+    return session
+
+
+@pytest.fixture
+def small_chunks(settings):
+    settings.ECG_PERSIST_CHUNK_SIZE = 4
+    settings.ECG_PERSIST_MAX_CHUNKS = 2
+
+
+def add_beats(stream_key, count, first=0):
+    """XADD ``count`` beats whose samples all equal their index; returns their entry ids."""
+    return [
+        tasks.r.xadd(stream_key, {
+            "ts": START_NS + i * 10**6,
+            ECG_SAMPLES_FIELD: pack_ecg_values(np.full(187, i, dtype=np.float32)),
+        }).decode()
+        for i in range(first, first + count)
+    ]
+
+
+def drain(stream_key):
+    return tasks.drain_session_stream(stream_key, SensorReadings, tasks.build_sensor_readings)
+
+
+def cursor(stream_key):
+    return tasks.r.hget(tasks.ECG_CURSOR_FRMT.format(stream_key=stream_key), "last_id").decode()
+
+
+def test_persists_in_chunks_and_resumes_from_the_cursor(session, small_chunks):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 10)
+
+    assert drain(stream_key) == 8
+    assert cursor(stream_key) == ids[7]
+    assert drain(stream_key) == 2
+    assert cursor(stream_key) == ids[9]
+    assert drain(stream_key) == 0
+
+    values = SensorReadings.objects.filter(session=session).as_array()
+    np.testing.assert_array_equal(values[:, 0], np.arange(10, dtype=np.float32))
+    np.testing.assert_array_equal(values[3], np.full(187, 3, dtype=np.float32))
+
+
+def test_trims_up_to_the_cursor(session, small_chunks):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 6)
+
+    drain(stream_key)
+
+    # XTRIM MINID keeps the cursor entry itself
+    assert [entry_id.decode() for entry_id, _ in tasks.r.xrange(stream_key)] == ids[5:]
+    new_ids = add_beats(stream_key, 3, first=6)
+    assert drain(stream_key) == 3
+    assert SensorReadings.objects.filter(session=session).count() == 9
+    assert cursor(stream_key) == new_ids[-1]
+
+
+def test_keeps_the_stream_of_an_active_session(session):
+    stream_key = session_stream_key(session.id)
+    add_beats(stream_key, 3)
+
+    drain(stream_key)
+
+    assert tasks.r.exists(stream_key)
+
+
+def test_drops_a_stopped_session_once_drained(session, small_chunks):
+    stream_key = session_stream_key(session.id)
+    add_beats(stream_key, 10)
+    deactivate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+
+    assert drain(stream_key) == 8
+    assert tasks.r.exists(stream_key)
+    assert drain(stream_key) == 2
+    assert not tasks.r.exists(stream_key, tasks.ECG_CURSOR_FRMT.format(stream_key=stream_key))
+    assert SensorReadings.objects.filter(session=session).count() == 10
+
+
+def test_skips_a_stream_another_worker_holds(session):
+    stream_key = session_stream_key(session.id)
+    add_beats(stream_key, 3)
+    lock = tasks.r.lock(tasks.ECG_LOCK_FRMT.format(stream_key=stream_key), timeout=5)
+    assert lock.acquire(blocking=False)
+
+    assert drain(stream_key) == 0
+    assert tasks.r.xlen(stream_key) == 3
+
+    lock.release()
+    assert drain(stream_key) == 3
+
+
+def test_rerun_after_a_lost_cursor_does_not_duplicate_rows(session):
+    stream_key = session_stream_key(session.id)
+    add_beats(stream_key, 3)
+    drain(stream_key)
+    tasks.r.delete(tasks.ECG_CURSOR_FRMT.format(stream_key=stream_key))
+
+    drain(stream_key)
+
+    assert SensorReadings.objects.filter(session=session).count() == 3
+
+
+def test_packed_beat_starting_with_an_open_bracket_is_not_read_as_json():
+    # 0x5B is "[": packed samples are told apart from legacy JSON by field name alone
+    beat = np.linspace(-1, 1, 187, dtype=np.float32)
+    beat[0] = np.frombuffer(b"\x5b\x00\x80\x3f", dtype="<f4")[0]
+    packed = pack_ecg_values(beat)
+    assert packed[:1] == b"["
+    entries = [
+        (b"1-0", {b"ts": str(START_NS).encode(), ECG_SAMPLES_FIELD.encode(): packed}),
+        (b"2-0", {b"ts": str(START_NS + 1).encode(), b"values": b"[0.5, 1.5]"}),
+        (b"3-0", {b"ts": str(START_NS + 2).encode(), ECG_SAMPLES_FIELD.encode(): packed[:-1]}),
+    ]
+
+    decoded = tasks.decode_ecg_entries("ecg:session:1", entries)
+
+    assert len(decoded) == 2  # the truncated blob is dropped as malformed
+    np.testing.assert_array_equal(decoded[0][1], beat)
+    np.testing.assert_array_equal(decoded[1][1], np.array([0.5, 1.5], dtype=np.float32))
+
+
+def test_ignores_keys_that_are_not_session_streams(db):
+    assert drain("ecg:session:not-a-session") == 0
+
+
+def persist(stream_key):
+    return tasks.drain_session_stream(stream_key, SensorReadings, tasks.build_sensor_readings, follow_inference=True)
+
+
+def edge_heartbeat():
+    record_heartbeats(tasks.r, {"jetson": time.time()}, EDGE_WORKER_HEARTBEATS_KEY)
+
+
+def test_beat_stream_is_trimmed_to_the_persisted_id_while_nobody_classifies(session):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 5)
+
+    persist(stream_key)
+
+    assert [entry_id.decode() for entry_id, _ in tasks.r.xrange(stream_key)] == ids[4:]
+
+
+def test_beat_stream_is_trimmed_behind_inference(session):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 5)
+    edge_heartbeat()
+    advance_inference_cursor(tasks.r, stream_key, ids[1])
+
+    persist(stream_key)
+
+    assert [entry_id.decode() for entry_id, _ in tasks.r.xrange(stream_key)] == ids[1:]
+
+
+def test_beat_stream_keeps_at_most_the_max_lag_for_inference(session, settings):
+    settings.ECG_INFERENCE_MAX_LAG_S = 2
+    stream_key = session_stream_key(session.id)
+    ids = [tasks.r.xadd(stream_key, {"ts": START_NS + i, ECG_SAMPLES_FIELD: pack_ecg_values(np.zeros(187))},
+                        id=f"{1000 * (i + 1)}-0").decode() for i in range(5)]
+    edge_heartbeat()
+
+    persist(stream_key)
+
+    # No cursor: entries more than 2 s of stream time before the last are trimmed
+    assert [entry_id.decode() for entry_id, _ in tasks.r.xrange(stream_key)] == ids[2:]
+
+
+def test_stopped_beat_stream_waits_for_inference(session):
+    stream_key = session_stream_key(session.id)
+    ids = add_beats(stream_key, 5)  # ids are the current time, so inference is not yet overdue
+    deactivate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+    edge_heartbeat()
+    advance_inference_cursor(tasks.r, stream_key, ids[2])
+
+    assert persist(stream_key) == 5
+    assert tasks.r.exists(stream_key)
+    assert tasks.r.hexists(DRAINING_SESSIONS_KEY, session.id)
+
+    advance_inference_cursor(tasks.r, stream_key, ids[-1])
+    persist(stream_key)
+
+    assert not tasks.r.exists(stream_key)
+    assert not tasks.r.hexists(DRAINING_SESSIONS_KEY, session.id)
+    assert SensorReadings.objects.filter(session=session).count() == 5
+
+
+def test_stopped_beat_stream_is_dropped_when_inference_is_too_far_behind(session, settings):
+    settings.ECG_INFERENCE_MAX_LAG_S = 60
+    stream_key = session_stream_key(session.id)
+    tasks.r.xadd(stream_key, {"ts": START_NS, ECG_SAMPLES_FIELD: pack_ecg_values(np.zeros(187))}, id="1000-0")
+    deactivate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+    edge_heartbeat()
+
+    persist(stream_key)
+
+    assert not tasks.r.exists(stream_key)
+
+
+def test_stopped_beat_stream_is_dropped_when_nobody_classifies(session):
+    stream_key = session_stream_key(session.id)
+    add_beats(stream_key, 3)
+    deactivate_session(tasks.r, session.doctor_id, session.patient_id, session.id)
+
+    persist(stream_key)
+
+    assert not tasks.r.exists(stream_key)
+    assert not tasks.r.hexists(DRAINING_SESSIONS_KEY, session.id)
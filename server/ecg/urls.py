@@ -2,6 +2,8 @@ from django.urls import path
 from ecg.views.authenticate import (DoctorRegisterView,PatientRegisterView,DoctorLoginView,PatientLoginView)
 from ecg.views.general import (PatientListView,DoctorListView,RecordingListView,DeviceListView)
 from ecg.views.mqtt import (StartStreamingView,StopStreamingView)
+from ecg.views.analytics import (SessionBeatsView,SessionClassHistogramView)
+from ecg.views.export import RecordingExportView
 
 urlpatterns = [
     # Authentication
@@ -14,6 +16,11 @@ urlpatterns = [
     path('doctors/', DoctorListView.as_view()),
     path('recordings/', RecordingListView.as_view()),
     path('devices/', DeviceListView.as_view()),
+    # Session analytics (continuous aggregates)
+    path('recordings/<int:session_id>/beats/', SessionBeatsView.as_view()),
+    path('recordings/<int:session_id>/classes/', SessionClassHistogramView.as_view()),
+    # Bulk export
+    path('recordings/<int:session_id>/export/', RecordingExportView.as_view()),
     # MQTT Streaming
     path('mqtt/start/<int:doctor_id>/<int:patient_id>/', StartStreamingView.as_view()),
     path('mqtt/stop/<int:doctor_id>/<int:patient_id>/', StopStreamingView.as_view()),
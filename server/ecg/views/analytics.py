@@ -0,0 +1,31 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from ecg.aggregates import session_beats_per_minute, session_class_histogram
+from ecg.serializers.analytics import TimeRangeSerializer
+
+class SessionBeatsView(APIView):
+    """Beats per minute of a recording session, read from the continuous aggregate."""
+    serializer_class = TimeRangeSerializer
+
+    def get(self, request, session_id):
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        minutes = session_beats_per_minute(session_id, **serializer.validated_data)
+        return Response(
+            {'session_id': session_id, 'minutes': minutes},
+            status=status.HTTP_200_OK
+        )
+
+class SessionClassHistogramView(APIView):
+    """Predicted beat classes per minute of a recording session, plus totals."""
+    serializer_class = TimeRangeSerializer
+
+    def get(self, request, session_id):
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        histogram = session_class_histogram(session_id, **serializer.validated_data)
+        return Response(
+            {'session_id': session_id, **histogram},
+            status=status.HTTP_200_OK
+        )
@@ -1,14 +1,19 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import AllowAny
 from ecg.models import Doctor, Patient
 from ecg.serializers.authenticate import DoctorSerializer, PatientSerializer,DoctorLoginSerializer,PatientLoginSerializer
+from ecg.auth import issue_token, ROLE_DOCTOR, ROLE_PATIENT
 from typing import cast
 # from loguru import logger
 # from pprint import pformat
 
 class DoctorRegisterView(APIView):
     serializer_class = DoctorSerializer
+    permission_classes = [AllowAny]
+    # A stale token in the browser must not block signing in again
+    authentication_classes = []
 
     def post(self, request):
         # logger.debug(f"Request details:\n{pformat(request.__dict__)}")
@@ -23,6 +28,8 @@ class DoctorRegisterView(APIView):
 
 class PatientRegisterView(APIView):
     serializer_class = PatientSerializer
+    permission_classes = [AllowAny]
+    authentication_classes = []
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
@@ -35,6 +42,8 @@ class PatientRegisterView(APIView):
 
 class DoctorLoginView(APIView):
     serializer_class = DoctorLoginSerializer
+    permission_classes = [AllowAny]
+    authentication_classes = []
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -45,12 +54,15 @@ class DoctorLoginView(APIView):
                 "status": "success",
                 "id": doctor.id,
                 "full_name": doctor.full_name,
+                "token": issue_token(ROLE_DOCTOR, doctor.id),
             },
             status=status.HTTP_200_OK,
         )
 
 class PatientLoginView(APIView):
     serializer_class = PatientLoginSerializer
+    permission_classes = [AllowAny]
+    authentication_classes = []
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -61,6 +73,7 @@ class PatientLoginView(APIView):
                 "status": "success",
                 "id": patient.id,
                 "full_name": patient.full_name,
+                "token": issue_token(ROLE_PATIENT, patient.id),
             },
             status=status.HTTP_200_OK,
         )
@@ -0,0 +1,56 @@
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.views import APIView
+from rest_framework.exceptions import APIException
+from ecg.export import EXPORT_FORMATS, MixedSampleWidths, session_readings, stream_npy, stream_csv, stream_arrow
+from ecg.models import RecordingSession
+from ecg.serializers.analytics import ExportSerializer
+
+class ExportUnavailable(APIException):
+    status_code = 501
+    default_detail = "Export format not available on this server."
+
+class ExportConflict(APIException):
+    status_code = 409
+    default_detail = "These readings cannot be exported as one table."
+
+class RecordingExportView(APIView):
+    """Stream a session's ECG readings as NPY, CSV or Arrow IPC.
+
+    Query params: ``format`` (npy | csv | arrow, default npy), ``start``, ``end``.
+    """
+    serializer_class = ExportSerializer
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= selects the export format here, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, session_id):
+        serializer = self.serializer_class(data=request.query_params.dict())
+        serializer.is_valid(raise_exception=True)
+        export_format = serializer.validated_data["format"]
+        session = get_object_or_404(RecordingSession, id=session_id)
+        try:
+            readings, count, samples = session_readings(
+                session.id, serializer.validated_data.get("start"), serializer.validated_data.get("end")
+            )
+        except MixedSampleWidths as e:
+            raise ExportConflict(str(e))
+        samples = samples or 0
+
+        if export_format == "npy":
+            content = stream_npy(readings, count, samples)
+        elif export_format == "csv":
+            content = stream_csv(readings, samples)
+        else:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ExportUnavailable("Arrow export needs pyarrow installed on the server.")
+            content = stream_arrow(readings, samples)
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="session_{session.id}.{extension}"'
+        response["X-Row-Count"] = str(count)
+        return response
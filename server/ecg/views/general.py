@@ -1,46 +1,98 @@
 from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
 from ecg.models import Doctor, Patient,RecordingSession,Device
+from ecg.pagination import KeysetPagination
 from ecg.serializers.authenticate import DoctorSerializer, PatientSerializer
-from ecg.serializers.general import RecordingSessionSerializer,DeviceSerializer
-class PatientListView(APIView):
-    serializer_class = PatientSerializer
+from ecg.serializers.general import RecordingSessionSerializer,DeviceSerializer,RecordingFilterSerializer,PatientFilterSerializer,DoctorFilterSerializer
+from ecg.serializers.analytics import TimeRangeSerializer
+from ecg.client.redis import get_redis
+from ecg.client.devices import get_heartbeats
+r = get_redis()
+
+class KeysetListView(APIView):
+    """Cursor-paginated, filterable list streamed as ``{result_key: [...], "next_cursor": ...}``.
+
+    Query params: ``limit``, ``cursor`` (the previous page's ``next_cursor``)
+    and whatever ``filter_serializer_class`` accepts. Without ``limit`` or
+    ``cursor`` every matching row is returned.
+    """
+    model = None
+    result_key = None
+    ordering = ("-id",)
+    filter_serializer_class = TimeRangeSerializer
+
+    def filter_queryset(self, queryset, filters):
+        return queryset
+
+    def get_serializer_context(self, page):
+        return {"request": self.request}
+
     def get(self, request):
-        patients = Patient.objects.all()
-        serializer = self.serializer_class(patients, many=True)
-        return Response(
-            {'patients': serializer.data},
-            status=status.HTTP_200_OK
+        filters = self.filter_serializer_class(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(self.model.objects.all(), filters.validated_data)
+        pagination = KeysetPagination(self.ordering)
+        page, limit = pagination.paginate(queryset, request)
+        context = self.get_serializer_context(page)
+        return pagination.stream_response(
+            self.result_key, page, limit,
+            lambda obj: self.serializer_class(obj, context=context).data,
         )
 
-class DoctorListView(APIView):
+def filter_created(queryset, filters, field="created_at"):
+    if "start" in filters:
+        queryset = queryset.filter(**{f"{field}__gte": filters["start"]})
+    if "end" in filters:
+        queryset = queryset.filter(**{f"{field}__lte": filters["end"]})
+    return queryset
+
+class PatientListView(KeysetListView):
+    serializer_class = PatientSerializer
+    model = Patient
+    result_key = 'patients'
+    filter_serializer_class = PatientFilterSerializer
+
+    def filter_queryset(self, queryset, filters):
+        if "doctor" in filters:
+            queryset = queryset.filter(recording_sessions__doctor_id=filters["doctor"]).distinct()
+        return filter_created(queryset, filters)
+
+class DoctorListView(KeysetListView):
     serializer_class = DoctorSerializer
+    model = Doctor
+    result_key = 'doctors'
+    filter_serializer_class = DoctorFilterSerializer
 
-    def get(self, request):
-        doctors = Doctor.objects.all()
-        serializer = self.serializer_class(doctors, many=True)
-        return Response(
-            {'doctors': serializer.data},
-            status=status.HTTP_200_OK
-        )
-class RecordingListView(APIView):
+    def filter_queryset(self, queryset, filters):
+        if "patient" in filters:
+            queryset = queryset.filter(recording_sessions__patient_id=filters["patient"]).distinct()
+        return filter_created(queryset, filters)
+
+class RecordingListView(KeysetListView):
     serializer_class = RecordingSessionSerializer
+    model = RecordingSession
+    result_key = 'recordings'
+    ordering = ("-started_at", "-id")
+    filter_serializer_class = RecordingFilterSerializer
 
-    def get(self, request):
-        recordings = RecordingSession.objects.all()
-        serializer = self.serializer_class(recordings, many=True)
-        return Response(
-            {'recordings': serializer.data},
-            status=status.HTTP_200_OK
-        )
-class DeviceListView(APIView):
+    def filter_queryset(self, queryset, filters):
+        if "doctor" in filters:
+            queryset = queryset.filter(doctor_id=filters["doctor"])
+        if "patient" in filters:
+            queryset = queryset.filter(patient_id=filters["patient"])
+        if "active" in filters:
+            queryset = queryset.filter(stopped_at__isnull=filters["active"])
+        return filter_created(queryset, filters, field="started_at")
+
+class DeviceListView(KeysetListView):
     serializer_class = DeviceSerializer
+    model = Device
+    result_key = 'devices'
 
-    def get(self, request):
-        devices = Device.objects.all()
-        serializer = self.serializer_class(devices, many=True)
-        return Response(
-            {'devices': serializer.data},
-            status=status.HTTP_200_OK
-        )
+    def filter_queryset(self, queryset, filters):
+        return filter_created(queryset, filters, field="registered_at")
+
+    def get_serializer_context(self, page):
+        # One HMGET for the page's devices instead of a lookup per row
+        context = super().get_serializer_context(page)
+        context["heartbeats"] = get_heartbeats(r, page.values_list("device_id", flat=True))
+        return context
@@ -3,11 +3,10 @@ from rest_framework.response import Response
 from rest_framework import status
 from ecg.client.mqtt import mqtt_client
 from ecg.client.redis import get_redis
+from ecg.client.sessions import activate_session, deactivate_session
 from ecg.serializers.mqtt import StartStreamingSerializer,StopStreamingSerializer
 from loguru import logger
-import json, time
 COMMAND_TOPIC_FMT = "commands/{doctor_id}/{patient_id}"
-REDIS_SESSION_FRMT = "ecg:session:{doctor_id}/{patient_id}"
 r = get_redis()
 class StartStreamingView(APIView):
     serializer_class = StartStreamingSerializer
@@ -16,15 +15,8 @@ class StartStreamingView(APIView):
         serializer = self.serializer_class(data={"doctor_id": doctor_id,"patient_id": patient_id})
         serializer.is_valid(raise_exception=True)
         session = serializer.save()
-        # Redis Initialize
-        r.xadd(
-            REDIS_SESSION_FRMT.format(doctor_id=doctor_id, patient_id=patient_id),
-            {
-                "session_id": session.id,
-                "ts": time.time_ns(),
-                "values": "[]"
-            }
-        )
+        # Redis Initialize: beats for (doctor, patient) now go to ecg:session:<id>
+        activate_session(r, doctor_id, patient_id, session.id)
 
         # MQTT Publish COmmadn
         topic = COMMAND_TOPIC_FMT.format(doctor_id=doctor_id,patient_id=patient_id)
@@ -39,6 +31,7 @@ class StopStreamingView(APIView):
         serializer = self.serializer_class(data={"doctor_id": doctor_id,"patient_id": patient_id})
         serializer.is_valid(raise_exception=True)
         session = serializer.save()
+        deactivate_session(r, doctor_id, patient_id, session.id)
 
         topic = COMMAND_TOPIC_FMT.format(doctor_id=doctor_id,patient_id=patient_id)
         mqtt_client.publish(topic, "stop")
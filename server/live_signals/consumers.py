@@ -1,28 +1,139 @@
 # app/consumers.py
+import asyncio
 import json
+import struct
+from collections import deque
+from urllib.parse import parse_qs
+import numpy as np
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from ecg.auth import may_view
+
+# Binary frame sent to clients that ask for format=binary:
+# magic b"EW", version, kind, beat count, samples per beat, beats dropped since
+# the last frame, then count * samples little-endian float32 values
+WS_FRAME_HEADER = struct.Struct("<2sBBHHI")
+WS_FRAME_MAGIC = b"EW"
+WS_FRAME_VERSION = 1
+WS_FRAME_KIND_ECG = 1
+
+MAX_RATE_HZ = 60.0
+MAX_PENDING_BEATS = 256
+CLOSE_UNAUTHORIZED = 4401
 
 class ECGConsumer(AsyncWebsocketConsumer):
+    """Live ECG for one doctor/patient pair.
+
+    By default every beat is forwarded as its own JSON message. A client can
+    instead ask, through query params at connect time or a JSON control
+    message ``{"rate": 4, "format": "binary", "max_beats": 16}``, for beats
+    to be coalesced into at most ``rate`` frames per second. Each frame holds
+    up to ``max_beats`` of the most recent beats, as JSON or binary float32.
+    When more beats than that arrive between two frames (the stream is
+    faster than ``rate * max_beats``), the oldest are dropped and the frame
+    reports how many. Binary frames zero-pad beats to the longest one.
+    """
+
     async def connect(self):
         self.doctor_id = self.scope["url_route"]["kwargs"]["doctor_id"] # type: ignore
         self.patient_id = self.scope["url_route"]["kwargs"]["patient_id"] # type: ignore
         self.group_name = f"live_signals_{self.doctor_id}_{self.patient_id}"
+        # scope["user"] comes from ecg.auth.TokenAuthMiddleware, no DB lookup
+        token_refused = self.scope.get("token_invalid") and settings.ECG_AUTH_REQUIRED
+        if token_refused or not may_view(self.scope.get("user"), self.doctor_id, self.patient_id):
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+        self.rate = 0.0            # 0 = forward every beat immediately
+        self.binary = False
+        self.max_beats = 16
+        self.pending = deque(maxlen=MAX_PENDING_BEATS)
+        self.dropped = 0
+        self.flush_task = None
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.configure({key: values[-1] for key, values in query.items()})
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
+        if getattr(self, "flush_task", None):
+            self.flush_task.cancel()
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    # No need to allow incoming messages from client in this flow,hence not implemented
     async def receive(self, text_data=None, bytes_data=None):
-        # Optionally handle client pings or control messages
-        pass
+        # Clients may send {"rate": hz, "format": "json"|"binary", "max_beats": n}
+        if not text_data:
+            return
+        try:
+            options = json.loads(text_data)
+        except ValueError:
+            return
+        if isinstance(options, dict):
+            self.configure(options)
+
+    def configure(self, options):
+        try:
+            if "rate" in options:
+                self.rate = min(max(float(options["rate"]), 0.0), MAX_RATE_HZ)
+            if "max_beats" in options:
+                self.max_beats = min(max(int(options["max_beats"]), 1), MAX_PENDING_BEATS)
+        except (TypeError, ValueError):
+            pass
+        if "format" in options:
+            self.binary = options["format"] == "binary"
+        if self.rate and self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_loop())
 
     # Handler called when channel_layer.group_send sends with type "ecg.message"
     async def ecg_message(self, event):
         # event["data"] is expected to be JSON-serializable payload
-        await self.send(text_data=json.dumps(event["data"]))
-        
+        if not self.rate and not self.binary:
+            await self.send(text_data=json.dumps(event["data"]))
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(event["data"]["values"])
+        if not self.rate:
+            await self.flush()
+
+    # Handler for "ecg.batch": the beats of one ingest batch, oldest first
+    async def ecg_batch(self, event):
+        for beat in event["data"]:
+            await self.ecg_message({"data": beat})
+
+    async def flush_loop(self):
+        # Ends once rate is back to 0; configure starts a new loop if it is raised again
+        while self.rate:
+            await asyncio.sleep(1.0 / self.rate)
+            await self.flush()
+        self.flush_task = None
+
+    async def flush(self):
+        if not self.pending:
+            return
+        beats = list(self.pending)
+        self.pending.clear()
+        # More beats than one frame holds: keep only the most recent
+        dropped = self.dropped + max(0, len(beats) - self.max_beats)
+        beats = beats[-self.max_beats:]
+        self.dropped = 0
+
+        if self.binary:
+            width = max(len(beat) for beat in beats)
+            samples = np.zeros((len(beats), width), dtype="<f4")
+            for row, beat in zip(samples, beats):
+                row[:len(beat)] = beat
+            header = WS_FRAME_HEADER.pack(
+                WS_FRAME_MAGIC, WS_FRAME_VERSION, WS_FRAME_KIND_ECG, samples.shape[0], samples.shape[1], dropped
+            )
+            await self.send(bytes_data=header + samples.tobytes())
+        else:
+            await self.send(text_data=json.dumps({
+                "doctor_id": self.doctor_id,
+                "patient_id": self.patient_id,
+                "beats": beats,
+                "dropped": dropped,
+            }))
+
     async def send_prediction(self, event):
         # event["data"] is expected to be JSON-serializable payload
         await self.send(text_data=json.dumps(event["data"]))
@@ -23,6 +23,23 @@ MQTT_HOST = os.getenv('MQTT_HOST', 'localhost')
 MQTT_PORT = int(os.getenv('MQTT_PORT', 8883))
 MQTT_USERNAME = os.getenv('MQTT_USERNAME')
 MQTT_PASSWORD = os.getenv('MQTT_PASSWORD')
+# Seconds a web process waits for the broker when it first publishes a command
+MQTT_CONNECT_TIMEOUT = float(os.getenv('MQTT_CONNECT_TIMEOUT', 5))
+# Scaling ingest across processes: either a shared subscription group (MQTT v5,
+# the broker balances messages) or MQTT_PARTITIONS processes, each started with
+# its own MQTT_PARTITION in [0, MQTT_PARTITIONS), splitting patients by hash
+MQTT_SHARE_GROUP = os.getenv('MQTT_SHARE_GROUP', '')
+MQTT_PARTITIONS = int(os.getenv('MQTT_PARTITIONS', 1))
+MQTT_PARTITION = int(os.getenv('MQTT_PARTITION', 0))
+# Redis (streams, session index, channel layer, Celery broker). Clients come
+# from ecg.client.redis, which keeps one pool per process and mode
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+# Device-side code shared with the server (e.g. the stream/ frame codec)
+DEVICES_DIR = Path(os.getenv('DEVICES_DIR', BASE_DIR.parent / 'devices'))
 ###
 
 # Quick-start development settings - unsuitable for production
@@ -142,7 +159,7 @@ CHANNEL_LAYERS = {
     "default": {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',  # Use Redis as the channel layer backend
         'CONFIG': {
-            'hosts': [('localhost', 6379)],  # Adjust the host and port as per your Redis configuration
+            'hosts': [REDIS_URL],
         },
     }
 }
@@ -158,9 +175,9 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     "ngrok-skip-browser-warning",
 ]
 # set the celery broker url
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
 # set the celery result backend
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', REDIS_URL)
 # set the celery timezone
 CELERY_TIMEZONE = 'Asia/Karachi'
 
@@ -168,9 +185,63 @@ CELERY_BEAT_SCHEDULE = {
     "persist-ecg-every-5-seconds": {
         "task": "ecg.tasks.persist_all_ecg_streams",
         "schedule": 5.0,
-    }
+    },
+    "sync-device-heartbeats": {
+        "task": "ecg.tasks.sync_device_heartbeats",
+        "schedule": float(os.getenv('DEVICE_HEARTBEAT_SYNC_S', 30)),
+    },
 }
+# A device is shown online if it sent a heartbeat within this many seconds
+DEVICE_ONLINE_TIMEOUT = float(os.getenv('DEVICE_ONLINE_TIMEOUT', 90))
+# Devices silent for this many seconds are dropped from the Redis heartbeat set
+# (Device.last_seen keeps their last heartbeat)
+DEVICE_HEARTBEAT_RETENTION = float(os.getenv('DEVICE_HEARTBEAT_RETENTION', 7 * 24 * 3600))
+# ECG persistence: new stream entries are read in chunks of this size,
+# at most ECG_PERSIST_MAX_CHUNKS chunks per stream per run
+ECG_PERSIST_CHUNK_SIZE = int(os.getenv('ECG_PERSIST_CHUNK_SIZE', 500))
+ECG_PERSIST_MAX_CHUNKS = int(os.getenv('ECG_PERSIST_MAX_CHUNKS', 20))
+# Beat streams are only trimmed (and a stopped session's stream dropped) once
+# inference has classified them, but persisted entries are kept for at most
+# this many seconds of stream time while waiting for it
+ECG_INFERENCE_MAX_LAG_S = float(os.getenv('ECG_INFERENCE_MAX_LAG_S', 120))
+# TimescaleDB: hypertable chunk size and age after which chunks are compressed
+TIMESCALE_CHUNK_INTERVAL = os.getenv('TIMESCALE_CHUNK_INTERVAL', '1 day')
+TIMESCALE_COMPRESS_AFTER = os.getenv('TIMESCALE_COMPRESS_AFTER', '7 days')
+# List endpoints: default and maximum page size (keyset pagination)
+ECG_LIST_PAGE_SIZE = int(os.getenv('ECG_LIST_PAGE_SIZE', 100))
+ECG_LIST_MAX_PAGE_SIZE = int(os.getenv('ECG_LIST_MAX_PAGE_SIZE', 1000))
+# Rows fetched per server-side cursor round trip by /recordings/<id>/export/
+ECG_EXPORT_CHUNK_SIZE = int(os.getenv('ECG_EXPORT_CHUNK_SIZE', 2000))
+# MQTT ingest bridge: messages queued between paho's thread and the asyncio
+# loop, messages handled per loop wake-up, concurrent channel layer/Redis calls
+MQTT_INGEST_QUEUE_SIZE = int(os.getenv('MQTT_INGEST_QUEUE_SIZE', 10000))
+MQTT_INGEST_MAX_BATCH = int(os.getenv('MQTT_INGEST_MAX_BATCH', 256))
+MQTT_INGEST_CONCURRENCY = int(os.getenv('MQTT_INGEST_CONCURRENCY', 16))
+# Stream writes are pipelined once this many are buffered or the oldest is
+# MQTT_INGEST_FLUSH_MS old; a failed flush is retried this many times
+MQTT_INGEST_FLUSH_ENTRIES = int(os.getenv('MQTT_INGEST_FLUSH_ENTRIES', 50))
+MQTT_INGEST_FLUSH_MS = float(os.getenv('MQTT_INGEST_FLUSH_MS', 20))
+MQTT_INGEST_WRITE_RETRIES = int(os.getenv('MQTT_INGEST_WRITE_RETRIES', 3))
+# Patients whose raw/ (continuous 125 Hz) signal is segmented into beats per ingest process
+ECG_SEGMENTER_MAX_STREAMS = int(os.getenv('ECG_SEGMENTER_MAX_STREAMS', 4096))
+# Server-side inference (manage.py run_inference): takes over once no edge
+# worker heartbeat is newer than INFERENCE_EDGE_TIMEOUT seconds, and classifies
+# up to INFERENCE_MAX_BATCH stream entries per session per model call
+INFERENCE_MODEL_PATH = Path(os.getenv('INFERENCE_MODEL_PATH', DEVICES_DIR / 'jetson' / 'models' / '1dcnn.tflite'))
+INFERENCE_EDGE_TIMEOUT = float(os.getenv('INFERENCE_EDGE_TIMEOUT', 30))
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 256))
+INFERENCE_BLOCK_MS = int(os.getenv('INFERENCE_BLOCK_MS', 100))
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', os.cpu_count() or 1))
+# Login tokens (ecg.auth): lifetime in seconds, and whether REST and WebSocket
+# clients must present one (off keeps token-less clients working)
+ECG_TOKEN_TTL = int(os.getenv('ECG_TOKEN_TTL', 12 * 3600))
+ECG_AUTH_REQUIRED = os.getenv('ECG_AUTH_REQUIRED', 'false').lower() == 'true'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_AUTHENTICATION_CLASSES': ['ecg.auth.ECGTokenAuthentication'],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated' if ECG_AUTH_REQUIRED
+        else 'rest_framework.permissions.AllowAny'
+    ],
     "EXCEPTION_HANDLER": "server.exceptions.custom_exception_handler",
 }